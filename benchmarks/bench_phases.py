@@ -0,0 +1,42 @@
+__author__ = 'Hans Kristian Lunda, Mikko Rekstad'
+__email__ = 'hans.kristian.lunda@nmbu.no, mikkreks@nmbu.no'
+
+"""
+Benchmarks of the phases of the yearly cycle. Each round starts from the
+same animals, fodder and random state, see Scenario. A warm-up round is
+run first, so the numba kernels are compiled before they are timed.
+"""
+
+from conftest import Scenario, skip_object_model
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+ROUNDS = 5
+
+
+def bench_feeding_and_procreation(benchmark, scenario):
+    benchmark.pedantic(scenario.map.feeding_and_procreation,
+                       setup=scenario.reset, rounds=ROUNDS, warmup_rounds=1)
+
+
+def bench_migration(benchmark, scenario):
+    benchmark.pedantic(scenario.map.migration, setup=scenario.reset,
+                       rounds=ROUNDS, warmup_rounds=1)
+
+
+def bench_ageing_weight_loss_and_death(benchmark, scenario):
+    benchmark.pedantic(scenario.map.ageing_weight_loss_and_death,
+                       setup=scenario.reset, rounds=ROUNDS, warmup_rounds=1)
+
+
+def bench_feed_carnivores(benchmark, n_animals):
+    """
+    Hunting in a single jungle cell holding every animal, on the object
+    model, where Cell.feed_carnivores is used.
+    """
+    skip_object_model('OOO\nOJO\nOOO', n_animals, columnar=False)
+    scenario = Scenario('OOO\nOJO\nOOO', n_animals, columnar=False)
+    cell = scenario.map.cell_map[1][1]
+    benchmark.pedantic(cell.feed_carnivores, setup=scenario.reset,
+                       rounds=ROUNDS, warmup_rounds=1)
@@ -0,0 +1,25 @@
+__author__ = 'Hans Kristian Lunda, Mikko Rekstad'
+__email__ = 'hans.kristian.lunda@nmbu.no, mikkreks@nmbu.no'
+
+"""
+Benchmarks of whole simulated years with BioSim, headless. The rounds are
+consecutive years of one simulation, which is the same for every run since
+the seed is fixed.
+"""
+
+from biosim.simulation import BioSim
+from conftest import SEED, animal_arrays, island_map, skip_object_model
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+ROUNDS = 5
+
+
+def bench_simulate_year(benchmark, map_name, n_animals, columnar):
+    map_string = island_map(map_name)
+    skip_object_model(map_string, n_animals, columnar)
+    sim = BioSim(map_string, [], SEED, columnar=columnar, headless=True)
+    sim.map.add_animal_arrays(animal_arrays(sim.map, n_animals))
+    benchmark.pedantic(sim.simulate, args=(1,), rounds=ROUNDS,
+                       warmup_rounds=1)
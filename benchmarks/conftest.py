@@ -0,0 +1,160 @@
+__author__ = 'Hans Kristian Lunda, Mikko Rekstad'
+__email__ = 'hans.kristian.lunda@nmbu.no, mikkreks@nmbu.no'
+
+"""
+Benchmarks of the yearly phases and of whole simulated years, run with
+pytest-benchmark from the top of the repository:
+
+    tox -e bench
+
+which runs pytest benchmarks --benchmark-autosave --benchmark-sort=fullname.
+Every run is then saved under .benchmarks, named after the commit. A later
+run is compared with the last saved one, and fails on a regression, with
+
+    tox -e bench -- --benchmark-compare --benchmark-compare-fail=mean:10%
+
+The cases cover Rossumøya and synthetic maps of 10 x 10 and 100 x 100
+cells, with 100 and 10 000 animals, on both the object model and the
+columnar store. --full-scale adds 1000 x 1000 maps and 1 000 000 animals,
+which only the columnar store runs.
+"""
+
+from biosim.map import Map
+from biosim.population import HERBIVORE, CARNIVORE
+import numpy as np
+import pytest
+import textwrap
+
+ROSSUMOYA = textwrap.dedent("""\
+    OOOOOOOOOOOOOOOOOOOOO
+    OOOOOOOOSMMMMJJJJJJJO
+    OSSSSSJJJJMMJJJJJJJOO
+    OSSSSSSSSSMMJJJJJJOOO
+    OSSSSSJJJJJJJJJJJJOOO
+    OSSSSSJJJDDJJJSJJJOOO
+    OSSJJJJJDDDJJJSSSSOOO
+    OOSSSSJJJDDJJJSOOOOOO
+    OSSSJJJJJDDJJJJJJJOOO
+    OSSSSJJJJDDJJJJOOOOOO
+    OOSSSSJJJJJJJJOOOOOOO
+    OOOSSSSJJJJJJJOOOOOOO
+    OOOOOOOOOOOOOOOOOOOOO""")
+
+# Largest number of animals and cells run on the object model.
+OBJECT_MODEL_ANIMALS = 10000
+OBJECT_MODEL_CELLS = 100 * 100
+
+SEED = 2020
+
+
+def synthetic_map(size):
+    """
+    Returns a size x size island of jungle with stripes of savannah and
+    desert, surrounded by ocean.
+    :param size: int
+    :return: str
+    """
+    landscapes = 'JJJSSD'
+    inner = [''.join(landscapes[(row + col) % len(landscapes)]
+                     for col in range(size - 2)) for row in range(size - 2)]
+    return '\n'.join(['O' * size] + ['O' + line + 'O' for line in inner]
+                     + ['O' * size])
+
+
+def island_map(map_name):
+    """
+    Returns the map string of a benchmark map, 'rossumoya' or 'NxN'.
+    :param map_name: str
+    :return: str
+    """
+    if map_name == 'rossumoya':
+        return ROSSUMOYA
+    return synthetic_map(int(map_name.split('x')[0]))
+
+
+def animal_arrays(island, n_animals):
+    """
+    Returns n_animals animals spread evenly over the land cells of the
+    island, one carnivore for every four herbivores, in the form taken by
+    Map.add_animal_arrays.
+    :param island: Map
+    :param n_animals: int
+    :return: dict
+    """
+    rng = np.random.default_rng(SEED)
+    land = np.flatnonzero(island.map_matrix.ravel() >= 2)
+    number = np.arange(n_animals)
+    return {'species': np.where(number % 5 == 0, CARNIVORE,
+                                HERBIVORE).astype(np.int8),
+            'age': rng.integers(0, 15, n_animals),
+            'weight': rng.normal(30, 8, n_animals).clip(5),
+            'cell': land[number % len(land)],
+            'have_mated': np.zeros(n_animals, dtype=bool)}
+
+
+class Scenario:
+    """
+    A map with a population that can be put back to its first state, so
+    every round of a benchmark of a phase starts from the same animals and
+    fodder.
+    """
+    def __init__(self, map_string, n_animals, columnar):
+        """
+        :param map_string: str
+        :param n_animals: int
+        :param columnar: bool
+        """
+        self.map = Map(map_string, columnar=columnar,
+                       rng=np.random.default_rng(SEED))
+        self.arrays = animal_arrays(self.map, n_animals)
+        self.fodder = self.map.fodder.copy()
+        self.reset()
+
+    def reset(self):
+        """ Puts back the first animals, fodder and random state. """
+        if self.map.population is not None:
+            self.map.population.keep(
+                np.zeros(len(self.map.population), dtype=bool))
+        else:
+            for cell in self.map.active_cells():
+                cell.population_herbivores = []
+                cell.population_carnivores = []
+                cell.update_counts()
+        self.map.fodder[:] = self.fodder
+        self.map.rng.bit_generator.state = np.random.default_rng(
+            SEED).bit_generator.state
+        self.map.add_animal_arrays(self.arrays)
+
+
+def pytest_addoption(parser):
+    parser.addoption('--full-scale', action='store_true',
+                     help='also benchmark 1000 x 1000 maps and 1 000 000 '
+                          'animals')
+
+
+def pytest_generate_tests(metafunc):
+    full_scale = metafunc.config.getoption('full_scale', default=False)
+    if 'map_name' in metafunc.fixturenames:
+        metafunc.parametrize('map_name', ['rossumoya', '10x10', '100x100']
+                             + (['1000x1000'] if full_scale else []))
+    if 'n_animals' in metafunc.fixturenames:
+        metafunc.parametrize('n_animals', [100, 10000]
+                             + ([1000000] if full_scale else []))
+    if 'columnar' in metafunc.fixturenames:
+        metafunc.parametrize('columnar', [False, True],
+                             ids=['objects', 'columnar'])
+
+
+def skip_object_model(map_string, n_animals, columnar):
+    """ Skips cases too large for the object model. """
+    n_cells = len(map_string.split()) * len(map_string.split()[0])
+    if not columnar and (n_animals > OBJECT_MODEL_ANIMALS
+                         or n_cells > OBJECT_MODEL_CELLS):
+        pytest.skip('too large for the object model')
+
+
+@pytest.fixture
+def scenario(map_name, n_animals, columnar):
+    map_string = island_map(map_name)
+    skip_object_model(map_string, n_animals, columnar)
+    return Scenario(map_string, n_animals, columnar)
@@ -3,7 +3,8 @@
 __author__ = 'Hans Kristian Lunda, Mikko Rekstad'
 __email__ = 'hans.kristian.lunda@nmbu.no, mikkreks@nmbu.no'
 
-from biosim.fauna import Herbivore, Carnivore
+from biosim.fauna import Fauna, Herbivore, Carnivore, FallbackRng
+from biosim.kernels import share_fodder, hunt, dies, births
 import numpy as np
 
 
@@ -13,10 +14,16 @@ class Cell:
     information out of this cell, and methods for adding fodder to jungle and
     savannah cells.
     """
+    # Default parameters, indexed by landscape code.
+    f_max = [0.0, 0.0, 0.0, 300.0, 800.0]
+    alpha = [None, None, None, 0.3, None]
+    # Fallback generator, Map gives every cell the random generator of the
+    # simulation.
+    rng = FallbackRng()
 
     def __init__(self, coordinates=None, landscape=None, fodder=0):
-        self.f_max = [0.0, 0.0, 0.0, 300.0, 800.0]
-        self.alpha = [None, None, None, 0.3, None]
+        # Set by Map, the fodder then lives in the fodder grid of the map.
+        self.fodder_grid = None
         self.coordinates = coordinates
         self.landscape = landscape
         self.fodder = fodder
@@ -25,10 +32,24 @@ class Cell:
         self.population_herbivores = []
         self.population_carnivores = []
 
+        # Set by Map when the creatures live in a columnar Population store.
+        self.store = None
+        self.index = None
+        # Set by Map, marks the cells that hold creatures and keeps the
+        # number of creatures per species in each cell and on the island.
+        self.active_grid = None
+        self.count_grid = None
+        self.total_counts = None
+        # Set by Map, (2 x n_cells x 4) move probabilities per species.
+        self.probability_grid = None
+        # Replaced by Map with the species classes that hold the parameters
+        # of the simulation.
+        self.animal_classes = (Herbivore, Carnivore)
+
         # self.gamma_herbivore = 0.2
         self.adjacent_cells = []
-        self.probability_herbivores = [0, 0, 0, 0]
-        self.probability_carnivores = [0, 0, 0, 0]
+        self._probability_herbivores = [0, 0, 0, 0]
+        self._probability_carnivores = [0, 0, 0, 0]
 
         self.adjacent_cells_herbivore_attractiveness = []
         self.adjacent_cells_carnivore_attractiveness = []
@@ -36,12 +57,66 @@ class Cell:
 
     def number_herbivores(self):
         """ Returns the number of herbivores as an int"""
+        if self.store is not None:
+            return self.store.number_herbivores(self.index)
         return len(self.population_herbivores)
 
     def number_carnivores(self):
         """ Returns the number of carnivores as an int"""
+        if self.store is not None:
+            return self.store.number_carnivores(self.index)
         return len(self.population_carnivores)
 
+    @property
+    def fodder(self):
+        """
+        Amount of fodder in the cell, read from the fodder grid of the map
+        if the cell belongs to one.
+        :return: float
+        """
+        if self.fodder_grid is not None:
+            return self.fodder_grid[self.index]
+        return self._fodder
+
+    @fodder.setter
+    def fodder(self, value):
+        if self.fodder_grid is not None:
+            self.fodder_grid[self.index] = value
+        else:
+            self._fodder = value
+
+    @property
+    def probability_herbivores(self):
+        """
+        Probabilities of a herbivore moving south, east, north and west,
+        read from the probability grid of the map if the cell belongs to
+        one.
+        :return: list
+        """
+        if self.probability_grid is not None:
+            return self.probability_grid[0, self.index].tolist()
+        return self._probability_herbivores
+
+    @probability_herbivores.setter
+    def probability_herbivores(self, value):
+        self._probability_herbivores = value
+
+    @property
+    def probability_carnivores(self):
+        """
+        Probabilities of a carnivore moving south, east, north and west,
+        read from the probability grid of the map if the cell belongs to
+        one.
+        :return: list
+        """
+        if self.probability_grid is not None:
+            return self.probability_grid[1, self.index].tolist()
+        return self._probability_carnivores
+
+    @probability_carnivores.setter
+    def probability_carnivores(self, value):
+        self._probability_carnivores = value
+
     def get_fodder(self):
         """
         Amount of fodder in the cell
@@ -75,41 +150,61 @@ class Cell:
             species = creature.get('species')
             weight = creature.get('weight')
             age = creature.get('age')
+            herbivore, carnivore = self.animal_classes
             if species.lower() == 'herbivore':
-                self.population_herbivores.append(Herbivore(weight=weight,
+                self.population_herbivores.append(herbivore(weight=weight,
                                                             age=age))
             else:
-                self.population_carnivores.append(Carnivore(weight=weight,
+                self.population_carnivores.append(carnivore(weight=weight,
                                                             age=age))
+        self.update_counts()
+
+    def update_counts(self):
+        """
+        Writes the number of herbivores and carnivores of the cell to the
+        count grid of the map, adjusts the island totals by the change, and
+        marks the cell as active if it holds any creatures. Called whenever
+        creatures are born, die, are eaten or move.
+        :return:
+        """
+        if self.count_grid is None:
+            return
+        herbivores = len(self.population_herbivores)
+        carnivores = len(self.population_carnivores)
+        counts = self.count_grid[:, self.index]
+        self.total_counts[0] += herbivores - counts[0]
+        self.total_counts[1] += carnivores - counts[1]
+        counts[:] = herbivores, carnivores
+        self.active_grid[self.index] = herbivores + carnivores > 0
 
     def alter_population(self):
         """
-        Runs through the population of both species. Uses while-loops to avoid
-        iteration errors when creatures are removed. They are removed if the
-        probability is higher than the chances for them to live.
+        Removes the creatures that die this year from both species. The
+        survival chance of the whole cell is computed as an array, one
+        uniform number is drawn per creature in a single call, and the
+        survivors are kept with one list comprehension per species.
         :return:
         """
-        index = 0
-        number_of_herbivores = len(self.population_herbivores)
-        while index < number_of_herbivores:
-            self.population_herbivores[index].state = \
-                self.population_herbivores[index].death()
-            if self.population_herbivores[index].state:
-                self.population_herbivores.pop(index)
-                number_of_herbivores -= 1
-                index -= 1
-            index += 1
-
-        index2 = 0
-        number_of_carnivores = len(self.population_carnivores)
-        while index2 < number_of_carnivores:
-            self.population_carnivores[index2].state = \
-                self.population_carnivores[index2].death()
-            if self.population_carnivores[index2].state:
-                self.population_carnivores.pop(index2)
-                number_of_carnivores -= 1
-                index2 -= 1
-            index2 += 1
+        self.population_herbivores = self.survivors(
+            self.population_herbivores)
+        self.population_carnivores = self.survivors(
+            self.population_carnivores)
+        self.update_counts()
+
+    def survivors(self, population):
+        """
+        Returns the creatures in a species list that survive this year.
+        :param population: list
+        :return: list
+        """
+        if len(population) == 0:
+            return population
+        Fauna.batch_fitness(population)
+        dead = dies(np.array([creature.fitness for creature in population]),
+                    np.array([creature.omega for creature in population]),
+                    self.rng.random(len(population)))
+        return [creature for creature, is_dead
+                in zip(population, dead.tolist()) if not is_dead]
 
     def feed_herbivores(self, creature):
         """
@@ -127,31 +222,58 @@ class Cell:
             self.fodder = 0
         creature.weight += creature.beta * fodder
 
+    def feed_all_herbivores(self):
+        """
+        Feeds every herbivore in the cell. The herbivores are ranked once,
+        fittest first, and each gets F or whatever fodder is left when its
+        turn comes.
+        :return:
+        """
+        if len(self.population_herbivores) == 0 or self.fodder <= 0:
+            return
+        self.update_fitness()
+        self.ranked_fitness_herbivores()
+        eaten = share_fodder(self.fodder, [creature.F for creature
+                                           in self.population_herbivores])
+        self.fodder = max(0.0, self.fodder - eaten.sum())
+        for creature, amount in zip(self.population_herbivores,
+                                    eaten.tolist()):
+            if amount > 0:
+                creature.weight += creature.beta * amount
+
     def feed_carnivores(self):
         """
         This function will feed the carnivores, where each carnivore will
         feast on the herbivores based on both carnivore and herbivore fitness.
+        The carnivores hunt fittest first and try the herbivores from least
+        fit to fittest. Killed herbivores are marked during the hunt and
+        removed from the cell once at the end.
         :return:
         """
+        if len(self.population_carnivores) == 0 \
+                or len(self.population_herbivores) == 0:
+            return
+        self.update_fitness()
         self.ranked_fitness_herbivores_weakest()
         self.ranked_fitness_carnivores()
-        for carnivore in self.population_carnivores:
-            herbivore_eaten = 0
-
-            for herbivore in self.population_herbivores:
-                if herbivore_eaten >= 50:
-                    break
-
-                probability_of_successful_hunt = \
-                    self.successful_hunt(carnivore, herbivore)
-                if probability_of_successful_hunt == 0:
-                    continue
-
-                kill_probability = np.random.random()
-                if kill_probability < probability_of_successful_hunt:
-                    herbivore_eaten += \
-                        carnivore.eat(herbivore.weight, herbivore_eaten)
-                    self.population_herbivores.remove(herbivore)
+        first_carnivore = self.population_carnivores[0]
+        eaten, killed = hunt(
+            np.array([carnivore.fitness for carnivore
+                      in self.population_carnivores]),
+            np.array([herbivore.fitness for herbivore
+                      in self.population_herbivores]),
+            np.array([herbivore.weight for herbivore
+                      in self.population_herbivores]),
+            first_carnivore.F, first_carnivore.DeltaPhiMax, self.rng)
+        for carnivore, amount in zip(self.population_carnivores,
+                                     eaten.tolist()):
+            if amount > 0:
+                carnivore.weight += carnivore.beta * amount
+        self.population_herbivores = [
+            herbivore for herbivore, is_killed
+            in zip(self.population_herbivores, killed.tolist())
+            if not is_killed]
+        self.update_counts()
 
     @staticmethod
     def successful_hunt(carnivore, herbivore):
@@ -170,18 +292,51 @@ class Cell:
 
     def mating_season(self):
         """
-        This function calls birth for each herbivore and carnivore and
-        append a new object to the current herbivore/carnivore
-        population in this cell.
+        This function lets each herbivore and carnivore give birth and
+        adds the newborns to the current herbivore/carnivore population in
+        this cell.
         """
-        for herbivore in self.population_herbivores:
-            new_creature = (herbivore.birth(self.number_herbivores()))
-            if new_creature is not None:
-                self.population_herbivores.append(new_creature)
-        for carnivore in self.population_carnivores:
-            new_creature = (carnivore.birth(self.number_carnivores()))
-            if new_creature is not None:
-                self.population_carnivores.append(new_creature)
+        self.procreate(self.population_herbivores)
+        self.procreate(self.population_carnivores)
+        self.update_counts()
+
+    def procreate(self, population):
+        """
+        Decides the births of one species list in one batch. The birth
+        probabilities come from the number of creatures in the list and
+        their fitness, birth events and weights are only drawn for eligible
+        parents, and all newborns are appended to the list at once.
+        :param population: list
+        :return:
+        """
+        if len(population) < 2:
+            return
+        Fauna.batch_fitness(population)
+        first = population[0]
+        mothers, birth_weights = births(
+            np.array([creature.fitness for creature in population]),
+            np.array([creature.weight for creature in population]),
+            np.array([creature.age for creature in population]),
+            np.array([creature.have_mated for creature in population]),
+            len(population), first.gamma, first.zeta, first.w_birth,
+            first.sigma_birth, self.rng)
+        newborns = []
+        for mother, birth_weight in zip(mothers.tolist(),
+                                        birth_weights.tolist()):
+            creature = population[mother]
+            creature.weight -= creature.xi * birth_weight
+            creature.have_mated = True
+            newborns.append(creature.__class__(weight=birth_weight, age=0))
+        population.extend(newborns)
+
+    def update_fitness(self):
+        """
+        Recomputes the out of date fitness of all creatures in this cell in
+        one vectorized call.
+        :return:
+        """
+        Fauna.batch_fitness(self.population_herbivores
+                            + self.population_carnivores)
 
     def ranked_fitness_herbivores(self):
         """ Ranks herbivores in this cell from fittest to least fit."""
@@ -224,9 +379,10 @@ class Cell:
         Increases the age for all the creatures in the population list.
         :return:
         """
-        [herbivore.age+1 for herbivore in self.population_herbivores]
-        [carnivore.age + 1 for carnivore in self.population_carnivores]
-
+        for herbivore in self.population_herbivores:
+            herbivore.age += 1
+        for carnivore in self.population_carnivores:
+            carnivore.age += 1
 
     def lose_weight(self):
         """
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Hans Kristian Lunda, Mikko Rekstad'
+__email__ = 'hans.kristian.lunda@nmbu.no, mikkreks@nmbu.no'
+
+"""
+Compiled kernels for the yearly phases of the columnar Population store.
+They are written as plain loops over flat arrays and compiled in nopython
+mode by numba, so a whole phase runs for every cell of the island in one
+call. Random numbers are drawn from the numpy.random.Generator of the
+simulation, which numba can use directly.
+
+numba is optional. If it is not installed, AVAILABLE is False and the
+Population store uses the NumPy kernels in biosim.kernels instead.
+"""
+
+import numpy as np
+
+try:
+    from numba import njit
+    AVAILABLE = True
+except ImportError:
+    AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        def decorator(function):
+            return function
+        return decorator
+
+
+@njit(cache=True)
+def feed_herbivores(order, cell, fodder, weight, appetite, beta):
+    """
+    Feeds herbivores that are sorted by cell, fittest first. Each herbivore
+    eats its appetite or whatever is left in its cell.
+    :param order: np.array, row of each herbivore in eating order
+    :param cell: np.array, flat cell index of every creature
+    :param fodder: np.array, fodder per cell, altered in place
+    :param weight: np.array, weight of every creature, altered in place
+    :param appetite: float
+    :param beta: float
+    :return:
+    """
+    for row in order:
+        eaten = min(appetite, fodder[cell[row]])
+        fodder[cell[row]] -= eaten
+        weight[row] += beta * eaten
+
+
+@njit(cache=True)
+def hunt_cells(carnivores, herbivores, carnivore_bounds, herbivore_bounds,
+               fitness, weight, appetite, delta_phi_max, beta, rng):
+    """
+    Lets the carnivores of every cell hunt. Within a cell the carnivores
+    are sorted fittest first and the herbivores least fit first. A
+    carnivore stops when it has eaten its appetite or reaches a herbivore
+    that is at least as fit as itself. Eaten weight is added to the
+    carnivores in place.
+    :param carnivores: np.array, rows of the carnivores in hunting order
+    :param herbivores: np.array, rows of the herbivores in order of fitness
+    :param carnivore_bounds: np.array (cells x 2), start and end in
+                             carnivores of each cell with both species
+    :param herbivore_bounds: np.array (cells x 2), start and end in
+                             herbivores of the same cells
+    :param fitness: np.array
+    :param weight: np.array
+    :param appetite: float
+    :param delta_phi_max: float
+    :param beta: float
+    :param rng: numpy.random.Generator
+    :return: np.array of booleans, False for the killed herbivores
+    """
+    alive = np.ones(len(fitness), dtype=np.bool_)
+    for i in range(len(carnivore_bounds)):
+        first_prey = herbivore_bounds[i, 0]
+        last_prey = herbivore_bounds[i, 1]
+        for hunter in carnivores[carnivore_bounds[i, 0]:
+                                 carnivore_bounds[i, 1]]:
+            eaten = 0.0
+            for prey in herbivores[first_prey:last_prey]:
+                if fitness[prey] >= fitness[hunter]:
+                    break
+                if not alive[prey]:
+                    continue
+                probability = min(
+                    (fitness[hunter] - fitness[prey]) / delta_phi_max, 1.0)
+                if rng.random() < probability:
+                    alive[prey] = False
+                    eaten += weight[prey]
+                    if eaten >= appetite:
+                        break
+            weight[hunter] += beta * min(eaten, appetite)
+    return alive
+
+
+@njit(cache=True)
+def births(fitness, weight, age, have_mated, number, gamma, zeta, w_birth,
+           sigma_birth, rng):
+    """
+    Decides which creatures of one species give birth this year, with the
+    same rules as biosim.kernels.births.
+    :param fitness: np.array
+    :param weight: np.array
+    :param age: np.array
+    :param have_mated: np.array of booleans
+    :param number: np.array, number of creatures of the same species in the
+                   cell of each creature
+    :param gamma: float
+    :param zeta: float
+    :param w_birth: float
+    :param sigma_birth: float
+    :param rng: numpy.random.Generator
+    :return: (np.array with the indices of the mothers,
+              np.array with the birth weights)
+    """
+    mothers = np.empty(len(fitness), dtype=np.int64)
+    birth_weight = np.empty(len(fitness))
+    n_births = 0
+    heavy_enough = zeta * (w_birth + sigma_birth)
+    for i in range(len(fitness)):
+        if have_mated[i] or age[i] <= 0 or weight[i] <= heavy_enough:
+            continue
+        probability = min(1.0, gamma * fitness[i] * (number[i] - 1))
+        if rng.random() < probability:
+            newborn_weight = rng.normal(w_birth, sigma_birth)
+            if newborn_weight > 0:
+                mothers[n_births] = i
+                birth_weight[n_births] = newborn_weight
+                n_births += 1
+    return mothers[:n_births], birth_weight[:n_births]
+
+
+@njit(cache=True)
+def migrate(cell, species, fitness, mu, probabilities, neighbours, rng):
+    """
+    Draws the new cell of every creature. A creature migrates with
+    probability mu * fitness, to one of the four neighbours with the
+    probabilities of its species and cell. All creatures move at the same
+    time, since the destinations are written to a new array.
+    :param cell: np.array, flat cell index of every creature
+    :param species: np.array, species code of every creature
+    :param fitness: np.array
+    :param mu: np.array, mu per species code
+    :param probabilities: np.array (2 x n_cells x 4), move probabilities per
+                          species code
+    :param neighbours: np.array (n_cells x 4), neighbour table of the map
+    :param rng: numpy.random.Generator
+    :return: np.array with the new cell of every creature
+    """
+    new_cell = cell.copy()
+    for i in range(len(cell)):
+        if mu[species[i]] * fitness[i] <= rng.random():
+            continue
+        draw = rng.random()
+        cumulative = 0.0
+        for direction in range(4):
+            cumulative += probabilities[species[i], cell[i], direction]
+            if draw < cumulative:
+                new_cell[i] = neighbours[cell[i], direction]
+                break
+    return new_cell
+
+
+@njit(cache=True)
+def dies(fitness, omega, rng):
+    """
+    Decides which creatures die this year, with the same rules as
+    biosim.kernels.dies.
+    :param fitness: np.array
+    :param omega: np.array, omega of every creature
+    :param rng: numpy.random.Generator
+    :return: np.array of booleans, True for the creatures that die
+    """
+    dead = np.empty(len(fitness), dtype=np.bool_)
+    for i in range(len(fitness)):
+        dead[i] = (fitness[i] <= 0
+                   or rng.random() > 1 - omega[i] * (1 - fitness[i]))
+    return dead
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Hans Kristian Lunda, Mikko Rekstad'
+__email__ = 'hans.kristian.lunda@nmbu.no, mikkreks@nmbu.no'
+
+from biosim.simulation import BioSim
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+
+def simulate_replicate(island_map, ini_pop, seed, num_years,
+                       animal_parameters=None, landscape_parameters=None,
+                       columnar=True):
+    """
+    Runs one headless simulation and returns the number of animals of each
+    species after every year. Runs in a worker process, so only the small
+    count array is sent back.
+    :param island_map: str
+    :param ini_pop: list of dictionaries
+    :param seed: int or np.random.SeedSequence
+    :param num_years: int
+    :param animal_parameters: dict, species name to parameter dictionary
+    :param landscape_parameters: dict, landscape letter to parameter
+                                 dictionary
+    :param columnar: bool
+    :return: np.array (num_years x 2), herbivores and carnivores
+    """
+    counts = np.zeros((num_years, 2), dtype=np.int64)
+
+    def record(year, herbivores, carnivores):
+        counts[year - 1] = herbivores, carnivores
+
+    sim = BioSim(island_map, ini_pop, seed, columnar=columnar,
+                 headless=True, progress=record)
+    for species, params in (animal_parameters or {}).items():
+        sim.set_animal_parameters(species, params)
+    for landscape, params in (landscape_parameters or {}).items():
+        sim.set_landscape_parameters(landscape, params)
+    sim.simulate(num_years)
+    return counts
+
+
+class Ensemble:
+    """
+    Runs replicates of the same simulation with independent random streams,
+    spread over a pool of worker processes. The seed is turned into a
+    numpy.random.SeedSequence and every replicate gets one of its spawned
+    children, so the replicates are statistically independent and the
+    whole ensemble is reproducible from one seed.
+    """
+    def __init__(self, island_map, ini_pop, seed, n_replicates,
+                 animal_parameters=None, landscape_parameters=None,
+                 columnar=True):
+        """
+        :param island_map: Multi-line string specifying island geography
+        :param ini_pop: List of dictionaries specifying initial population
+        :param seed: Integer used as seed for the whole ensemble
+        :param n_replicates: Integer, number of simulations
+        :param animal_parameters: Dict mapping species names to parameter
+               dicts, set in every replicate
+        :param landscape_parameters: Dict mapping landscape letters to
+               parameter dicts, set in every replicate
+        :param columnar: Boolean, runs the replicates on the columnar
+               Population store
+        """
+        self.island_map = island_map
+        self.ini_pop = ini_pop
+        self.n_replicates = n_replicates
+        self.animal_parameters = animal_parameters
+        self.landscape_parameters = landscape_parameters
+        self.columnar = columnar
+        self.seeds = np.random.SeedSequence(seed).spawn(n_replicates)
+
+    def run(self, num_years, max_workers=None):
+        """
+        Simulates every replicate for num_years years.
+        :param num_years: Integer, number of years to simulate
+        :param max_workers: Integer, number of worker processes, by default
+               one per core
+        :return: np.array (n_replicates x num_years x 2) with the number of
+                 herbivores and carnivores after each year
+        """
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(
+                simulate_replicate,
+                [self.island_map] * self.n_replicates,
+                [self.ini_pop] * self.n_replicates, self.seeds,
+                [num_years] * self.n_replicates,
+                [self.animal_parameters] * self.n_replicates,
+                [self.landscape_parameters] * self.n_replicates,
+                [self.columnar] * self.n_replicates)
+            return np.stack(list(results))
@@ -3,37 +3,93 @@
 __author__ = 'Hans Kristian Lunda, Mikko Rekstad'
 __email__ = 'hans.kristian.lunda@nmbu.no, mikkreks@nmbu.no'
 
+import copyreg
 import numpy as np
 from math import exp
 
 
+# The generator returned by fallback_rng, made when it is first needed.
+_fallback_rng = None
+
+
+def fallback_rng():
+    """
+    Returns the generator for code that is not given the generator of a
+    simulation. It is made once, the first time it is needed, and seeded
+    from the global NumPy random state, so calling np.random.seed before
+    that makes such code reproducible.
+    :return: numpy.random.Generator
+    """
+    global _fallback_rng
+    if _fallback_rng is None:
+        _fallback_rng = np.random.default_rng(
+            np.random.randint(2 ** 32, dtype=np.uint64))
+    return _fallback_rng
+
+
+class _OwnParameters(type):
+    """
+    Type of the species classes made by Fauna.with_own_parameters. Such a
+    class is made at run time and can not be found by name, so it is
+    pickled as the species it copies and its parameters. This lets maps,
+    cells and creatures using it be sent to other processes.
+    """
+
+
+def _species_with_parameters(species, params):
+    """
+    Makes a copy of the species with the given parameters, when a class
+    made by Fauna.with_own_parameters is unpickled.
+    :param species: class
+    :param params: dict, parameter name to value
+    :return: class
+    """
+    copy = species.with_own_parameters()
+    copy.set_parameters(params)
+    return copy
+
+
+def _reduce_own_parameters(cls):
+    species = cls.__bases__[0]
+    return _species_with_parameters, (
+        species, {name: getattr(cls, name) for name in cls.parameter_names})
+
+
+copyreg.pickle(_OwnParameters, _reduce_own_parameters)
+
+
+class FallbackRng:
+    """
+    Class attribute that gives the fallback_rng when it is read, unless the
+    instance has been given a generator of its own.
+    """
+    def __get__(self, instance, owner):
+        return fallback_rng()
+
+
 class Fauna:
     """
     This class will include the common properties for all creatures on
     Rossumøya.
+
+    The parameters of a species are class attributes of its subclass. A
+    simulation works on its own copy made by with_own_parameters, so
+    changing the parameters of one simulation does not change those of
+    another simulation in the same process.
     """
-    w_birth = [8.0, 6.0]
-    sigma_birth = [1.5, 1.0]
-    beta = [0.9, 0.75]
-    eta = [0.05, 0.125]
-    a_half = [40.0, 60.0]
-    phi_age = [0.2, 0.4]
-    w_half = [10.0, 4.0]
-    phi_weight = [0.1, 0.4]
-    mu = [0.25, 0.4]
-    lambda1 = [1.0, 1.0]
-    gamma = [0.2, 0.8]
-    zeta = [3.5, 3.5]
-    xi = [1.2, 1.1]
-    omega = [0.4, 0.9]
-    F = [10.0, 50.0]
-    DeltaPhiMax = [None, 10.0]
-
-    def __init__(self, weight=0, age=0, seed=1):
+    parameter_names = ('w_birth', 'sigma_birth', 'beta', 'eta', 'a_half',
+                       'phi_age', 'w_half', 'phi_weight', 'mu', 'lambda1',
+                       'gamma', 'zeta', 'xi', 'omega', 'F', 'DeltaPhiMax')
+
+    # Fallback generator, used when no random numbers are passed in.
+    # Cell and Map pass numbers drawn from the generator of the simulation.
+    rng = FallbackRng()
+
+    def __init__(self, weight=0, age=0):
         """
         This function initializes the Fauna object.
         """
-        np.random.seed(seed=seed)
+        self._fitness = None
         self.age = age
         self.weight = weight
         self.state = False
@@ -41,49 +97,150 @@ class Fauna:
         self.have_migrated = False
         self.have_eaten = False
 
-    def birth(self, population):
+    @classmethod
+    def with_own_parameters(cls):
+        """
+        Returns a subclass of the species with a copy of its parameters as
+        class attributes, which can be changed without affecting the
+        species itself.
+        :return: class
+        """
+        return _OwnParameters(
+            cls.__name__, (cls,),
+            {name: getattr(cls, name) for name in cls.parameter_names})
+
+    @classmethod
+    def set_parameters(cls, params):
+        """
+        Sets parameters of the species.
+        :param params: dict, parameter name to value
+        :return:
+        """
+        for key, value in params.items():
+            setattr(cls, key, value)
+
+    def birth(self, population, random_number=None, birth_weight=None):
         """
         Will return a baby if the creature is supposed to give birth.
+        The random number and the birth weight may be drawn in advance, as
+        Cell.mating_season does for the whole cell.
         :param population: int
+        :param random_number: float
+        :param birth_weight: float
         :return:
         """
-        birth_weight = self.find_birth_weight(population)
+        birth_weight = self.find_birth_weight(population, random_number,
+                                              birth_weight)
         if birth_weight > 0 and not self.have_mated:
             self.weight -= self.xi * birth_weight
             self.have_mated = True
             return self.__class__(weight=birth_weight, age=0)
 
-    def find_birth_weight(self, population):
+    def find_birth_weight(self, population, random_number=None,
+                          birth_weight=None):
         """
         The function calculates the probability of giving birth,
         and the birth weight.
         :param population: int
+        :param random_number: float
+        :param birth_weight: float
         :return: float
         """
         birth_probability = min(1, self.gamma
                                 * self.fitness * (population - 1))
 
-        birth_weight = np.random.normal(self.w_birth, self.sigma_birth)
+        if birth_weight is None:
+            birth_weight = self.rng.normal(self.w_birth, self.sigma_birth)
+        if random_number is None:
+            random_number = self.rng.random()
 
         if self.weight > self.zeta * (self.w_birth + self.sigma_birth):
-            if birth_probability > np.random.rand() and self.age > 0:
+            if birth_probability > random_number and self.age > 0:
                 return birth_weight
         return 0
 
+    @property
+    def age(self):
+        """
+        The creatures age. Setting it clears the cached fitness.
+        :return: int
+        """
+        return self._age
+
+    @age.setter
+    def age(self, value):
+        self._age = value
+        self._fitness = None
+
+    @property
+    def weight(self):
+        """
+        The creatures weight. Setting it clears the cached fitness.
+        :return: float
+        """
+        return self._weight
+
+    @weight.setter
+    def weight(self, value):
+        self._weight = value
+        self._fitness = None
+
     @property
     def fitness(self):
         """
-        Returns the creatures fitness
+        Returns the creatures fitness. The value is cached and only
+        recomputed after the age or weight has changed.
         :return: float
         """
-        if self.weight <= 0:
-            return 0.0
-        else:
-            q_pos = 1.0 / (1.0 + exp(self.phi_age * (self.age - self.a_half)))
-            q_neg = 1.0 / (1.0 + exp(-self.phi_weight
-                                     * (self.weight - self.w_half)))
-            phi = q_pos * q_neg
-            return phi
+        if self._fitness is None:
+            if self.weight <= 0:
+                self._fitness = 0.0
+            else:
+                q_pos = 1.0 / (1.0 + exp(self.phi_age
+                                         * (self.age - self.a_half)))
+                q_neg = 1.0 / (1.0 + exp(-self.phi_weight
+                                         * (self.weight - self.w_half)))
+                self._fitness = q_pos * q_neg
+        return self._fitness
+
+    @staticmethod
+    def compute_fitness(age, weight, a_half, phi_age, w_half, phi_weight):
+        """
+        Vectorized fitness formula. All arguments are arrays (or scalars)
+        with one entry per creature, and both sigmoid factors are evaluated
+        in a single NumPy exp call.
+        :return: np.array
+        """
+        age = np.asarray(age, dtype=float)
+        weight = np.asarray(weight, dtype=float)
+        with np.errstate(over='ignore'):
+            exponentials = np.exp(np.stack(np.broadcast_arrays(
+                phi_age * (age - a_half), -phi_weight * (weight - w_half))))
+        phi = 1.0 / (1.0 + exponentials[0]) / (1.0 + exponentials[1])
+        return np.where(weight <= 0, 0.0, phi)
+
+    @staticmethod
+    def batch_fitness(creatures):
+        """
+        Computes the fitness of every creature in the list whose cached
+        fitness is out of date, in one vectorized call, and stores the
+        results in the creatures caches.
+        :param creatures: list
+        :return:
+        """
+        dirty = [creature for creature in creatures
+                 if creature._fitness is None]
+        if len(dirty) == 0:
+            return
+        fitness = Fauna.compute_fitness(
+            [creature.age for creature in dirty],
+            [creature.weight for creature in dirty],
+            np.array([creature.a_half for creature in dirty]),
+            np.array([creature.phi_age for creature in dirty]),
+            np.array([creature.w_half for creature in dirty]),
+            np.array([creature.phi_weight for creature in dirty]))
+        for creature, value in zip(dirty, fitness.tolist()):
+            creature._fitness = value
 
     def get_weight(self):
         """
@@ -111,13 +268,15 @@ class Fauna:
     def survival_chance(self):
         return 1 - (self.omega * (1 - self.fitness))
 
-    def death(self):
+    def death(self, death_number=None):
         """
         Returns True/False if the creature dies.
+        :param death_number: float, uniform random number
         :return: boolean
         """
         fitness = self.fitness
-        death_number = np.random.random()
+        if death_number is None:
+            death_number = self.rng.random()
         if fitness <= 0:
             return True
         else:
@@ -128,33 +287,39 @@ class Fauna:
             else:
                 return False
 
-    def wants_to_migrate(self):
+    def wants_to_migrate(self, random_number=None):
         """
         Returns True if the creature wants to migrate.
+        :param random_number: float, uniform random number
         :return: boolean
         """
-        return (self.mu * self.fitness) > np.random.random()
+        if random_number is None:
+            random_number = self.rng.random()
+        return (self.mu * self.fitness) > random_number
 
 
 class Herbivore(Fauna):
+    """
+    This class contains the parameters of the herbivores.
+    """
+    w_birth = 8.0
+    sigma_birth = 1.5
+    beta = 0.9
+    eta = 0.05
+    a_half = 40.0
+    phi_age = 0.2
+    w_half = 10.0
+    phi_weight = 0.1
+    mu = 0.25
+    lambda1 = 1.0
+    gamma = 0.2
+    zeta = 3.5
+    xi = 1.2
+    omega = 0.4
+    F = 10.0
+    DeltaPhiMax = None
 
     def __init__(self, weight, age=0):
-        self.w_birth = 8.0
-        self.sigma_birth = 1.5
-        self.beta = 0.9
-        self.eta = 0.05
-        self.a_half = 40.0
-        self.phi_age = 0.2
-        self.w_half = 10
-        self.phi_weight = 0.1
-        self.mu = 0.25
-        self.lambda1 = 1.0
-        self.gamma = 0.2
-        self.zeta = 3.5
-        self.xi = 1.2
-        self.omega = 0.4
-        self.F = 10.0
-        self.DeltaPhiMax = None
         super().__init__(weight, age)
 
 
@@ -162,23 +327,24 @@ class Carnivore(Fauna):
     """
     This class contains all methods which are related to the carnivore objects.
     """
+    w_birth = 6.0
+    sigma_birth = 1.0
+    beta = 0.75
+    eta = 0.125
+    a_half = 60.0
+    phi_age = 0.8
+    w_half = 4.0
+    phi_weight = 0.4
+    mu = 0.4
+    lambda1 = 1.0
+    gamma = 0.8
+    zeta = 3.5
+    xi = 1.1
+    omega = 0.9
+    F = 50.0
+    DeltaPhiMax = 10.0
+
     def __init__(self, weight, age=0):
-        self.w_birth = 6.0
-        self.sigma_birth = 1.0
-        self.beta = 0.75
-        self.eta = 0.125
-        self.a_half = 60.0
-        self.phi_age = 0.8
-        self.w_half = 4.0
-        self.phi_weight = 0.4
-        self.mu = 0.4
-        self.lambda1 = 1.0
-        self.gamma = 0.8
-        self.zeta = 3.5
-        self.xi = 1.1
-        self.omega = 0.9
-        self.F = 50.0
-        self.DeltaPhiMax = 10.0
         super().__init__(weight, age)
 
     def eat(self, fodder_amount=0, herbivore_already_eaten=0):
@@ -3,31 +3,193 @@ __email__ = 'hans.kristian.lunda@nmbu.no, mikkreks@nmbu.no'
 
 
 from tkinter import *
+from tkinter import messagebox, simpledialog
+from biosim.simulation import BioSim
+from biosim.worker import SimulationWorker
+import ast
+import queue
+
 
 class GUI:
+    """
+    Window for running a simulation interactively. The simulation runs on
+    a SimulationWorker thread, and the window shows the newest snapshot the
+    worker has posted, so the window stays responsive however fast or slow
+    the simulation is. Years simulated faster than they can be drawn are
+    skipped in the heatmaps, but kept in the population graph.
+    """
+    # Milliseconds between checks for a new snapshot.
+    poll_interval = 40
 
-    def __init__(self):
+    def __init__(self, sim):
+        """
+        :param sim: BioSim object, made with headless=True
+        """
+        # Imported here, so the Tk backend is only loaded for the GUI.
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from matplotlib.figure import Figure
+        from biosim.visualize import Visualize
 
-        root = Tk()
+        self.root = Tk()
+        self.root.title('BioSim')
+        self.root.protocol('WM_DELETE_WINDOW', self.close)
+        self.worker = SimulationWorker(sim)
+        self._pending_calls = []
 
-        label = Label(root, text='Simulation of Rossumøya')
+        label = Label(self.root, text='Simulation of Rossumøya')
         label.pack()
-        top_frame = Frame(root)
+        top_frame = Frame(self.root)
         top_frame.pack()
 
-        bottom_frame = Frame(root)
+        bottom_frame = Frame(self.root)
         bottom_frame.pack(side=BOTTOM)
 
-        button1 = Button(top_frame, text='Start simulation', fg='red')
-        button2 = Button(top_frame, text='Change parameters', fg='blue')
-        button3 = Button(top_frame, text='Add population', fg='green')
+        self.run_button = Button(top_frame, text='Start simulation',
+                                 fg='red', command=self.toggle_running)
+        step_button = Button(top_frame, text='Step', command=self.step)
+        button2 = Button(top_frame, text='Change parameters', fg='blue',
+                         command=self.change_parameters)
+        button3 = Button(top_frame, text='Add population', fg='green',
+                         command=self.add_population)
 
-        button1.pack(side=LEFT)
+        self.run_button.pack(side=LEFT)
+        step_button.pack(side=LEFT)
         button2.pack(side=LEFT)
         button3.pack(side=LEFT)
 
-        root.mainloop()
+        self.status = Label(bottom_frame, text='Year 0')
+        self.status.pack()
+
+        figure = Figure()
+        self.canvas = FigureCanvasTkAgg(figure, master=self.root)
+        self.canvas.get_tk_widget().pack(side=TOP, fill=BOTH, expand=True)
+        self.visualize = Visualize(sim.map, years=200, fig=figure)
+
+        self.root.after(self.poll_interval, self.poll)
+
+    def run(self):
+        """ Shows the window until it is closed. """
+        self.root.mainloop()
+
+    def toggle_running(self):
+        """ Starts, pauses or resumes the simulation. """
+        if self.worker.running:
+            self.worker.pause()
+            self.run_button.config(text='Resume simulation')
+        else:
+            self.worker.resume()
+            self.run_button.config(text='Pause simulation')
+
+    def step(self):
+        """ Simulates one year, if the simulation is paused. """
+        if not self.worker.running:
+            self.worker.step()
+
+    def change_parameters(self):
+        """
+        Asks for new parameters of a species or landscape, and sets them
+        between two years.
+        """
+        target = simpledialog.askstring(
+            'Change parameters', 'Herbivore, Carnivore, J or S:',
+            parent=self.root)
+        if not target:
+            return
+        params = self._ask_literal('Change parameters',
+                                   "Parameters, e.g. {'F': 20}:")
+        if params is None:
+            return
+        if target in {'J', 'S'}:
+            function = self.worker.sim.set_landscape_parameters
+        else:
+            function = self.worker.sim.set_animal_parameters
+        self._pending_calls.append(self.worker.call(function, target, params))
+
+    def add_population(self):
+        """
+        Asks for animals to add, in the form taken by BioSim.add_population,
+        and adds them between two years.
+        """
+        population = self._ask_literal(
+            'Add population', "Population, e.g. [{'loc': (10, 10), 'pop': "
+            "[{'species': 'Herbivore', 'age': 5, 'weight': 20}]}]:")
+        if population is not None:
+            self._pending_calls.append(
+                self.worker.call(self.worker.sim.add_population, population))
+
+    def _ask_literal(self, title, prompt):
+        """
+        Asks for a Python literal.
+        :return: the value, or None if cancelled or invalid
+        """
+        text = simpledialog.askstring(title, prompt, parent=self.root)
+        if not text:
+            return None
+        try:
+            return ast.literal_eval(text)
+        except (ValueError, SyntaxError) as err:
+            messagebox.showerror(title, str(err), parent=self.root)
+            return None
+
+    def poll(self):
+        """
+        Draws the newest snapshot, if any, and reports failed commands.
+        Runs on the Tk main loop every poll_interval milliseconds.
+        """
+        try:
+            snapshot = self.worker.snapshots.get_nowait()
+        except queue.Empty:
+            pass
+        else:
+            self.visualize.draw_snapshot(snapshot.years, snapshot.history,
+                                         snapshot.herbivores,
+                                         snapshot.carnivores)
+            self.status.config(
+                text='Year {}: {} herbivores, {} carnivores, {} frames '
+                     'skipped'.format(snapshot.year,
+                                      int(snapshot.herbivores.sum()),
+                                      int(snapshot.carnivores.sum()),
+                                      self.worker.skipped))
+        for future in [call for call in self._pending_calls if call.done()]:
+            self._pending_calls.remove(future)
+            if future.exception() is not None:
+                messagebox.showerror('BioSim', str(future.exception()),
+                                     parent=self.root)
+        if self.worker.error is not None:
+            messagebox.showerror('BioSim', str(self.worker.error),
+                                 parent=self.root)
+            self.worker.error = None
+            self.run_button.config(text='Resume simulation')
+        self.root.after(self.poll_interval, self.poll)
+
+    def close(self):
+        """ Stops the simulation and closes the window. """
+        self.worker.stop(timeout=1)
+        self.worker.sim.close()
+        self.root.destroy()
+
 
 if __name__ == '__main__':
 
-    test = GUI()
+    island = """\
+                OOOOOOOOOOOOOOOOOOOOO
+                OOOOOOOOSMMMMJJJJJJJO
+                OSSSSSJJJJMMJJJJJJJOO
+                OSSSSSSSSSMMJJJJJJOOO
+                OSSSSSJJJJJJJJJJJJOOO
+                OSSSSSJJJDDJJJSJJJOOO
+                OSSJJJJJDDDJJJSSSSOOO
+                OOSSSSJJJDDJJJSOOOOOO
+                OSSSJJJJJDDJJJJJJJOOO
+                OSSSSJJJJDDJJJJOOOOOO
+                OOSSSSJJJJJJJJOOOOOOO
+                OOOSSSSJJJJJJJOOOOOOO
+                OOOOOOOOOOOOOOOOOOOOO"""
+    ini_pop = [{'loc': (10, 10),
+                'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}
+                        for _ in range(150)]},
+               {'loc': (10, 10),
+                'pop': [{'species': 'Carnivore', 'age': 5, 'weight': 20}
+                        for _ in range(40)]}]
+    test = GUI(BioSim(island, ini_pop, seed=1, columnar=True, headless=True))
+    test.run()
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Hans Kristian Lunda, Mikko Rekstad'
+__email__ = 'hans.kristian.lunda@nmbu.no, mikkreks@nmbu.no'
+
+import numpy as np
+
+
+def decimate(years, values, n_bins):
+    """
+    Reduces a history to at most 2 * n_bins points for drawing. The years
+    are split into n_bins bins of equal size, and each bin is replaced by
+    its minimum and maximum, so peaks and dips are still seen when there
+    are more years than pixels.
+    :param years: np.array
+    :param values: np.array (years x columns)
+    :param n_bins: int, usually the width of the axis in pixels
+    :return: (np.array, np.array), years and values
+    """
+    n_bins = max(int(n_bins), 1)
+    if len(years) <= 2 * n_bins:
+        return years, values
+    starts = np.linspace(0, len(years), n_bins, endpoint=False).astype(int)
+    decimated = np.empty((2 * n_bins, values.shape[1]))
+    decimated[0::2] = np.minimum.reduceat(values, starts)
+    decimated[1::2] = np.maximum.reduceat(values, starts)
+    return np.repeat(years[starts], 2), decimated
+
+
+class History:
+    """
+    History of the yearly totals shown in the stats graph, one row of
+    values per year. The rows are kept in NumPy buffers that double in size
+    when they are full, so adding a year takes amortized constant time and
+    no limit on the number of years is needed.
+    """
+    def __init__(self, n_columns=3, capacity=256):
+        """
+        :param n_columns: Integer, number of values per year
+        :param capacity: Integer, number of years before the first resize
+        """
+        self._years = np.zeros(max(capacity, 1))
+        self._values = np.zeros((max(capacity, 1), n_columns))
+        self._n = 0
+
+    def __len__(self):
+        return self._n
+
+    def append(self, year, values):
+        """
+        Adds the values of one year.
+        :param year: int
+        :param values: sequence of n_columns numbers
+        :return:
+        """
+        if self._n == len(self._years):
+            self._years = np.concatenate(
+                (self._years, np.zeros_like(self._years)))
+            self._values = np.concatenate(
+                (self._values, np.zeros_like(self._values)))
+        self._years[self._n] = year
+        self._values[self._n] = values
+        self._n += 1
+
+    @property
+    def years(self):
+        """ np.array, the years added so far, as a view. """
+        return self._years[:self._n]
+
+    @property
+    def values(self):
+        """ np.array (years x n_columns), the values added, as a view. """
+        return self._values[:self._n]
+
+    def decimated(self, n_bins):
+        """
+        Returns the history reduced for drawing, see decimate.
+        :param n_bins: int
+        :return: (np.array, np.array), years and values
+        """
+        return decimate(self.years, self.values, n_bins)
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Hans Kristian Lunda, Mikko Rekstad'
+__email__ = 'hans.kristian.lunda@nmbu.no, mikkreks@nmbu.no'
+
+"""
+Vectorized NumPy kernels for the yearly phases. They work on plain arrays,
+so they are shared by the object model in Cell and the columnar Population
+store.
+"""
+
+import numpy as np
+
+
+def share_fodder(fodder, appetite, cells=None):
+    """
+    Gives out fodder to creatures that are sorted in eating order. Each
+    creature eats its appetite or whatever is left when its turn comes,
+    which is computed with one cumulative sum instead of a loop.
+
+    If cells is None, all creatures live in one cell and fodder is a
+    number. Otherwise cells holds the cell index of each creature, sorted so
+    the creatures of a cell are contiguous, and fodder is an array indexed
+    by cell.
+    :param fodder: float or np.array
+    :param appetite: np.array
+    :param cells: np.array or None
+    :return: np.array with the amount eaten by each creature
+    """
+    appetite = np.asarray(appetite, dtype=float)
+    eaten_before = np.cumsum(appetite) - appetite
+    if cells is None:
+        available = fodder
+    else:
+        group_start = np.flatnonzero(np.r_[True, cells[1:] != cells[:-1]])
+        group_size = np.diff(np.r_[group_start, len(cells)])
+        eaten_before -= np.repeat(eaten_before[group_start], group_size)
+        available = fodder[cells]
+    return np.clip(available - eaten_before, 0, appetite)
+
+
+def cell_bounds(sorted_cells, cells):
+    """
+    Finds where each of the given cells starts and ends in an array of
+    cell indices sorted so the creatures of a cell are contiguous. Only the
+    given cells are looked up, so the cost does not depend on the size of
+    the island.
+    :param sorted_cells: np.array, cell index of each creature, sorted
+    :param cells: np.array, sorted cell indices to look up
+    :return: np.array (len(cells) x 2), start and end of each cell
+    """
+    return np.stack((np.searchsorted(sorted_cells, cells, side='left'),
+                     np.searchsorted(sorted_cells, cells, side='right')),
+                    axis=1)
+
+
+def hunt(carnivore_fitness, herbivore_fitness, herbivore_weight, appetite,
+         delta_phi_max, rng):
+    """
+    Lets the carnivores of one cell hunt its herbivores. The carnivores must
+    be sorted fittest first and the herbivores least fit first, which is the
+    order they hunt and are hunted in.
+
+    Each carnivore draws one uniform number for every herbivore that is
+    still alive and weaker than itself, in a single call. The successful
+    kills are found by comparing with the kill probabilities, and a prefix
+    sum of the prey weights tells where the carnivore has eaten its
+    appetite and stops. The fitness of a carnivore is taken at the start of
+    its hunt.
+    :param carnivore_fitness: np.array
+    :param herbivore_fitness: np.array, sorted ascending
+    :param herbivore_weight: np.array
+    :param appetite: float, F for carnivores
+    :param delta_phi_max: float
+    :param rng: numpy.random.Generator
+    :return: (np.array with the amount eaten by each carnivore,
+              np.array of booleans marking the killed herbivores)
+    """
+    killed = np.zeros(len(herbivore_fitness), dtype=bool)
+    eaten = np.zeros(len(carnivore_fitness))
+    for carnivore, fitness in enumerate(carnivore_fitness):
+        weaker = np.searchsorted(herbivore_fitness, fitness, side='left')
+        prey = np.flatnonzero(~killed[:weaker])
+        if len(prey) == 0:
+            continue
+        probability = np.minimum(
+            (fitness - herbivore_fitness[prey]) / delta_phi_max, 1.0)
+        kills = prey[rng.random(len(prey)) < probability]
+        if len(kills) == 0:
+            continue
+        food = np.cumsum(herbivore_weight[kills])
+        number_of_kills = np.searchsorted(food - herbivore_weight[kills],
+                                          appetite, side='left')
+        killed[kills[:number_of_kills]] = True
+        eaten[carnivore] = min(appetite, food[number_of_kills - 1])
+    return eaten, killed
+
+
+def dies(fitness, omega, death_numbers):
+    """
+    Decides which creatures die this year, the vectorized version of
+    Fauna.death. A creature dies if its fitness is zero, or if its death
+    number is larger than its survival chance 1 - omega * (1 - fitness).
+    :param fitness: np.array
+    :param omega: float or np.array
+    :param death_numbers: np.array of uniform random numbers
+    :return: np.array of booleans, True for the creatures that die
+    """
+    survival_chance = 1 - omega * (1 - fitness)
+    return (fitness <= 0) | (death_numbers > survival_chance)
+
+
+def births(fitness, weight, age, have_mated, number, gamma, zeta, w_birth,
+           sigma_birth, rng):
+    """
+    Decides which creatures give birth this year, the vectorized version of
+    Fauna.birth. Only creatures that are old and heavy enough and have not
+    mated draw a birth event, and only those that give birth draw a birth
+    weight.
+    :param fitness: np.array
+    :param weight: np.array
+    :param age: np.array
+    :param have_mated: np.array of booleans
+    :param number: int or np.array, number of creatures of the same species
+                   in the cell of each creature
+    :param gamma: float
+    :param zeta: float
+    :param w_birth: float
+    :param sigma_birth: float
+    :param rng: numpy.random.Generator
+    :return: (np.array with the indices of the mothers,
+              np.array with the birth weights)
+    """
+    eligible = np.flatnonzero(~have_mated & (age > 0)
+                              & (weight > zeta * (w_birth + sigma_birth)))
+    number = np.broadcast_to(number, len(fitness))[eligible]
+    probability = np.minimum(1, gamma * fitness[eligible] * (number - 1))
+    mothers = eligible[rng.random(len(eligible)) < probability]
+    birth_weight = rng.normal(w_birth, sigma_birth, len(mothers))
+    positive = birth_weight > 0
+    return mothers[positive], birth_weight[positive]
+
+
+def migration_probabilities(abundance, neighbours, lambda1):
+    """
+    Computes the probability of moving to each of the four neighbours of
+    some cells, for one species. The propensity of a neighbour is
+    exp(lambda1 * abundance) and closed neighbours, marked with -1 in the
+    neighbour table, get propensity 0. Each row is shifted by its largest
+    exponent before exp, which does not change the probabilities but keeps
+    exp from overflowing.
+    :param abundance: np.array (cells x 4), relative abundance of food in
+                      each neighbour
+    :param neighbours: np.array (cells x 4) of flat cell indices
+    :param lambda1: float
+    :return: np.array (cells x 4), rows sum to 1 or are all 0
+    """
+    is_open = neighbours >= 0
+    exponent = np.where(is_open, lambda1 * abundance, -np.inf)
+    largest = exponent.max(axis=1, keepdims=True)
+    largest[~np.isfinite(largest)] = 0.0
+    propensity = np.exp(exponent - largest)
+    total = propensity.sum(axis=1, keepdims=True)
+    return np.divide(propensity, total, out=np.zeros_like(propensity),
+                     where=total > 0)
@@ -3,10 +3,11 @@
 __author__ = 'Hans Kristian Lunda, Mikko Rekstad'
 __email__ = 'hans.kristian.lunda@nmbu.no, mikkreks@nmbu.no'
 
-from biosim.cell import Ocean, Mountain, Desert, Savannah, Jungle
+from biosim.cell import Cell, Ocean, Mountain, Desert, Savannah, Jungle
+from biosim.fauna import Fauna, Herbivore, Carnivore, fallback_rng
+from biosim.kernels import migration_probabilities
+from biosim.population import Population, HERBIVORE, CARNIVORE
 import numpy as np
-import math
-from numba import jit
 
 
 class Map:
@@ -14,20 +15,39 @@ class Map:
     Creates a numpy array with the coordinates of the map based on
     multi_line_map_string, and add the corresponding landscape type.
     """
-    def __init__(self, map_string):
+    # The parameters each landscape type uses.
+    landscape_parameters = {'J': {'f_max'}, 'S': {'f_max', 'alpha'}}
+
+    def __init__(self, map_string, columnar=False, rng=None,
+                 use_numba=None):
         """
         Will create the map as an array, containing objects with cells.
         Will also create a matrix in order to be able to visualize the map
         easier later.
-        """
+        If columnar is True, the creatures are kept in a single Population
+        store of NumPy arrays instead of Fauna objects in each cell.
+        rng is the numpy.random.Generator shared by the whole simulation, if
+        it is not given one is seeded from the global NumPy random state.
+        The map has its own copy of the species classes, animal_classes, so
+        its animal parameters can be changed without affecting other maps.
+        use_numba chooses the compiled kernels for the columnar store, by
+        default they are used whenever numba is installed.
+        """
+        if rng is None:
+            rng = fallback_rng()
+        self.rng = rng
+        self.animal_classes = (Herbivore.with_own_parameters(),
+                               Carnivore.with_own_parameters())
 
         self.map_string_split = map_string.split()
         self.n_rows = len(self.map_string_split)
         self.n_cols = len(str(self.map_string_split[0]))
         self.cell_map = np.empty((self.n_rows, self.n_cols), dtype=object)
         self.map_matrix = np.zeros((self.n_rows, self.n_cols))
-        self.map_herbivores = np.zeros((self.n_rows, self.n_cols))
-        self.map_carnivores = np.zeros((self.n_rows, self.n_cols))
+        self.population = None
+        if columnar:
+            self.population = Population(self.n_rows, self.n_cols, self.rng,
+                                         use_numba, self.animal_classes)
         self.create_map()
 
     def create_map(self):
@@ -57,6 +77,228 @@ class Map:
                     self.cell_map[row_index][col_index] = Jungle()
                     self.define_adjacent_cells(row_index, col_index)
                     self.map_matrix[row_index][col_index] = 4
+                cell = self.cell_map[row_index][col_index]
+                cell.rng = self.rng
+                cell.animal_classes = self.animal_classes
+                if self.population is not None:
+                    cell.store = self.population
+        self.habitable = self.map_matrix.ravel() >= 2
+        self.create_neighbour_table()
+        self.create_fodder_grid()
+        self.create_active_grid()
+
+    def create_neighbour_table(self):
+        """
+        Creates the static (n_cells x 4) neighbour table. Row i holds the
+        flat index of the cells south, east, north and west of cell i, in
+        the same order as adjacent_cells2, and -1 where that neighbour is
+        outside the map or uninhabitable.
+        :return:
+        """
+        n_cells = self.n_rows * self.n_cols
+        rows, cols = np.divmod(np.arange(n_cells), self.n_cols)
+        neighbour_rows = rows[:, None] + np.array([1, 0, -1, 0])
+        neighbour_cols = cols[:, None] + np.array([0, 1, 0, -1])
+        inside = ((neighbour_rows >= 0) & (neighbour_rows < self.n_rows)
+                  & (neighbour_cols >= 0) & (neighbour_cols < self.n_cols))
+        neighbours = np.where(inside,
+                              neighbour_rows * self.n_cols + neighbour_cols, 0)
+        self.neighbours = np.where(inside & self.habitable[neighbours],
+                                   neighbours, -1)
+
+    def create_fodder_grid(self):
+        """
+        Creates the 2-D arrays fodder, f_max and alpha, aligned with
+        map_matrix, and gives every cell its flat index in the grids.
+        Jungle cells get alpha 1, since they are filled up to f_max every
+        year, and cells without fodder get f_max 0.
+        :return:
+        """
+        landscape = self.map_matrix.astype(int)
+        self.f_max = np.array(Cell.f_max)[landscape]
+        self.alpha = np.select([landscape == 3, landscape == 4],
+                               [Cell.alpha[3], 1.0], 0.0)
+        self.fodder = self.f_max.copy()
+        for index, cell in enumerate(self.cell_map.ravel()):
+            cell.index = index
+
+    def create_active_grid(self):
+        """
+        Creates the flat boolean array active, which marks the cells that
+        hold creatures, the (2 x n_rows x n_cols) array counts with the
+        number of herbivores and carnivores in each cell, the island totals
+        per species, and the grid of move probabilities the cells read
+        from. The cells keep active, counts and totals up to date when
+        creatures are born, die, are eaten or move, so the per-creature
+        phases only visit the active cells and counting is a lookup. With
+        the columnar store, active, counts and totals are the arrays kept up
+        to date by the store.
+        :return:
+        """
+        n_cells = self.n_rows * self.n_cols
+        if self.population is None:
+            self.active = np.zeros(n_cells, dtype=bool)
+            self.counts = np.zeros((2, self.n_rows, self.n_cols),
+                                   dtype=np.int64)
+            self.totals = np.zeros(2, dtype=np.int64)
+        self.probabilities = np.zeros((2, n_cells, 4))
+        self._probability_rows = np.zeros(0, dtype=np.int64)
+        self.link_grids()
+
+    def link_grids(self):
+        """
+        Makes the views of the grids kept by the map, and lets every cell
+        read its fodder, counts and move probabilities from them. Pickling
+        turns views into arrays of their own, so this is done again when a
+        map is unpickled.
+        :return:
+        """
+        n_cells = self.n_rows * self.n_cols
+        if self.population is not None:
+            self.active = self.population.active
+            self.counts = self.population.counts.reshape(2, self.n_rows,
+                                                         self.n_cols)
+            self.totals = self.population.totals
+        self.map_herbivores = self.counts[0]
+        self.map_carnivores = self.counts[1]
+        self.probabilities_herbivores = self.probabilities[0]
+        self.probabilities_carnivores = self.probabilities[1]
+        fodder_grid = self.fodder.ravel()
+        count_grid = self.counts.reshape(2, n_cells)
+        for cell in self.cell_map.ravel():
+            cell.fodder_grid = fodder_grid
+            cell.active_grid = self.active
+            cell.count_grid = count_grid
+            cell.total_counts = self.totals
+            cell.probability_grid = self.probabilities
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.link_grids()
+
+    def active_cells(self):
+        """
+        Returns the cells that hold creatures, in row major order.
+        :return: np.array of cells
+        """
+        return self.cell_map.ravel()[np.flatnonzero(self.active)]
+
+    def grow_fodder(self):
+        """
+        Regrows the fodder of every cell on the map in one grid operation.
+        :return:
+        """
+        self.fodder[:] = self.f_max - (1 - self.alpha) * (
+            self.f_max - self.fodder)
+
+    def set_landscape_parameters(self, landscape, params):
+        """
+        Sets f_max and alpha for all cells of one landscape type. Jungle
+        cells are filled up to f_max every year, so they have no alpha.
+        :param landscape: str, 'J' or 'S'
+        :param params: dict
+        :return:
+        """
+        for key in params:
+            if key not in self.landscape_parameters.get(landscape, ()):
+                raise ValueError("Illegal landscape parameter(s)")
+        code = {'S': 3, 'J': 4}[landscape]
+        is_landscape = self.map_matrix == code
+        if 'f_max' in params:
+            self.f_max[is_landscape] = params['f_max']
+            for cell in self.cell_map[is_landscape]:
+                cell.f_max = params['f_max']
+        if 'alpha' in params:
+            self.alpha[is_landscape] = params['alpha']
+
+    def set_animal_parameters(self, species, params):
+        """
+        Sets parameters of one species for this map only. The cached
+        fitness of every creature is cleared, since it may depend on the
+        new parameters.
+        :param species: int, HERBIVORE or CARNIVORE
+        :param params: dict
+        :return:
+        """
+        self.animal_classes[species].set_parameters(params)
+        if self.population is not None:
+            self.population.mark_dirty()
+        for cell in self.active_cells():
+            for creature in (cell.population_herbivores
+                             + cell.population_carnivores):
+                creature._fitness = None
+
+    def add_population(self, coordinates, cell_pop):
+        """
+        Adds the creatures in cell_pop to the cell at coordinates, either as
+        objects in the cell or as rows in the Population store.
+        :param coordinates: tuple
+        :param cell_pop: list of dictionaries
+        :return:
+        """
+        row_index, col_index = coordinates
+        if self.population is not None:
+            self.population.add_pop(row_index * self.n_cols + col_index,
+                                    cell_pop)
+        else:
+            self.cell_map[row_index][col_index].add_pop(cell_pop)
+
+    def get_animal_arrays(self):
+        """
+        Returns every creature on the map as columns of a table, with the
+        creatures of each cell in the order they are kept in, herbivores
+        first.
+        :return: dict with the arrays species, age, weight, cell and
+                 have_mated
+        """
+        if self.population is not None:
+            return {'species': self.population.species.copy(),
+                    'age': self.population.age.copy(),
+                    'weight': self.population.weight.copy(),
+                    'cell': self.population.cell.copy(),
+                    'have_mated': self.population.have_mated.copy()}
+        rows = []
+        for cell in self.active_cells():
+            for species, creatures in ((HERBIVORE, cell.population_herbivores),
+                                       (CARNIVORE,
+                                        cell.population_carnivores)):
+                rows.extend((species, creature.age, creature.weight,
+                             cell.index, creature.have_mated)
+                            for creature in creatures)
+        species, age, weight, cell, have_mated = (
+            zip(*rows) if len(rows) > 0 else ((),) * 5)
+        return {'species': np.array(species, dtype=np.int8),
+                'age': np.array(age, dtype=np.int64),
+                'weight': np.array(weight, dtype=float),
+                'cell': np.array(cell, dtype=np.int64),
+                'have_mated': np.array(have_mated, dtype=bool)}
+
+    def add_animal_arrays(self, arrays):
+        """
+        Adds the creatures in a table made by get_animal_arrays to the map,
+        keeping their order within each cell.
+        :param arrays: dict
+        :return:
+        """
+        if self.population is not None:
+            n_before = len(self.population)
+            self.population.add(arrays['species'], arrays['age'],
+                                arrays['weight'], arrays['cell'])
+            self.population.have_mated[n_before:] = arrays['have_mated']
+            return
+        cells = self.cell_map.ravel()
+        for species, age, weight, index, have_mated in zip(
+                arrays['species'].tolist(), arrays['age'].tolist(),
+                arrays['weight'].tolist(), arrays['cell'].tolist(),
+                arrays['have_mated'].tolist()):
+            creature = self.animal_classes[species](weight=weight, age=age)
+            creature.have_mated = have_mated
+            if species == HERBIVORE:
+                cells[index].population_herbivores.append(creature)
+            else:
+                cells[index].population_carnivores.append(creature)
+        for index in np.unique(arrays['cell']).tolist():
+            cells[index].update_counts()
 
     def define_adjacent_cells(self, x_coord, y_coord):
         """
@@ -73,65 +315,73 @@ class Map:
     def migration(self):
         """
         This function will summon all functions related to migration.
+        Emigrants are collected in incoming buffers, one per destination
+        cell, which are merged after every cell has been processed. All
+        creatures therefore move at the same time, and at most once a year.
+        With the columnar store the whole island migrates in one call.
         :return:
         """
+        if self.population is not None:
+            self.update_preferred_locations()
+            self.population.migration(self.probabilities, self.neighbours)
+            return
         # Will update preferred location to each creature.
         self.update_preferred_locations()
-        for y_coord in range(self.n_cols):
-            for x_coord in range(self.n_rows):
-                self.migrate_herbivores(self.cell_map[x_coord][y_coord],
-                                        x_coord, y_coord)
-                self.migrate_carnivores(self.cell_map[x_coord][y_coord],
-                                        x_coord, y_coord)
-
-    def migrate_herbivores(self, cell, x_coord, y_coord):
-        """
-        The function checks if the herbivores in the cell want to migrate
-        to one of the adjacent cells, then move them to one of the these cells.
-        :param cell: np.array
-        :param x_coord: int
-        :param y_coord: int
-        :return:
-        """
-        index = 0
-        while index < cell.number_herbivores():
-            creature =\
-                self.cell_map[x_coord][y_coord].population_herbivores[index]
-
-            if creature.wants_to_migrate():
-                move_index = self.select_index_to_move(
-                    cell.probability_herbivores)
-                if move_index in [0, 1, 2, 3]:
-                    move_to = cell.adjacent_cells2[move_index]
-                    move_from = x_coord, y_coord
-                    if self.cell_map[move_to[0]][move_to[1]].habitable:
-                        self.move_herbivore(move_to, move_from, index)
-                index -= 1
-            index += 1
-
-    def migrate_carnivores(self, cell, x_coord, y_coord):
-        """
-        The function checks if the carnivores in the cell want to migrate
-        to one of the adjacent cells, then move them to one of the these cells.
-        :param cell: np.array
-        :param x_coord: int
-        :param y_coord: int
-        :return:
-        """
-        index = 0
-        current_cell = self.cell_map[x_coord][y_coord]
-        while index < cell.number_carnivores():
-            creature = current_cell.population_carnivores[index]
-            if creature.wants_to_migrate():
-                move_index = self.select_index_to_move(
-                    cell.probability_carnivores)
-                if move_index in [0, 1, 2, 3]:
-                    move_to = cell.adjacent_cells2[move_index]
-                    move_from = x_coord, y_coord
-                    if self.cell_map[move_to[0]][move_to[1]].habitable:
-                        self.move_carnivore(move_to, move_from, index)
-                index -= 1
-            index += 1
+        self.update_fitness()
+        cells = self.cell_map.ravel()
+        sources = self.active_cells()
+        incoming_herbivores = {}
+        incoming_carnivores = {}
+        for cell in sources:
+            if len(cell.population_herbivores) > 0:
+                cell.population_herbivores = self.emigrate(
+                    cell.population_herbivores,
+                    self.probabilities_herbivores[cell.index],
+                    self.neighbours[cell.index], incoming_herbivores)
+            if len(cell.population_carnivores) > 0:
+                cell.population_carnivores = self.emigrate(
+                    cell.population_carnivores,
+                    self.probabilities_carnivores[cell.index],
+                    self.neighbours[cell.index], incoming_carnivores)
+
+        for index, creatures in incoming_herbivores.items():
+            cells[index].population_herbivores.extend(creatures)
+        for index, creatures in incoming_carnivores.items():
+            cells[index].population_carnivores.extend(creatures)
+        for cell in sources:
+            cell.update_counts()
+        for index in incoming_herbivores.keys() | incoming_carnivores.keys():
+            cells[index].update_counts()
+
+    def emigrate(self, population, probabilities, neighbours, incoming):
+        """
+        Decides which creatures of one species list leave the cell, and
+        where they go. Whether each creature wants to migrate is drawn in
+        one call, and the emigrants are split over the four neighbours with
+        one multinomial draw.
+        :param population: list
+        :param probabilities: np.array, probability of each direction
+        :param neighbours: np.array, flat index of each neighbour
+        :param incoming: dict, flat cell index to list of arriving creatures
+        :return: list, the creatures that stay
+        """
+        if probabilities.sum() == 0:
+            return population
+        fitness = np.array([creature.fitness for creature in population])
+        wants_to_migrate = (population[0].mu * fitness
+                            > self.rng.random(len(population)))
+        movers = np.flatnonzero(wants_to_migrate)
+        if len(movers) == 0:
+            return population
+        directions = np.repeat(np.arange(4), self.rng.multinomial(
+            len(movers), probabilities))
+        self.rng.shuffle(directions)
+        for mover, direction in zip(movers.tolist(), directions.tolist()):
+            creature = population[mover]
+            creature.have_migrated = True
+            incoming.setdefault(neighbours[direction], []).append(creature)
+        return [creature for creature, moves
+                in zip(population, wants_to_migrate.tolist()) if not moves]
 
     def update_preferred_locations(self):
         """
@@ -142,134 +392,81 @@ class Map:
         - For each species.
         NB! lucrativeness is the chance for a creature to move there if it
         will move at all.
+        Only the rows of the cells that hold creatures are computed, from
+        the abundance in their neighbours, so the cost depends on the
+        occupied area and not on the size of the island. The rows of cells
+        that held creatures last time are cleared.
         :return:
         """
+        if self.population is not None:
+            active = np.unique(self.population.cell)
+            weight_cells, herbivore_weight = \
+                self.population.weight_per_cell(HERBIVORE)
+        else:
+            active = np.flatnonzero(self.active)
+            weight_cells = active
+            herbivore_weight = np.array(
+                [sum(creature.weight for creature
+                     in cell.population_herbivores)
+                 for cell in self.cell_map.ravel()[active]], dtype=float)
+        self.probabilities[:, self._probability_rows] = 0
+        self.probabilities[:, active] = self.get_probabilities(
+            active, weight_cells, herbivore_weight)
+        self._probability_rows = active
+
+    def get_probabilities(self, cells, weight_cells, herbivore_weight):
+        """
+        Computes the abundance of food for each species in the neighbours
+        of the given cells, and turns them into the probabilities of moving
+        to each neighbour. Fodder and counts are read from the grids of the
+        map, only at the neighbour entries.
+        :param cells: np.array, flat indices of the cells
+        :param weight_cells: np.array, sorted flat indices of the cells
+                             holding herbivores
+        :param herbivore_weight: np.array, total herbivore weight in each of
+                                 weight_cells
+        :return: (np.array, np.array), (len(cells) x 4) for each species
+        """
+        herbivore, carnivore = self.animal_classes
+        targets = self.neighbours[cells]
+        counts = self.counts.reshape(2, -1)[:, targets]
+        position = np.minimum(np.searchsorted(weight_cells, targets),
+                              max(len(weight_cells) - 1, 0))
+        target_weight = np.zeros(targets.shape)
+        if len(weight_cells) > 0:
+            target_weight = np.where(weight_cells[position] == targets,
+                                     herbivore_weight[position], 0.0)
+        herbivore_abundance = (self.fodder.ravel()[targets]
+                               / ((counts[0] + 1) * herbivore.F))
+        carnivore_abundance = target_weight / ((counts[1] + 1) * carnivore.F)
+        return (migration_probabilities(herbivore_abundance, targets,
+                                        herbivore.lambda1),
+                migration_probabilities(carnivore_abundance, targets,
+                                        carnivore.lambda1))
 
-        for y_coordinate in range(self.n_cols-1):
-            for x_coordinate in range(self.n_rows-1):
-                # Setting default values to 0
-
-                # Find propensities for each cell.
-                propensities_herbivores, propensities_carnivores = \
-                    self.get_propensities(y_coordinate, x_coordinate)
-
-                # Turn propensities into probabilities
-                self.convert_into_probabilities(propensities_herbivores,
-                                                propensities_carnivores,
-                                                x_coordinate, y_coordinate)
-
-    def get_propensities(self, y_coordinate, x_coordinate):
-        """
-        Takes two lists of zeros, and turns them into lists containing the
-        propensities of fodder for each species. Each value in the list
-        represents an adjacent cell.
-        :param y_coordinate: int
-        :param x_coordinate: int
-        :return:
-        """
-        propensities_herbivores = [0, 0, 0, 0]
-        propensities_carnivores = [0, 0, 0, 0]
-        index = 0
-        lambda1 = 1
-        current_cell = self.cell_map[x_coordinate][y_coordinate]
-        for _ in current_cell.adjacent_cells:
-
-            # Inserting propensity into lists
-            herbivore_abundance = current_cell.get_abundance_herbivore()
-            propensities_herbivores[index] = math.exp(
-                lambda1 * herbivore_abundance)
-
-            carnivore_abundance = current_cell.get_abundance_carnivore()
-            propensities_carnivores[index] = math.exp(
-                lambda1 * carnivore_abundance)
-            index += 1
-        return propensities_herbivores, propensities_carnivores
-
-    def convert_into_probabilities(self, propensities_herbivores,
-                                   propensities_carnivores, x_coordinate,
-                                   y_coordinate):
-        """
-        Takes the lists containing propensities and calculates probabilities
-        for each species to migrate to the cell represented by the index of
-        that list.
-        :param propensities_herbivores: list
-        :param propensities_carnivores: list
-        :param x_coordinate: int
-        :param y_coordinate: int
-        :return:
-        """
-        probabilities_herbivores = [0, 0, 0, 0]
-        probabilities_carnivores = [0, 0, 0, 0]
-        current_cell = self.cell_map[x_coordinate][y_coordinate]
-        if sum(propensities_herbivores) != 0:
-            for i in range(len(propensities_herbivores)):
-                probabilities_herbivores[i] = propensities_herbivores[i]\
-                                              / sum(propensities_herbivores)
-
-            current_cell.probability_herbivores = probabilities_herbivores
-
-        if sum(propensities_carnivores) != 0:
-            for i in range(len(propensities_carnivores)):
-                probabilities_carnivores[i] = propensities_carnivores[i]\
-                                              / sum(propensities_carnivores)
-            current_cell.probability_carnivores = probabilities_carnivores
-
-    @staticmethod
-    def select_index_to_move(probabilities):
+    def get_populations(self):
         """
-        Uses the list of probabilities as a parameter to choose a number
-        between 0 and 3. The number represents the index the creature will use
-        in order to migrate.
-        :param probabilities: list
+        Returns the number of herbivores, carnivores and the sum of these two,
+        read from the running totals.
         :return: int
         """
-        if (sum(probabilities)) == 1:
-            return np.random.choice([0, 1, 2, 3], p=probabilities)
+        herbivores, carnivores = self.totals.tolist()
+        return herbivores, carnivores, herbivores + carnivores
 
-    def move_herbivore(self, move_to, move_from, creature_index):
+    def update_fitness(self):
         """
-        Moves the herbivore from move_from to move_to. They are both tuples,
-        and contain coordinates which will be used as indexes from removal and
-        adding of the creature. The creature is selected with creature_index.
-        :param move_to: tuple
-        :param move_from: tuple
-        :param creature_index: int
+        Recomputes the out of date fitness of every creature on the island
+        in one vectorized call.
         :return:
         """
-        x_to, y_to = move_to
-        x_from, y_from = move_from
-        herbivore = self.cell_map[x_from][y_from].population_herbivores.pop(
-            creature_index)
-        self.cell_map[x_to][y_to].population_herbivores.append(herbivore)
-
-    def move_carnivore(self, move_to, move_from, creature_index):
-        """
-        Moves the carnivore from move_from to move_to. They are both tuples,
-        and contain coordinates which will be used as indexes from removal and
-        adding of the creature. The creature is selected with creature_index.
-        :param move_to: tuple
-        :param move_from: tuple
-        :param creature_index: int
-        :return:
-        """
-        x_to, y_to = move_to
-        x_from, y_from = move_from
-        carnivore = self.cell_map[x_from][y_from].population_carnivores.pop(creature_index)
-        self.cell_map[x_to][y_to].population_carnivores.append(carnivore)
-
-    def get_populations(self):
-        """
-        Returns the number of herbivores, carnivores and the sum of these two.
-        :return: int
-        """
-        herbivores = 0
-        carnivores = 0
-        for list_of_cells in self.cell_map:
-            for cell in list_of_cells:
-                herbivores += cell.number_herbivores()
-                carnivores += cell.number_carnivores()
-        total = herbivores + carnivores
-        return herbivores, carnivores, total
+        if self.population is not None:
+            self.population.fitness()
+            return
+        creatures = []
+        for cell in self.active_cells():
+            creatures.extend(cell.population_herbivores)
+            creatures.extend(cell.population_carnivores)
+        Fauna.batch_fitness(creatures)
 
     @staticmethod
     def reset_mated_migration(cell):
@@ -286,7 +483,6 @@ class Map:
             creature.have_mated = False
             creature.have_migrated = False
 
-    @jit()
     def feeding_and_procreation(self):
         """
         Yearly stage 1 handles the addition of fodder to each cell,
@@ -294,23 +490,25 @@ class Map:
         Here we wil feed and procreate. Names up for change.
         NB! The order is important. Fodder grows first.
         Used to have feed_map and procreate_map. But put them together.
+        With the columnar store the fodder is taken straight from the
+        fodder grid.
         :return:
         """
-        for row_index in range(self.n_rows):
-            for col_index in range(self.n_cols):
-                current_cell = self.cell_map[row_index][col_index]
-                if current_cell.landscape in {2, 3, 4}:
-                    current_cell.add_fodder()
-                    # Feed the herbivores
-                    for creature in current_cell.population_herbivores:
-                        current_cell.ranked_fitness_herbivores()
-                        current_cell.feed_herbivores(creature)
-
-                    # Feed the carnivores
-                    if len(current_cell.population_carnivores) > 0:
-                        current_cell.ranked_fitness_carnivores()
-                        current_cell.feed_carnivores()
-                    current_cell.mating_season()
+        self.grow_fodder()
+        if self.population is not None:
+            self.population.feeding_and_procreation(self.fodder.ravel())
+            return
+        for current_cell in self.active_cells():
+            if current_cell.landscape in {2, 3, 4}:
+                current_cell.update_fitness()
+                # Feed the herbivores
+                current_cell.feed_all_herbivores()
+
+                # Feed the carnivores
+                if len(current_cell.population_carnivores) > 0:
+                    current_cell.ranked_fitness_carnivores()
+                    current_cell.feed_carnivores()
+                current_cell.mating_season()
 
     def ageing_weight_loss_and_death(self):
         """
@@ -321,19 +519,22 @@ class Map:
         from the population if that is the case.
         :return:
         """
-        for row_index in range(self.n_rows):
-            for col_index in range(self.n_cols):
-
-                cell = self.cell_map[row_index][col_index]
-                if cell.landscape in {2, 3, 4}:
-                    cell.add_age()
-                    cell.lose_weight()
-                    self.reset_mated_migration(cell)
-                    cell.alter_population()
+        if self.population is not None:
+            self.population.ageing_weight_loss_and_death()
+            return
+        for cell in self.active_cells():
+            if cell.landscape in {2, 3, 4}:
+                cell.add_age()
+                cell.lose_weight()
+                cell.update_fitness()
+                self.reset_mated_migration(cell)
+                cell.alter_population()
 
     def yearly_cycle(self):
         """
-        Will run through each stage of the yearly cycle.
+        Will run through each stage of the yearly cycle. With the columnar
+        store the cycle runs on the compiled kernels if numba is installed,
+        and on the NumPy kernels otherwise.
         :return:
         """
         self.feeding_and_procreation()
@@ -342,13 +543,10 @@ class Map:
 
     def get_population_maps(self):
         """
-        Calculate the number of herbivores and carnivores and place them
-        in a map.
-        :return:
+        Returns the number of herbivores and carnivores in each cell as two
+        maps. map_herbivores and map_carnivores are views of the count
+        grid, which is kept up to date during the year, so nothing has to
+        be counted here.
+        :return: (np.array, np.array)
         """
-        for x_cords in range(self.n_rows):
-            for y_cords in range(self.n_cols):
-                self.map_herbivores[x_cords][y_cords] =\
-                    self.cell_map[x_cords][y_cords].number_herbivores()
-                self.map_carnivores[x_cords][y_cords] =\
-                    self.cell_map[x_cords][y_cords].number_carnivores()
+        return self.map_herbivores, self.map_carnivores
@@ -0,0 +1,479 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Hans Kristian Lunda, Mikko Rekstad'
+__email__ = 'hans.kristian.lunda@nmbu.no, mikkreks@nmbu.no'
+
+from biosim import compiled
+from biosim.fauna import Fauna, Herbivore, Carnivore, fallback_rng
+from biosim.kernels import share_fodder, cell_bounds, hunt, dies, births
+import numpy as np
+
+HERBIVORE = 0
+CARNIVORE = 1
+
+
+class Population:
+    """
+    Columnar (structure-of-arrays) store for every creature on the island.
+    Each creature is one row across the arrays species, age, weight, cell and
+    have_mated, where cell is the flat index row * n_cols + col of the cell
+    the creature lives in. The species code is used as index into
+    animal_classes, the species classes holding the parameters of the
+    simulation, 0 for herbivores and 1 for carnivores.
+
+    The number of creatures of each species in each cell is kept in the
+    (2 x n_cells) array counts, and the island totals in totals. The flat
+    boolean array active marks the cells that hold creatures. All three are
+    updated in place, for the cells involved only, whenever creatures are
+    added, removed or move, so counting is a lookup.
+
+    Fitness is cached per creature and only recomputed for rows marked as
+    dirty. The methods of this class mark the rows they change, code that
+    writes to age or weight directly must call mark_dirty.
+
+    All random numbers are drawn from rng, the numpy.random.Generator of the
+    simulation, one vector per phase.
+
+    If numba is installed, the phases run on the compiled kernels in
+    biosim.compiled, otherwise on the NumPy kernels in biosim.kernels. The
+    two engines draw their random numbers in different order, so they give
+    different, but equally distributed, results for the same seed.
+    """
+    species_codes = {'herbivore': HERBIVORE, 'carnivore': CARNIVORE}
+
+    def __init__(self, n_rows, n_cols, rng=None, use_numba=None,
+                 animal_classes=(Herbivore, Carnivore)):
+        if rng is None:
+            rng = fallback_rng()
+        if use_numba is None:
+            use_numba = compiled.AVAILABLE
+        elif use_numba and not compiled.AVAILABLE:
+            raise ImportError('use_numba requires numba to be installed')
+        self.rng = rng
+        self.use_numba = use_numba
+        self.animal_classes = animal_classes
+        self.n_rows = n_rows
+        self.n_cols = n_cols
+        self.n_cells = n_rows * n_cols
+        self.species = np.zeros(0, dtype=np.int8)
+        self.age = np.zeros(0, dtype=np.int64)
+        self.weight = np.zeros(0, dtype=float)
+        self.cell = np.zeros(0, dtype=np.int64)
+        self.have_mated = np.zeros(0, dtype=bool)
+        self._fitness = np.zeros(0, dtype=float)
+        self._dirty = np.zeros(0, dtype=bool)
+        self.counts = np.zeros((2, self.n_cells), dtype=np.int64)
+        self.totals = np.zeros(2, dtype=np.int64)
+        self.active = np.zeros(self.n_cells, dtype=bool)
+
+    def __len__(self):
+        return len(self.species)
+
+    def parameter(self, name, species):
+        """
+        Returns the value of an animal parameter for one species.
+        :param name: str
+        :param species: int
+        :return: float
+        """
+        return getattr(self.animal_classes[species], name)
+
+    def parameter_array(self, name):
+        """
+        Returns an array with the value of an animal parameter for each
+        creature in the store.
+        :param name: str
+        :return: np.array
+        """
+        values = np.array([self.parameter(name, HERBIVORE),
+                           self.parameter(name, CARNIVORE)], dtype=float)
+        return values[self.species]
+
+    def add(self, species, age, weight, cell):
+        """
+        Appends creatures to the store. All arguments may be scalars or
+        arrays of equal length.
+        :param species: int or np.array
+        :param age: int or np.array
+        :param weight: float or np.array
+        :param cell: int or np.array
+        :return:
+        """
+        weight = np.atleast_1d(np.asarray(weight, dtype=float))
+        number = len(weight)
+        species = np.broadcast_to(species, number).astype(np.int8)
+        cell = np.broadcast_to(cell, number).astype(np.int64)
+        self.update_counts(species, cell, 1)
+        self.species = np.concatenate((self.species, species))
+        self.age = np.concatenate(
+            (self.age, np.broadcast_to(age, number).astype(np.int64)))
+        self.weight = np.concatenate((self.weight, weight))
+        self.cell = np.concatenate((self.cell, cell))
+        self.have_mated = np.concatenate(
+            (self.have_mated, np.zeros(number, dtype=bool)))
+        self._fitness = np.concatenate((self._fitness, np.zeros(number)))
+        self._dirty = np.concatenate((self._dirty, np.ones(number,
+                                                           dtype=bool)))
+
+    def add_pop(self, cell_index, cell_pop):
+        """
+        Adds herbivores and carnivores to one cell. Species, weight and age
+        are supplied from a dictionary, as in Cell.add_pop.
+        :param cell_index: int
+        :param cell_pop: list of dictionaries
+        :return:
+        """
+        if len(cell_pop) == 0:
+            return
+        species = [self.species_codes.get(creature.get('species').lower(),
+                                          CARNIVORE)
+                   for creature in cell_pop]
+        age = [creature.get('age') for creature in cell_pop]
+        weight = [creature.get('weight') for creature in cell_pop]
+        self.add(np.array(species), np.array(age), weight, cell_index)
+
+    def keep(self, mask):
+        """
+        Keeps the creatures where mask is True and removes the rest.
+        :param mask: np.array of booleans
+        :return:
+        """
+        removed = ~mask
+        if not removed.any():
+            return
+        self.update_counts(self.species[removed], self.cell[removed], -1)
+        self.species = self.species[mask]
+        self.age = self.age[mask]
+        self.weight = self.weight[mask]
+        self.cell = self.cell[mask]
+        self.have_mated = self.have_mated[mask]
+        self._fitness = self._fitness[mask]
+        self._dirty = self._dirty[mask]
+
+    def update_counts(self, species, cell, change):
+        """
+        Adds change to the count of each given creature's species in its
+        cell, and to the island totals, and marks whether those cells still
+        hold creatures.
+        :param species: np.array
+        :param cell: np.array
+        :param change: int, 1 for added and -1 for removed creatures
+        :return:
+        """
+        np.add.at(self.counts, (species, cell), change)
+        self.totals += change * np.bincount(species, minlength=2)
+        self.update_active(cell)
+
+    def update_active(self, cell):
+        """
+        Marks the given cells in active if they hold creatures, and clears
+        them otherwise.
+        :param cell: np.array
+        :return:
+        """
+        self.active[cell] = self.counts[:, cell].any(axis=0)
+
+    def move(self, new_cell):
+        """
+        Moves every creature to the cell given in new_cell, and updates the
+        counts and active marks of the cells it left and entered.
+        :param new_cell: np.array
+        :return:
+        """
+        moved = np.flatnonzero(new_cell != self.cell)
+        np.add.at(self.counts, (self.species[moved], self.cell[moved]), -1)
+        np.add.at(self.counts, (self.species[moved], new_cell[moved]), 1)
+        self.update_active(self.cell[moved])
+        self.update_active(new_cell[moved])
+        self.cell = new_cell
+
+    def mark_dirty(self, index=None):
+        """
+        Marks the cached fitness of the given rows, or of every row, as out
+        of date.
+        :param index: int, np.array or None
+        :return:
+        """
+        if index is None:
+            self._dirty[:] = True
+        else:
+            self._dirty[index] = True
+
+    def number_herbivores(self, cell=None):
+        """
+        Returns the number of herbivores on the island, or in a single cell
+        if the flat cell index is given.
+        :param cell: int
+        :return: int
+        """
+        if cell is None:
+            return int(self.totals[HERBIVORE])
+        return int(self.counts[HERBIVORE, cell])
+
+    def number_carnivores(self, cell=None):
+        """
+        Returns the number of carnivores on the island, or in a single cell
+        if the flat cell index is given.
+        :param cell: int
+        :return: int
+        """
+        if cell is None:
+            return int(self.totals[CARNIVORE])
+        return int(self.counts[CARNIVORE, cell])
+
+    def count_per_cell(self, species):
+        """
+        Returns the number of creatures of one species in each cell as a
+        flat array of length n_cells. The array is a view of the live
+        counts and must not be altered.
+        :param species: int
+        :return: np.array
+        """
+        return self.counts[species]
+
+    def weight_per_cell(self, species):
+        """
+        Returns the total weight of the creatures of one species in each
+        cell that holds any of them. Only occupied cells are returned, so
+        the cost depends on the number of creatures, not on the size of the
+        island.
+        :param species: int
+        :return: (np.array, np.array), sorted flat cell indices and the
+                 total weight in each
+        """
+        is_species = self.species == species
+        cells, inverse = np.unique(self.cell[is_species], return_inverse=True)
+        return cells, np.bincount(inverse, weights=self.weight[is_species],
+                                  minlength=len(cells))
+
+    def count_grid(self, species):
+        """
+        Returns the number of creatures of one species in each cell as an
+        array with the same shape as the map, a view of the live counts.
+        :param species: int
+        :return: np.array
+        """
+        return self.count_per_cell(species).reshape(self.n_rows, self.n_cols)
+
+    def fitness(self):
+        """
+        Returns the fitness of every creature in the store. Only the rows
+        marked as dirty are recomputed, in one vectorized call.
+        :return: np.array
+        """
+        if self._dirty.any():
+            dirty = np.flatnonzero(self._dirty)
+            self._fitness[dirty] = Fauna.compute_fitness(
+                self.age[dirty], self.weight[dirty],
+                self.parameter_array('a_half')[dirty],
+                self.parameter_array('phi_age')[dirty],
+                self.parameter_array('w_half')[dirty],
+                self.parameter_array('phi_weight')[dirty])
+            self._dirty[dirty] = False
+        return self._fitness
+
+    def feed_herbivores(self, fodder):
+        """
+        Feeds the herbivores of every cell in order of fitness, fittest
+        first. Each herbivore eats F or whatever is left in its cell. The
+        herbivores are sorted once and the fodder is shared with a
+        cumulative sum per cell. The fodder array is indexed by flat cell
+        index and is altered in place.
+        :param fodder: np.array
+        :return:
+        """
+        herbivores = np.flatnonzero(self.species == HERBIVORE)
+        if len(herbivores) == 0:
+            return
+        fitness = self.fitness()[herbivores]
+        order = herbivores[np.lexsort((-fitness, self.cell[herbivores]))]
+        if self.use_numba:
+            compiled.feed_herbivores(order, self.cell, fodder, self.weight,
+                                     self.parameter('F', HERBIVORE),
+                                     self.parameter('beta', HERBIVORE))
+            self.mark_dirty(order)
+            return
+        cells = self.cell[order]
+        eaten = share_fodder(fodder, np.full(len(order), self.parameter(
+            'F', HERBIVORE)), cells)
+        fed, inverse = np.unique(cells, return_inverse=True)
+        fodder[fed] = np.maximum(
+            fodder[fed] - np.bincount(inverse, weights=eaten), 0)
+        self.weight[order] += self.parameter('beta', HERBIVORE) * eaten
+        self.mark_dirty(order)
+
+    def feed_carnivores(self):
+        """
+        Lets the carnivores of every cell hunt, fittest first. Each carnivore
+        tries to kill the herbivores of its cell from least fit to fittest,
+        and stops when it has eaten F or tried all herbivores. Killed
+        herbivores are marked during the hunt and removed from the store
+        once at the end.
+        :return:
+        """
+        fitness = self.fitness()
+        is_herbivore = self.species == HERBIVORE
+        carnivores = np.flatnonzero(~is_herbivore)
+        herbivores = np.flatnonzero(is_herbivore)
+        if len(carnivores) == 0 or len(herbivores) == 0:
+            return
+        carnivores = carnivores[np.lexsort((-fitness[carnivores],
+                                            self.cell[carnivores]))]
+        herbivores = herbivores[np.lexsort((fitness[herbivores],
+                                            self.cell[herbivores]))]
+        carnivore_cells = self.cell[carnivores]
+        herbivore_cells = self.cell[herbivores]
+        hunting_cells = np.intersect1d(carnivore_cells, herbivore_cells)
+        carnivore_bounds = cell_bounds(carnivore_cells, hunting_cells)
+        herbivore_bounds = cell_bounds(herbivore_cells, hunting_cells)
+
+        appetite = self.parameter('F', CARNIVORE)
+        delta_phi_max = self.parameter('DeltaPhiMax', CARNIVORE)
+        if self.use_numba:
+            alive = compiled.hunt_cells(
+                carnivores, herbivores, carnivore_bounds, herbivore_bounds,
+                fitness, self.weight, appetite, delta_phi_max,
+                self.parameter('beta', CARNIVORE), self.rng)
+            self.mark_dirty(carnivores)
+            self.keep(alive)
+            return
+        alive = np.ones(len(self), dtype=bool)
+        for (first_hunter, last_hunter), (first_prey, last_prey) in zip(
+                carnivore_bounds, herbivore_bounds):
+            hunters = carnivores[first_hunter:last_hunter]
+            prey = herbivores[first_prey:last_prey]
+            eaten, killed = hunt(fitness[hunters], fitness[prey],
+                                 self.weight[prey], appetite, delta_phi_max,
+                                 self.rng)
+            self.weight[hunters] += self.parameter('beta', CARNIVORE) * eaten
+            alive[prey[killed]] = False
+        self.mark_dirty(carnivores)
+        self.keep(alive)
+
+    def mating_season(self):
+        """
+        Lets every creature that has not mated this year try to give birth,
+        with a probability depending on its fitness and on the number of
+        creatures of the same species in its cell. Births are decided for
+        each species in one batch, and all newborns are added to the store
+        in one operation at the end.
+        :return:
+        """
+        fitness = self.fitness()
+        newborn_species = []
+        newborn_weight = []
+        newborn_cell = []
+        for species in (HERBIVORE, CARNIVORE):
+            members = np.flatnonzero(self.species == species)
+            if len(members) < 2:
+                continue
+            count = self.count_per_cell(species)[self.cell[members]]
+            birth_kernel = compiled.births if self.use_numba else births
+            mothers, birth_weight = birth_kernel(
+                fitness[members], self.weight[members], self.age[members],
+                self.have_mated[members], count,
+                self.parameter('gamma', species),
+                self.parameter('zeta', species),
+                self.parameter('w_birth', species),
+                self.parameter('sigma_birth', species), self.rng)
+            mothers = members[mothers]
+            self.weight[mothers] -= self.parameter('xi', species) \
+                * birth_weight
+            self.have_mated[mothers] = True
+            self.mark_dirty(mothers)
+            newborn_species.append(np.full(len(mothers), species))
+            newborn_weight.append(birth_weight)
+            newborn_cell.append(self.cell[mothers])
+
+        if len(newborn_species) > 0:
+            self.add(np.concatenate(newborn_species), 0,
+                     np.concatenate(newborn_weight),
+                     np.concatenate(newborn_cell))
+
+    def feeding_and_procreation(self, fodder):
+        """
+        Yearly stage 1, herbivores eat, carnivores hunt and both species
+        procreate.
+        :param fodder: np.array
+        :return:
+        """
+        self.feed_herbivores(fodder)
+        self.feed_carnivores()
+        self.mating_season()
+
+    def migration(self, probabilities, neighbours):
+        """
+        Moves the creatures that want to migrate. The destination is drawn
+        from the four adjacent cells with the probabilities of the cell the
+        creature is in. All probabilities are computed before anyone moves,
+        so every creature moves at the same time and at most once a year.
+        :param probabilities: np.array (2 x n_cells x 4), move probabilities
+                              for herbivores and carnivores, only read
+                              for the occupied cells
+        :param neighbours: np.array (n_cells x 4), neighbour table of the map
+        :return:
+        """
+        if len(self) == 0:
+            return
+        fitness = self.fitness()
+        if self.use_numba:
+            self.move(compiled.migrate(
+                self.cell, self.species, fitness,
+                np.array([self.parameter('mu', HERBIVORE),
+                          self.parameter('mu', CARNIVORE)]),
+                probabilities, neighbours, self.rng))
+            return
+        new_cell = self.cell.copy()
+        for species in (HERBIVORE, CARNIVORE):
+            movers = np.flatnonzero(
+                (self.species == species)
+                & (self.parameter('mu', species) * fitness
+                   > self.rng.random(len(self))))
+            movers_cell = self.cell[movers]
+            cumulative = np.cumsum(probabilities[species][movers_cell],
+                                   axis=1)
+            draws = self.rng.random(len(movers))
+            direction = np.minimum((draws[:, None] > cumulative).sum(axis=1),
+                                   3)
+            destination = neighbours[movers_cell, direction]
+            can_move = (destination >= 0) & (cumulative[:, -1] > 0)
+            new_cell[movers[can_move]] = destination[can_move]
+        self.move(new_cell)
+
+    def add_age(self):
+        """ Increases the age of every creature by one year. """
+        self.age += 1
+        self.mark_dirty()
+
+    def lose_weight(self):
+        """ Every creature loses eta times its weight. """
+        self.weight -= self.parameter_array('eta') * self.weight
+        self.mark_dirty()
+
+    def reset_mated(self):
+        """ Sets have_mated to False for every creature. """
+        self.have_mated[:] = False
+
+    def alter_population(self):
+        """
+        Removes the creatures that die this year. A creature dies if its
+        fitness is zero, or with probability omega * (1 - fitness).
+        :return:
+        """
+        if self.use_numba:
+            dead = compiled.dies(self.fitness(),
+                                 self.parameter_array('omega'), self.rng)
+        else:
+            dead = dies(self.fitness(), self.parameter_array('omega'),
+                        self.rng.random(len(self)))
+        self.keep(~dead)
+
+    def ageing_weight_loss_and_death(self):
+        """
+        Yearly stage 3, all creatures age, lose weight and may die.
+        :return:
+        """
+        self.add_age()
+        self.lose_weight()
+        self.reset_mated()
+        self.alter_population()
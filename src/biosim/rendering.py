@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Hans Kristian Lunda, Mikko Rekstad'
+__email__ = 'hans.kristian.lunda@nmbu.no, mikkreks@nmbu.no'
+
+"""
+Off-screen rendering of simulation frames on a pool of worker processes.
+The simulation only sends a snapshot of each shown year, the count grids
+and the decimated history of the totals, and carries on while the workers
+draw the frames with the Agg backend. matplotlib is only imported in the
+workers, and in the main process when a streamed movie is made.
+"""
+
+from biosim.history import History
+from concurrent.futures import ProcessPoolExecutor
+import collections
+import multiprocessing
+import numpy as np
+import os
+import types
+
+# The Visualize object of a worker process, made by _start_worker.
+_visualize = None
+
+
+def _start_worker(map_matrix, years, ymax):
+    """
+    Makes the off-screen figure of a worker process.
+    :param map_matrix: np.array, landscape codes of the map
+    :param years: int, length of the x-axis of the stats graph
+    :param ymax: int, limit of the y-axis of the stats graph
+    :return:
+    """
+    global _visualize
+    import matplotlib
+    matplotlib.use('Agg')
+    from biosim.visualize import Visualize
+    island = types.SimpleNamespace(map_matrix=map_matrix,
+                                   map_herbivores=np.zeros(map_matrix.shape))
+    _visualize = Visualize(island, years=years, ymax=ymax)
+
+
+def _render_frame(filename, final_year, years, history, herbivores,
+                  carnivores, return_frame):
+    """
+    Draws one snapshot in a worker process, and saves it as an image if
+    filename is given.
+    :param filename: String or None
+    :param final_year: int, length of the x-axis of the stats graph
+    :param years: np.array, years of the stats graph
+    :param history: np.array (years x 3), totals of each year
+    :param herbivores: np.array, count grid of herbivores
+    :param carnivores: np.array, count grid of carnivores
+    :param return_frame: Boolean, sends the RGBA pixels back
+    :return: np.array (height x width x 4) or None
+    """
+    import matplotlib.pyplot as plt
+    if final_year != _visualize._final_step:
+        _visualize.set_final_year(final_year)
+    _visualize.draw_snapshot(years, history, herbivores, carnivores)
+    frame = _visualize.frame()
+    if filename is not None:
+        plt.imsave(filename, frame)
+    return frame.copy() if return_frame else None
+
+
+class FrameRenderer:
+    """
+    Renders the frames of a simulation on a pool of worker processes.
+    Snapshots are sent to the pool as they are submitted, and at most
+    max_pending frames are in progress at a time. When that many are
+    pending, submit waits for the oldest one, so the simulation never runs
+    far ahead of the renderer and memory use stays bounded. Frames are
+    numbered in the order they are submitted, and streamed movie frames are
+    written in that order as well.
+
+    The workers are started with the spawn method, so they do not inherit
+    the figures or the GUI of the main process. As with any spawned
+    process pool, a script that makes a FrameRenderer must guard its main
+    code with if __name__ == '__main__'.
+    """
+    def __init__(self, map, img_base, img_fmt='png', movie_fmt=None,
+                 ffmpeg_binary=None, max_workers=None, max_pending=None,
+                 years=200, ymax=10000, history_bins=1024):
+        """
+        :param map: Map object of the simulation
+        :param img_base: String, beginning of the file names, including
+               path
+        :param img_fmt: String, image file format, no images if None
+        :param movie_fmt: String, if given the frames are streamed to
+               ffmpeg as the movie img_base.movie_fmt
+        :param ffmpeg_binary: String, see biosim.visualize.find_ffmpeg
+        :param max_workers: Integer, number of worker processes, by default
+               one per core
+        :param max_pending: Integer, frames in progress at a time, by
+               default two per worker
+        :param years: Integer, length of the x-axis of the stats graph, it
+               is doubled when the simulation runs past it
+        :param ymax: Integer, limit of the y-axis of the stats graph
+        :param history_bins: Integer, the history is decimated to at most
+               twice this many points before it is sent, so a frame costs
+               the same to send however many years are simulated. It
+               should be at least the width of the stats graph in pixels
+        """
+        self.img_base = img_base
+        self.img_fmt = img_fmt
+        self.movie_fmt = movie_fmt
+        self.ffmpeg_binary = ffmpeg_binary
+        max_workers = max_workers or os.cpu_count()
+        self.max_pending = max_pending or 2 * max_workers
+        self.n_frames = 0
+        self.final_year = years
+        self.history_bins = history_bins
+        self._history = History(3, capacity=years)
+        self._pending = collections.deque()
+        self._movie_writer = None
+        self._executor = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_start_worker,
+            initargs=(np.array(map.map_matrix), years, ymax))
+
+    def submit(self, year, herbivores, carnivores, herbivore_grid,
+               carnivore_grid):
+        """
+        Sends a snapshot of one year to the pool. The grids are copied, so
+        the simulation can go on changing them. The frames are drawn by any
+        of the workers, so each one is sent the history it needs, decimated
+        to history_bins as the stats graph would do anyway.
+        :param year: int
+        :param herbivores: int
+        :param carnivores: int
+        :param herbivore_grid: np.array, counted herbivores in each cell
+        :param carnivore_grid: np.array, counted carnivores in each cell
+        :return:
+        """
+        self._history.append(year,
+                             (herbivores, carnivores, herbivores + carnivores))
+        while year > self.final_year:
+            self.final_year *= 2
+        years, history = self._history.decimated(self.history_bins)
+        filename = None
+        if self.img_fmt is not None:
+            filename = '{base}_{num:05d}.{type}'.format(
+                base=self.img_base, num=self.n_frames, type=self.img_fmt)
+        self._pending.append(self._executor.submit(
+            _render_frame, filename, self.final_year, years, history,
+            np.array(herbivore_grid), np.array(carnivore_grid),
+            self.movie_fmt is not None))
+        self.n_frames += 1
+        while len(self._pending) >= self.max_pending:
+            self._finish_oldest()
+
+    def _finish_oldest(self):
+        """
+        Waits for the oldest pending frame, and writes it to the movie.
+        """
+        frame = self._pending.popleft().result()
+        if frame is not None:
+            if self._movie_writer is None:
+                from biosim.visualize import MovieWriter
+                height, width = frame.shape[:2]
+                self._movie_writer = MovieWriter(
+                    '{}.{}'.format(self.img_base, self.movie_fmt), width,
+                    height, binary=self.ffmpeg_binary)
+            self._movie_writer.write_frame(frame)
+
+    def wait(self):
+        """
+        Waits until every submitted frame is rendered.
+        :return:
+        """
+        while self._pending:
+            self._finish_oldest()
+
+    def make_movie(self, movie_fmt='mp4'):
+        """
+        Finishes the streamed movie, or encodes the saved images as the
+        movie img_base.movie_fmt if no movie was streamed.
+        :param movie_fmt: String, format of a movie made from images
+        :return:
+        """
+        self.wait()
+        if self._movie_writer is not None:
+            self._movie_writer.close()
+            self._movie_writer = None
+            return
+        if self.img_fmt is None:
+            raise RuntimeError("No images saved.")
+        from biosim.visualize import encode_images
+        encode_images(self.img_base, self.img_fmt, movie_fmt,
+                      self.ffmpeg_binary)
+
+    def close(self):
+        """
+        Waits for the pending frames and stops the worker processes, and
+        the ffmpeg process of a streamed movie that make_movie has not
+        finished.
+        :return:
+        """
+        try:
+            self.wait()
+        finally:
+            self._executor.shutdown()
+            if self._movie_writer is not None:
+                self._movie_writer.terminate()
+                self._movie_writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
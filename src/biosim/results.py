@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Hans Kristian Lunda, Mikko Rekstad'
+__email__ = 'hans.kristian.lunda@nmbu.no, mikkreks@nmbu.no'
+
+"""
+Writers for the yearly results of a simulation. A writer keeps the results
+in memory and writes them every flush_years years, so the file is opened
+once per flush instead of once per year. The rest is written when the
+writer is flushed or closed; BioSim.simulate flushes it at the end of every
+call. The island totals go to the file
+at path, in a format given by the writer class. If grids is True, the count
+grids of both species are written as well, as chunks of year x row x col
+arrays in .npz files next to it.
+"""
+
+from abc import ABC, abstractmethod
+import csv
+import glob
+import numpy as np
+import os
+import pandas as pd
+import re
+
+
+class ResultWriter(ABC):
+    """
+    Abstract base class of the result writers. Subclasses write the totals
+    by implementing write_counts.
+    """
+    def __init__(self, path, flush_years=100, grids=False):
+        """
+        :param path: String, file the totals are written to
+        :param flush_years: Integer, years between writes
+        :param grids: Boolean, also writes the count grid of each species
+        """
+        self.path = str(path)
+        self.base = os.path.splitext(self.path)[0]
+        self.flush_years = flush_years
+        self.grids = grids
+        self.n_chunks = self.first_chunk()
+        self.years = []
+        self.counts = []
+        self.herbivore_grids = []
+        self.carnivore_grids = []
+
+    def record(self, year, herbivores, carnivores, herbivore_grid=None,
+               carnivore_grid=None):
+        """
+        Stores the results of one year, and writes the stored results when
+        flush_years years have been recorded.
+        :param year: int
+        :param herbivores: int
+        :param carnivores: int
+        :param herbivore_grid: np.array, counted herbivores in each cell
+        :param carnivore_grid: np.array, counted carnivores in each cell
+        :return:
+        """
+        self.years.append(year)
+        self.counts.append((herbivores, carnivores))
+        if self.grids:
+            self.herbivore_grids.append(np.array(herbivore_grid))
+            self.carnivore_grids.append(np.array(carnivore_grid))
+        if len(self.years) >= self.flush_years:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the stored results and empties the buffers.
+        :return:
+        """
+        if len(self.years) == 0:
+            return
+        years = np.array(self.years)
+        counts = np.array(self.counts, dtype=np.int64)
+        self.write_counts(years, counts)
+        if self.grids:
+            np.savez('{}_grids_{:05d}.npz'.format(self.base, self.n_chunks),
+                     years=years,
+                     Herbivore=np.stack(self.herbivore_grids),
+                     Carnivore=np.stack(self.carnivore_grids))
+        self.n_chunks += 1
+        self.years = []
+        self.counts = []
+        self.herbivore_grids = []
+        self.carnivore_grids = []
+
+    @abstractmethod
+    def write_counts(self, years, counts):
+        """
+        Writes the totals of a chunk of years.
+        :param years: np.array
+        :param counts: np.array (years x 2), herbivores and carnivores
+        :return:
+        """
+
+    def first_chunk(self):
+        """
+        Returns the number of the first chunk to write, one after the
+        highest chunk number of the files already written next to path. A
+        resumed run therefore adds chunks after those of the earlier run
+        instead of overwriting them.
+        :return: int
+        """
+        directory, name = os.path.split(self.base)
+        pattern = re.compile(re.escape(name) + r'_(?:grids_)?(\d+)\.\w+$')
+        numbers = [int(match.group(1)) for match
+                   in map(pattern.match, os.listdir(directory or '.'))
+                   if match is not None]
+        return max(numbers, default=-1) + 1
+
+    def close(self):
+        """
+        Writes the results still stored. Call it when the simulation is
+        done, or use the writer in a with statement.
+        :return:
+        """
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def chunk_path(self, suffix):
+        """
+        Returns the path of the current chunk file.
+        :param suffix: str, file suffix
+        :return: str
+        """
+        return '{}_{:05d}{}'.format(self.base, self.n_chunks, suffix)
+
+
+class CSVWriter(ResultWriter):
+    """
+    Appends the totals to one CSV file, with the columns Year, Herbivore,
+    Carnivore and Total.
+    """
+    def write_counts(self, years, counts):
+        write_header = not os.path.exists(self.path)
+        with open(self.path, 'a', newline='') as file:
+            writer = csv.writer(file)
+            if write_header:
+                writer.writerow(['Year', 'Herbivore', 'Carnivore', 'Total'])
+            writer.writerows(
+                np.column_stack((years, counts, counts.sum(axis=1))).tolist())
+
+
+class NpzWriter(ResultWriter):
+    """
+    Writes the totals of each chunk of years to its own .npz file, named
+    after path with the chunk number added, with the arrays years,
+    Herbivore and Carnivore.
+    """
+    def write_counts(self, years, counts):
+        np.savez(self.chunk_path('.npz'), years=years,
+                 Herbivore=counts[:, 0], Carnivore=counts[:, 1])
+
+
+class ParquetWriter(ResultWriter):
+    """
+    Writes the totals of each chunk of years to its own Parquet file, named
+    after path with the chunk number added. Needs pyarrow or fastparquet.
+    """
+    def write_counts(self, years, counts):
+        pd.DataFrame({'Year': years, 'Herbivore': counts[:, 0],
+                      'Carnivore': counts[:, 1]}).to_parquet(
+            self.chunk_path('.parquet'), index=False)
+
+
+def make_writer(path, flush_years=100, grids=False):
+    """
+    Returns a result writer for the format given by the suffix of path,
+    .csv, .npz or .parquet.
+    :param path: String
+    :param flush_years: Integer
+    :param grids: Boolean
+    :return: ResultWriter
+    """
+    writers = {'.csv': CSVWriter, '.npz': NpzWriter,
+               '.parquet': ParquetWriter}
+    suffix = os.path.splitext(str(path))[1].lower()
+    if suffix not in writers:
+        raise ValueError("Unknown result format: {}".format(suffix))
+    return writers[suffix](path, flush_years, grids)
+
+
+def load_grids(path):
+    """
+    Reads the count grids written next to path, and joins the chunks.
+    :param path: String, path given to the writer
+    :return: (np.array, np.array, np.array), the years and the
+             year x row x col grids of herbivores and carnivores
+    """
+    base = os.path.splitext(str(path))[0]
+    years, herbivores, carnivores = [], [], []
+    for chunk in sorted(glob.glob(base + '_grids_*.npz')):
+        with np.load(chunk) as data:
+            years.append(data['years'])
+            herbivores.append(data['Herbivore'])
+            carnivores.append(data['Carnivore'])
+    return (np.concatenate(years), np.concatenate(herbivores),
+            np.concatenate(carnivores))
@@ -3,12 +3,16 @@
 __author__ = 'Hans Kristian Lunda, Mikko Rekstad'
 __email__ = 'hans.kristian.lunda@nmbu.no, mikkreks@nmbu.no'
 
-from biosim.cell import Cell
-from biosim.fauna import Herbivore, Carnivore
+from biosim.fauna import Fauna
 from biosim.map import Map
-from biosim.visualize import Visualize
+from biosim.population import HERBIVORE, CARNIVORE
+from biosim.results import CSVWriter
+import numpy as np
 import pandas as pd
-import csv
+import json
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 class BioSim:
@@ -28,6 +32,15 @@ class BioSim:
             img_base=None,
             img_fmt="png",
             save_csv=False,
+            columnar=False,
+            headless=False,
+            progress=None,
+            progress_years=1,
+            result_writer=None,
+            movie_fmt=None,
+            ffmpeg_binary=None,
+            render_workers=None,
+            use_numba=None,
     ):
         """
         :param island_map: Multi-line string specifying island geography
@@ -39,9 +52,37 @@ class BioSim:
                animal densities
         :param img_base: String with beginning of file name for figures,
                including path
-        :param img_fmt: String with file type for figures, e.g. 'png'
+        :param img_fmt: String with file type for figures, e.g. 'png'. If
+               None, no figures are written, only the streamed movie
         :param save_csv: Boolean, gives the user the option to save mid
-               results to a csv-file
+               results to the csv-file biosim_results.csv
+        :param columnar: Boolean, keeps the animals in a columnar Population
+               store of NumPy arrays instead of one object per animal, see
+               use_numba
+        :param headless: Boolean, runs without graphics. No figure is made
+               and matplotlib is never imported
+        :param progress: Function called as progress(year, herbivores,
+               carnivores) to report progress, if None progress is logged
+               with the logging module
+        :param progress_years: Integer, years between progress reports
+        :param result_writer: ResultWriter from biosim.results, which
+               records the results of every year. Overrides save_csv. The
+               results still buffered are written by close
+        :param movie_fmt: String with movie format, e.g. 'mp4'. If given,
+               the saved figures are streamed to ffmpeg while simulating,
+               and make_movie finishes the movie img_base.movie_fmt
+        :param ffmpeg_binary: String with the ffmpeg binary, if None the
+               BIOSIM_FFMPEG environment variable or ffmpeg on the PATH is
+               used
+        :param render_workers: Integer, if given the figures are drawn off
+               screen by a FrameRenderer with this many worker processes,
+               while the simulation goes on, and no window is shown. Needs
+               img_base. The worker processes are stopped by make_movie or
+               close
+        :param use_numba: Boolean, runs the yearly cycle on the compiled
+               numba kernels. They work on the columnar store, so this
+               needs columnar=True. If None, they are used with the
+               columnar store whenever numba is installed
 
         If ymax_animals is None, the y-axis limit should be adjusted
         automatically.
@@ -59,24 +100,47 @@ class BioSim:
         img_base should contain a path and beginning of a file name.
 
         """
-        self._animal_distribution = pd.DataFrame()
-        self._num_animals_per_species = {'Carnivore': 0, 'Herbivore': 0}
-        self._num_animals = 0
+        self._distribution_index = None
         self._year = 0
+        if use_numba and not columnar:
+            raise ValueError("use_numba needs columnar=True")
         if self.check_validity_of_string(island_map) is False:
             raise ValueError("Invalid multiline mapstring!")
         else:
             self.island_map = island_map
             self.seed = seed
+            self.rng = np.random.default_rng(seed)
             self.ymax_animals = ymax_animals
             self.cmax_animals = cmax_animals
             self.img_base = img_base
             self.img_fmt = img_fmt
-            self.map = Map(self.island_map)
+            self.map = Map(self.island_map, columnar=columnar,
+                           rng=self.rng, use_numba=use_numba)
             self.add_population(ini_pop)
             self.save_csv = save_csv
-            self.visualize = Visualize(self.map, frequency=2, years=200,
-                                       img_dir=self.img_base or ".", cmax_animals=self.cmax_animals)
+            if result_writer is None and save_csv:
+                result_writer = CSVWriter('biosim_results.csv')
+            self.result_writer = result_writer
+            self.headless = headless
+            self.progress = progress
+            self.progress_years = progress_years
+            self.visualize = None
+            self.renderer = None
+            if render_workers is not None and not headless:
+                if self.img_base is None:
+                    raise ValueError("render_workers needs img_base")
+                from biosim.rendering import FrameRenderer
+                self.renderer = FrameRenderer(
+                    self.map, self.img_base, self.img_fmt, movie_fmt,
+                    ffmpeg_binary, max_workers=render_workers)
+            elif not headless:
+                # Imported here so headless runs never load matplotlib.
+                from biosim.visualize import Visualize
+                self.visualize = Visualize(
+                    self.map, frequency=2, years=200,
+                    img_dir=self.img_base, img_fmt=self.img_fmt,
+                    cmax_animals=self.cmax_animals, movie_fmt=movie_fmt,
+                    ffmpeg_binary=ffmpeg_binary)
             if self.img_base is not None:
                 self._image_counter = 0
                 self.vis_years = 1
@@ -115,31 +179,23 @@ class BioSim:
                             raise ValueError("Invalid landscape")
         return valid_string
 
-    @staticmethod
-    def set_animal_parameters(species, params):
+    def set_animal_parameters(self, species, params):
         """
-        Set parameters for animal species.
+        Set parameters for animal species. The parameters belong to this
+        simulation, other simulations in the same process keep theirs.
 
         :param species: String, name of animal species
         :param params: Dict with valid parameter specification for species
         """
-        valid_species = {'herbivore', 'carnivore'}
-        valid_parameters = ['w_birth', 'sigma_birth', 'beta', 'eta',
-                            'a_half', 'phi_age', 'w_half', 'phi_weight',
-                            'mu', 'lambda1', 'gamma', 'zeta', 'xi',
-                            'omega', 'F', 'DeltaPhiMax']
+        valid_species = {'herbivore': HERBIVORE, 'carnivore': CARNIVORE}
         species = species.lower()
         for key in params:
-            if (species in valid_species) and (key in valid_parameters):
-                if species == 'herbivore':
-                    setattr(Herbivore, key, params[key])
-                else:
-                    setattr(Carnivore, key, params[key])
-            else:
+            if not ((species in valid_species)
+                    and (key in Fauna.parameter_names)):
                 raise ValueError("Illegal animal parameter(s)")
+        self.map.set_animal_parameters(valid_species[species], params)
 
-    @staticmethod
-    def set_landscape_parameters(landscape, params):
+    def set_landscape_parameters(self, landscape, params):
         """
         Set parameters for landscape type.
 
@@ -147,48 +203,140 @@ class BioSim:
         :param params: Dict with valid parameter specification for landscape
         """
         for key, value in params.items():
-            if (landscape in {'J', 'S'}) \
-                    and (key in {'f_max', 'alpha'} and (value >= 0)):
-                if landscape == 'J':
-                    setattr(Cell, key[4], params[key])
-                else:
-                    setattr(Cell, key[3], params[key])
-            else:
+            if not ((key in Map.landscape_parameters.get(landscape, ()))
+                    and (value >= 0)):
                 raise ValueError("Illegal landscape parameter(s)")
+        self.map.set_landscape_parameters(landscape, params)
 
-    def simulate(self, num_years, vis_years=1, img_years=1):
+    def simulate(self, num_years, vis_years=1, img_years=1, flush=True):
         """
-        Run simulation while visualizing the result.
+        Run simulation while visualizing the result. In headless mode
+        nothing is drawn and vis_years and img_years are ignored.
 
         :param num_years: number of years to simulate
         :param vis_years: years between visualization updates
         :param img_years: years between visualizations saved to files
                (default: vis_years)
+        :param flush: writes the results kept by the result writer at the
+               end, so they are on disk without calling close
 
         Image files will be numbered consecutively.
         """
         self.vis_years = vis_years
+        if self.visualize is not None:
+            self.visualize.set_final_year(self._year + num_years)
+        if self.renderer is not None:
+            self.renderer.final_year = self._year + num_years
         current_simulation_year = 0
         while current_simulation_year < num_years:
-            print('Ingoing population: ', self.map.get_populations())
             self.map.yearly_cycle()
-            print("current_simulation_year", current_simulation_year + 1,
-                  " out of ", num_years)
             current_simulation_year += 1
             self._year += 1
             herbivores, carnivores, total = self.map.get_populations()
-            self._num_animals = total
-            self._num_animals_per_species = {'Carnivore': carnivores,
-                                             'Herbivore': herbivores}
-            self._animal_distribution = \
-                self.fill_animal_distribution_dataframe()
 
+            if current_simulation_year % self.progress_years == 0:
+                self.report_progress(herbivores, carnivores)
             if current_simulation_year % vis_years == 0:
-                self.visualize.update_graphics(self.map,
-                                               current_simulation_year)
-                self.visualize.save_graphics()
-            if self.save_csv is True:
-                self.save_mid_simulation_result(herbivores, carnivores, total)
+                if self.renderer is not None:
+                    self.renderer.submit(self._year, herbivores, carnivores,
+                                         *self.map.get_population_maps())
+                elif self.visualize is not None:
+                    self.visualize.update_graphics(self.map, self._year)
+                    self.visualize.save_graphics()
+            if self.result_writer is not None:
+                self.record_results(herbivores, carnivores)
+        if flush and self.result_writer is not None:
+            self.result_writer.flush()
+        if self.renderer is not None:
+            self.renderer.wait()
+
+    def record_results(self, herbivores, carnivores):
+        """
+        Passes the results of the last simulated year to the result writer,
+        with the count grids if the writer stores them.
+        :param herbivores: int
+        :param carnivores: int
+        """
+        if self.result_writer.grids:
+            herbivore_grid, carnivore_grid = self.map.get_population_maps()
+            self.result_writer.record(self._year, herbivores, carnivores,
+                                      herbivore_grid, carnivore_grid)
+        else:
+            self.result_writer.record(self._year, herbivores, carnivores)
+
+    def report_progress(self, herbivores, carnivores):
+        """
+        Reports the number of animals after the last simulated year, to the
+        progress function if one was given and to the log otherwise.
+        :param herbivores: int
+        :param carnivores: int
+        """
+        if self.progress is not None:
+            self.progress(self._year, herbivores, carnivores)
+        else:
+            logger.info('Year %d: %d herbivores, %d carnivores', self._year,
+                        herbivores, carnivores)
+
+    def save_checkpoint(self, path, compressed=False):
+        """
+        Saves the full state of the simulation to a .npz file: the map,
+        the fodder and landscape grids, every animal as columns of arrays,
+        the animal parameters, the year and the state of the random
+        generator. No objects are pickled.
+
+        :param path: String or path of the file
+        :param compressed: Boolean, compresses the arrays
+        """
+        herbivore, carnivore = self.map.animal_classes
+        metadata = {
+            'seed': self.seed if isinstance(self.seed, int) else None,
+            'columnar': self.map.population is not None,
+            'year': self._year,
+            'parameters': {
+                'Herbivore': {name: getattr(herbivore, name)
+                              for name in Fauna.parameter_names},
+                'Carnivore': {name: getattr(carnivore, name)
+                              for name in Fauna.parameter_names}},
+            'rng_state': self.rng.bit_generator.state,
+        }
+        save = np.savez_compressed if compressed else np.savez
+        save(path, island_map=np.array(self.island_map),
+             metadata=np.array(json.dumps(metadata)),
+             fodder=self.map.fodder, f_max=self.map.f_max,
+             alpha=self.map.alpha, **self.map.get_animal_arrays())
+
+    @classmethod
+    def load_checkpoint(cls, path, **options):
+        """
+        Creates a simulation from a file written by save_checkpoint. The
+        simulation continues exactly as the saved one would have, since
+        the state of the random generator is restored too.
+
+        :param path: String or path of the file
+        :param options: Further arguments to BioSim, such as headless. If
+               columnar is given, the animals are restored into that kind
+               of store instead of the one of the saved simulation
+        :return: BioSim
+        """
+        with np.load(path) as data:
+            metadata = json.loads(str(data['metadata']))
+            columnar = options.pop('columnar', metadata['columnar'])
+            sim = cls(str(data['island_map']), [], metadata['seed'],
+                      columnar=columnar, **options)
+            for species, params in metadata['parameters'].items():
+                sim.set_animal_parameters(species, params)
+            sim.map.fodder[:] = data['fodder']
+            sim.map.f_max[:] = data['f_max']
+            sim.map.alpha[:] = data['alpha']
+            for cell in sim.map.cell_map.ravel():
+                if cell.landscape in {3, 4}:
+                    cell.f_max = float(sim.map.f_max.flat[cell.index])
+            sim.map.add_animal_arrays(
+                {name: data[name] for name in ('species', 'age', 'weight',
+                                               'cell', 'have_mated')})
+        sim._year = metadata['year']
+        sim.rng.bit_generator.state = metadata['rng_state']
+        return sim
 
     def add_population(self, population):
         """
@@ -204,7 +352,32 @@ class BioSim:
             cell_pop = item['pop']
             if self.map.cell_map[i][j].landscape not in {2, 3, 4}:
                 raise ValueError("The cell is uninhabitable!")
-            self.map.cell_map[i][j].add_pop(cell_pop)
+            self.map.add_population((i, j), cell_pop)
+
+    def distribution_index(self):
+        """
+        Returns the row and column of every cell in row major order. The
+        arrays are built once and reused, since the map never changes
+        shape.
+        :return: (np.array, np.array)
+        """
+        if self._distribution_index is None:
+            self._distribution_index = np.divmod(
+                np.arange(self.map.n_rows * self.map.n_cols), self.map.n_cols)
+        return self._distribution_index
+
+    def animal_distribution_arrays(self):
+        """
+        Returns the number of herbivores and carnivores in each cell as a
+        dictionary of flat arrays with the same columns as
+        animal_distribution, without building a DataFrame.
+        :return: dict
+        """
+        row, col = self.distribution_index()
+        herbivores, carnivores = self.map.get_population_maps()
+        return {'Row': row, 'Col': col,
+                'Herbivore': herbivores.ravel().astype(int),
+                'Carnivore': carnivores.ravel().astype(int)}
 
     def fill_animal_distribution_dataframe(self):
         """
@@ -212,30 +385,8 @@ class BioSim:
         and carnivores in each cell.
         :return: dataframe.
         """
-        herbivores = []
-        carnivores = []
-        col = [j for _ in range(self.map.n_rows)
-               for j in range(self.map.n_cols)]
-
-        row = [j for j in range(self.map.n_rows)
-               for _ in range(self.map.n_cols)]
-
-        for row_index in range(self.map.n_rows):
-            for col_index in range(self.map.n_cols):
-                herbivores.append(self.map.cell_map[row_index][
-                                      col_index].number_herbivores())
-                carnivores.append(self.map.cell_map[row_index][
-                                      col_index].number_carnivores())
-
-        data2 = {
-                'Row': row,
-                'Col': col,
-                'Herbivore': herbivores,
-                'Carnivore': carnivores
-        }
-        df = pd.DataFrame(data2,
-                          columns=['Row', 'Col', 'Herbivore', 'Carnivore'])
-        return df
+        return pd.DataFrame(self.animal_distribution_arrays(),
+                            columns=['Row', 'Col', 'Herbivore', 'Carnivore'])
 
     @property
     def year(self):
@@ -245,32 +396,62 @@ class BioSim:
     @property
     def num_animals(self):
         """Total number of animals on island."""
-        return self._num_animals
+        return int(self.map.totals.sum())
 
     @property
     def num_animals_per_species(self):
         """Number of animals per species in island, as dictionary."""
-        return self._num_animals_per_species
+        herbivores, carnivores = self.map.totals.tolist()
+        return {'Carnivore': carnivores, 'Herbivore': herbivores}
 
     @property
     def animal_distribution(self):
         """
         Pandas DataFrame with animal count per species for each cell on island.
+        It is built from the count grids of the map when it is read, use
+        animal_distribution_arrays to get the counts without pandas.
         """
-        if self._animal_distribution.empty:
-            self._animal_distribution = \
-                self.fill_animal_distribution_dataframe()
-        return self._animal_distribution
+        return self.fill_animal_distribution_dataframe()
 
     def make_movie(self):
-        """Create MPEG4 movie from visualization images saved."""
+        """
+        Create MPEG4 movie from visualization images saved, or finish the
+        movie streamed while simulating. With render_workers, the worker
+        processes are stopped afterwards.
+        """
+        if self.renderer is not None:
+            try:
+                self.renderer.make_movie(movie_fmt='mp4')
+            finally:
+                self.close()
+            return
+        if self.visualize is None:
+            raise RuntimeError("No images are made in headless mode")
         self.visualize.make_movie(movie_fmt='mp4')
 
-    def save_mid_simulation_result(self, herbivores, carnivores, total):
-        """ Saves the mid simulation results to a CSV-file each year. """
-        with open('save mid simulation result', 'a', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow([self._year, herbivores, carnivores, total])
+    def close(self):
+        """
+        Writes the results still buffered by the result writer, stops
+        the worker processes of the FrameRenderer, if render_workers was
+        given, and stops ffmpeg if a streamed movie was not finished by
+        make_movie. make_movie stops the workers when the movie is
+        finished, and BioSim can be used in a with statement to do all of
+        this in any case. No more frames are drawn after the simulation is
+        closed.
+        """
+        if self.result_writer is not None:
+            self.result_writer.close()
+        if self.renderer is not None:
+            self.renderer.close()
+            self.renderer = None
+        if self.visualize is not None:
+            self.visualize.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
 
 if __name__ == '__main__':
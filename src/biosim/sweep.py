@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Hans Kristian Lunda, Mikko Rekstad'
+__email__ = 'hans.kristian.lunda@nmbu.no, mikkreks@nmbu.no'
+
+"""
+Parameter sweeps over the animal and landscape parameters. A sample is a
+dictionary with keys of the form 'Herbivore.F', 'Carnivore.DeltaPhiMax' or
+'J.f_max', that is a species name or a landscape letter, a dot, and the
+parameter name.
+"""
+
+from biosim.ensemble import simulate_replicate
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import itertools
+import numpy as np
+import os
+import pandas as pd
+
+
+def grid_samples(space):
+    """
+    Returns every combination of the given parameter values.
+    :param space: dict, parameter key to list of values
+    :return: list of dictionaries
+    """
+    keys = list(space)
+    return [dict(zip(keys, values))
+            for values in itertools.product(*space.values())]
+
+
+def latin_hypercube_samples(bounds, n_samples, seed=None):
+    """
+    Returns a Latin hypercube sample of the given parameter ranges. The
+    range of each parameter is split into n_samples equal strata, and every
+    stratum is used exactly once, in random order, with a uniformly drawn
+    value within it.
+    :param bounds: dict, parameter key to (low, high)
+    :param n_samples: int
+    :param seed: int
+    :return: list of dictionaries
+    """
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for key, (low, high) in bounds.items():
+        strata = rng.permutation(n_samples) + rng.random(n_samples)
+        columns[key] = low + strata / n_samples * (high - low)
+    return [{key: float(values[i]) for key, values in columns.items()}
+            for i in range(n_samples)]
+
+
+def split_sample(sample):
+    """
+    Splits a sample into animal and landscape parameters, in the form taken
+    by BioSim.set_animal_parameters and set_landscape_parameters.
+    :param sample: dict
+    :return: (dict, dict), species name and landscape letter to parameters
+    """
+    animal_parameters = {}
+    landscape_parameters = {}
+    for key, value in sample.items():
+        target, name = key.split('.')
+        if target.lower() in {'herbivore', 'carnivore'}:
+            animal_parameters.setdefault(target, {})[name] = value
+        else:
+            landscape_parameters.setdefault(target, {})[name] = value
+    return animal_parameters, landscape_parameters
+
+
+class Sweep:
+    """
+    Runs one simulation, or several replicates, for every sample of
+    parameters on a pool of worker processes. Every run gets its own random
+    stream, spawned from one numpy.random.SeedSequence. The results come
+    back as a tidy table with one row per run and year, streamed as the
+    runs finish.
+    """
+    def __init__(self, island_map, ini_pop, samples, seed, n_replicates=1,
+                 columnar=True):
+        """
+        :param island_map: Multi-line string specifying island geography
+        :param ini_pop: List of dictionaries specifying initial population
+        :param samples: List of parameter dicts, see grid_samples and
+               latin_hypercube_samples
+        :param seed: Integer used as seed for the whole sweep
+        :param n_replicates: Integer, number of runs of every sample
+        :param columnar: Boolean, runs on the columnar Population store
+        """
+        self.island_map = island_map
+        self.ini_pop = ini_pop
+        self.samples = samples
+        self.n_replicates = n_replicates
+        self.columnar = columnar
+        self.seeds = np.random.SeedSequence(seed).spawn(
+            len(samples) * n_replicates)
+
+    def results(self, num_years, max_workers=None):
+        """
+        Runs the sweep and yields the result of each run as soon as it
+        finishes, in the order they finish.
+        :param num_years: Integer, number of years to simulate
+        :param max_workers: Integer, number of worker processes, by default
+               one per core
+        :return: generator of DataFrames with the columns sample, replicate,
+                 the parameter keys, year, Herbivore and Carnivore
+        """
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {}
+            for run, seed in enumerate(self.seeds):
+                sample_index, replicate = divmod(run, self.n_replicates)
+                animal_parameters, landscape_parameters = split_sample(
+                    self.samples[sample_index])
+                future = executor.submit(
+                    simulate_replicate, self.island_map, self.ini_pop, seed,
+                    num_years, animal_parameters, landscape_parameters,
+                    self.columnar)
+                futures[future] = sample_index, replicate
+            for future in as_completed(futures):
+                sample_index, replicate = futures[future]
+                counts = future.result()
+                table = pd.DataFrame({
+                    'sample': sample_index, 'replicate': replicate,
+                    **self.samples[sample_index],
+                    'year': np.arange(1, num_years + 1),
+                    'Herbivore': counts[:, 0], 'Carnivore': counts[:, 1]})
+                yield table
+
+    def run(self, num_years, max_workers=None, path=None):
+        """
+        Runs the sweep and gathers all results in one table. If path is
+        given, the result of every run is also appended to that CSV file as
+        soon as it finishes, so the results of a long sweep are kept even
+        if it is stopped. The header is only written if the file is new or
+        empty, so several sweeps can be appended to one file.
+        :param num_years: Integer, number of years to simulate
+        :param max_workers: Integer, number of worker processes
+        :param path: String, CSV file to write to
+        :return: DataFrame sorted by sample, replicate and year
+        """
+        tables = []
+        for table in self.results(num_years, max_workers):
+            if path is not None:
+                new_file = not os.path.exists(path) \
+                    or os.path.getsize(path) == 0
+                table.to_csv(path, mode='a', header=new_file, index=False)
+            tables.append(table)
+        return pd.concat(tables).sort_values(
+            ['sample', 'replicate', 'year']).reset_index(drop=True)
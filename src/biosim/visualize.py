@@ -5,18 +5,155 @@ __email__ = 'hans.kristian.lunda@nmbu.no, mikkreks@nmbu.no'
 import matplotlib.pyplot as plt
 import matplotlib as mpl
 import matplotlib.colors as mcolors
+from biosim.history import History, decimate
 import numpy as np
 import seaborn as sb
 import subprocess
+import shutil
 import os
-import math
+
+# ffmpeg binary used for movies. If None, the BIOSIM_FFMPEG environment
+# variable is used, and then ffmpeg on the PATH.
+FFMPEG_BINARY = None
+
+
+def find_ffmpeg(binary=None):
+    """
+    Returns the ffmpeg binary to use, in order the given binary,
+    FFMPEG_BINARY, the BIOSIM_FFMPEG environment variable and ffmpeg on the
+    PATH.
+    :param binary: String, path or name of the ffmpeg binary
+    :return: String
+    """
+    binary = binary or FFMPEG_BINARY or os.environ.get('BIOSIM_FFMPEG')
+    path = shutil.which(binary or 'ffmpeg')
+    if path is None:
+        raise RuntimeError("ffmpeg not found, install it on the PATH or "
+                           "set BIOSIM_FFMPEG")
+    return path
+
+
+def _encoding_options(movie_fmt):
+    """
+    Returns the ffmpeg output options for a movie format. Parameters for
+    mp4 are chosen according to http://trac.ffmpeg.org/wiki/Encode/H.264,
+    section "Compatibility".
+    """
+    if movie_fmt == 'mp4':
+        return ['-profile:v', 'baseline', '-level', '3.0',
+                '-pix_fmt', 'yuv420p',
+                '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2']
+    return []
+
+
+def encode_images(img_base, img_fmt='png', movie_fmt='mp4', binary=None):
+    """
+    Encodes the numbered images img_base_00000.img_fmt, ... as the movie
+    img_base.movie_fmt.
+    :param img_base: String, beginning of the image file names
+    :param img_fmt: String, image file format
+    :param movie_fmt: String, movie format
+    :param binary: String, ffmpeg binary, see find_ffmpeg
+    :return:
+    """
+    try:
+        subprocess.check_call([find_ffmpeg(binary),
+                               '-i', '{}_%05d.{}'.format(img_base, img_fmt),
+                               '-y']
+                              + _encoding_options(movie_fmt)
+                              + ['{}.{}'.format(img_base, movie_fmt)])
+    except subprocess.CalledProcessError as err:
+        raise RuntimeError('ERROR: ffmpeg failed with: {}'.format(err))
+
+
+class MovieWriter:
+    """
+    Encodes a movie from frames given as RGBA buffers. One ffmpeg process
+    is started for the whole movie, and every frame is written to its
+    standard input as raw pixels, so no image files are written. close
+    finishes the movie, and terminate stops ffmpeg without finishing it.
+    Used in a with statement, the movie is finished unless an error was
+    raised, and ffmpeg is stopped in any case.
+    """
+    def __init__(self, filename, width, height, fps=25, binary=None):
+        """
+        :param filename: String, movie file, the suffix gives the format
+        :param width: Integer, frame width in pixels
+        :param height: Integer, frame height in pixels
+        :param fps: Integer, frames per second
+        :param binary: String, ffmpeg binary, see find_ffmpeg
+        """
+        self.filename = filename
+        self.width = width
+        self.height = height
+        movie_fmt = os.path.splitext(filename)[1].lstrip('.')
+        self._process = subprocess.Popen(
+            [find_ffmpeg(binary), '-y', '-loglevel', 'error',
+             '-f', 'rawvideo', '-pix_fmt', 'rgba',
+             '-s', '{}x{}'.format(width, height), '-r', str(fps),
+             '-i', '-'] + _encoding_options(movie_fmt) + [filename],
+            stdin=subprocess.PIPE)
+
+    def write_frame(self, frame):
+        """
+        Sends one frame to ffmpeg.
+        :param frame: Buffer of height x width x 4 bytes, e.g. the
+                      buffer_rgba of an Agg canvas
+        :return:
+        """
+        frame = np.asarray(frame)
+        if frame.shape != (self.height, self.width, 4):
+            raise ValueError("Frame of shape {} in a {}x{} movie".format(
+                frame.shape, self.width, self.height))
+        try:
+            self._process.stdin.write(frame.tobytes())
+        except BrokenPipeError:
+            self.close()
+
+    def close(self):
+        """
+        Ends the stream and waits for ffmpeg to finish the movie.
+        :return:
+        """
+        if not self._process.stdin.closed:
+            try:
+                self._process.stdin.close()
+            except BrokenPipeError:
+                pass
+        if self._process.wait() != 0:
+            raise RuntimeError('ERROR: ffmpeg failed with exit code {}'.format(
+                self._process.returncode))
+
+    def terminate(self):
+        """
+        Stops ffmpeg without finishing the movie, and waits for it to end.
+        :return:
+        """
+        if self._process.poll() is None:
+            self._process.terminate()
+        try:
+            self._process.stdin.close()
+        except BrokenPipeError:
+            pass
+        self._process.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+
 
 class Visualize(object):
     """Provides user interface for simulation, including visualization."""
     _DEFAULT_MOVIE_FORMAT = 'mp4'
 
     def __init__(self, map, frequency=10, ymax=10000, years=200, img_dir=None, img_name='biosim',
-                 img_fmt='png', cmax_animals=None):
+                 img_fmt='png', cmax_animals=None, movie_fmt=None,
+                 ffmpeg_binary=None, fps=25, fig=None):
         """
         :param sys_size:  system size, e.g. (5, 10)
         :type sys_size: (int, int)
@@ -28,10 +165,20 @@ class Visualize(object):
         :type img_dir: str
         :param img_name: beginning of name for image files
         :type img_name: str
-        :param img_fmt: image file format suffix, default 'png'
+        :param img_fmt: image file format suffix, default 'png', no images
+                        if None
         :type img_fmt: str
+        :param movie_fmt: if given, the saved frames are streamed to ffmpeg
+                          while simulating, as the movie img_dir.movie_fmt
+        :type movie_fmt: str
+        :param ffmpeg_binary: ffmpeg binary, see find_ffmpeg
+        :type ffmpeg_binary: str
+        :param fps: frames per second of the streamed movie
+        :type fps: int
+        :param fig: figure to draw in, e.g. one embedded in a GUI, by
+                    default a new pyplot figure
+        :type fig: matplotlib.figure.Figure
         """
-        self.i = years / frequency
         self._ymax = ymax
         self.frequency = frequency
         self.years = years
@@ -42,13 +189,17 @@ class Visualize(object):
         else:
             self._img_base = None
         self._img_fmt = img_fmt
+        self._movie_fmt = movie_fmt
+        self._ffmpeg_binary = ffmpeg_binary
+        self._fps = fps
+        self._movie_writer = None
 
         self._step = 0
         self._final_step = years
         self._img_ctr = 0
 
         # the following will be initialized by _setup_graphics
-        self._fig = None
+        self._fig = fig
         self._map_ax = None
         self._img_axis = None
         self._stats_ax = None
@@ -59,9 +210,12 @@ class Visualize(object):
         self._carnivore_line = None
         self._total_line = None
 
-        self._setup_graphics(map)
+        # History of the stats graph, herbivores, carnivores and total of
+        # every update.
+        self._history = History(3, capacity=years)
 
-        self.herbi = np.full(self._final_step, np.nan)
+        self._setup_graphics(map)
+        self._setup_blitting()
 
     def _setup_graphics(self, map):
         """
@@ -73,8 +227,8 @@ class Visualize(object):
         # create new figure window
         if self._fig is None:
             self._fig = plt.figure()
-            self._fig.subplots_adjust(left=None, bottom=None, right=None,
-                                      top=None, wspace=0.5, hspace=0.5)
+        self._fig.subplots_adjust(left=None, bottom=None, right=None,
+                                  top=None, wspace=0.5, hspace=0.5)
 
         # Add left subplot for images created with imshow().
         # We cannot create the actual ImageAxis object before we know
@@ -101,18 +255,15 @@ class Visualize(object):
 
         # Define the lines, and plot them.
         if self._herbivore_line is None:
-            stats_plot = self._stats_ax.plot(np.arange(0, self._final_step),
-                                           np.full(self._final_step, np.nan))
+            stats_plot = self._stats_ax.plot([], [])
             self._herbivore_line = stats_plot[0]
 
         if self._carnivore_line is None:
-            stats_plot = self._stats_ax.plot(np.arange(0, self._final_step),
-                                           np.full(self._final_step, np.nan))
+            stats_plot = self._stats_ax.plot([], [])
             self._carnivore_line = stats_plot[0]
 
         if self._total_line is None:
-            stats_plot = self._stats_ax.plot(np.arange(0, self._final_step),
-                                           np.full(self._final_step, np.nan))
+            stats_plot = self._stats_ax.plot([], [])
             self._total_line = stats_plot[0]
 
         # Creates herbivore heatmap
@@ -133,61 +284,139 @@ class Visualize(object):
                                self._total_line), ('Herbivores', 'Carnivores',
                                                    'Total'), prop={'size':6})
 
+    def _setup_blitting(self):
+        """
+        Prepares blitted drawing. The lines and heatmaps that change are
+        marked as animated, so they are left out when the figure is drawn.
+        The drawn figure, with the map and the axes, is then kept as a
+        background, and an update only restores it and draws the changed
+        artists on top. The background is taken again whenever the figure
+        is redrawn, for instance after a resize. Canvases that cannot blit
+        are redrawn in full instead.
+        """
+        canvas = self._fig.canvas
+        self._animated_artists = [self._herbivore_line, self._carnivore_line,
+                                  self._total_line, self.im_herbivore,
+                                  self.im_carnivore]
+        self._blit = canvas.supports_blit
+        for artist in self._animated_artists:
+            artist.set_animated(self._blit)
+        self._background = None
+        if self._blit:
+            canvas.mpl_connect('draw_event', self._on_draw)
+        if canvas.manager is not None:
+            # Only pyplot figures have a window of their own to show.
+            self._fig.show(warn=False)
+        canvas.draw()
+
+    def _on_draw(self, event):
+        """
+        Keeps the newly drawn figure as background, and draws the animated
+        artists on it.
+        """
+        self._background = self._fig.canvas.copy_from_bbox(self._fig.bbox)
+        self._draw_animated()
+
+    def _draw_animated(self):
+        """ Draws the animated artists on the canvas. """
+        for artist in self._animated_artists:
+            self._fig.draw_artist(artist)
+
+    def _redraw(self):
+        """
+        Shows the changed artists, by blitting them onto the background if
+        possible.
+        """
+        canvas = self._fig.canvas
+        if not self._blit:
+            canvas.draw_idle()
+        elif self._background is None:
+            canvas.draw()
+        else:
+            canvas.restore_region(self._background)
+            self._draw_animated()
+            canvas.blit(self._fig.bbox)
+        canvas.flush_events()
+
     def update_graphics(self, map, current_year):
         herbivore, carnivore, total = map.get_populations()
         self._update_stats_graph(herbivore, carnivore, current_year)
-        map.get_population_maps()
-        self._update_herbivore_spread(map.map_herbivores)
-        self._update_carnivore_spread(map.map_carnivores)
-        plt.pause(1e-2)
+        herbivores, carnivores = map.get_population_maps()
+        self._update_herbivore_spread(herbivores)
+        self._update_carnivore_spread(carnivores)
+        self._redraw()
 
+    def draw_snapshot(self, years, history, herbivores, carnivores):
+        """
+        Draws a snapshot of the simulation that is given instead of read
+        from a map, as done by the workers of a FrameRenderer.
+        :param years: np.array, years of the stats graph
+        :param history: np.array (years x 3), herbivores, carnivores and
+                        total of each year
+        :param herbivores: np.array, count grid of herbivores
+        :param carnivores: np.array, count grid of carnivores
+        :return:
+        """
+        self._set_history_lines(years, history)
+        self._update_herbivore_spread(herbivores)
+        self._update_carnivore_spread(carnivores)
+        self._redraw()
+
+    def set_final_year(self, final_year):
+        """
+        Sets the length of the x-axis of the stats graph. The whole figure
+        is redrawn, which also renews the background used for blitting.
+        :param final_year: int
+        :return:
+        """
+        self._final_step = final_year
+        self._stats_ax.set_xlim(0, final_year + 1)
+        self._fig.canvas.draw()
+
+    def _set_history_lines(self, years, history):
+        """
+        Gives the lines of the stats graph the history. A history longer
+        than the axis is wide in pixels is decimated, and the x-axis is
+        made twice as long when the history runs past it.
+        :param years: np.array
+        :param history: np.array (years x 3)
+        :return:
+        """
+        if len(years) > 0 and years[-1] > self._final_step:
+            final_year = max(self._final_step, 1)
+            while years[-1] > final_year:
+                final_year *= 2
+            self.set_final_year(final_year)
+        years, history = decimate(
+            years, history, self._stats_ax.get_window_extent().width)
+        self._herbivore_line.set_data(years, history[:, 0])
+        self._carnivore_line.set_data(years, history[:, 1])
+        self._total_line.set_data(years, history[:, 2])
+
+    def frame(self):
+        """
+        Returns the figure as it is shown.
+        :return: np.array (height x width x 4), RGBA pixels
+        """
+        if not self._blit:
+            self._fig.canvas.draw()
+        # The animated artists are only on the canvas, not in the figure,
+        # so the canvas buffer is used instead of savefig.
+        return np.asarray(self._fig.canvas.buffer_rgba())
 
     def _update_stats_graph(self, herbivore, carnivore, current_year):
         """
-        Updates the graphics for the stats.
+        Adds the numbers of one year to the history, and gives the lines of
+        the stats graph the updated history. The lines connect the years
+        that have been shown.
         :param herbivore: int
         :param carnivore: int
         :param current_year: int
         :return:
         """
-
-        # print(type(self._herbivore_line))
-        #print(herbivore, carnivore)
-
-        herbivore_data = self._herbivore_line.get_ydata()
-        carnivore_data = self._carnivore_line.get_ydata()
-        total_data = self._total_line.get_ydata()
-
-        # Converts nan values
-        added_herbivores = 0
-        added_carnivores = 0
-        for i in range(current_year):
-            if math.isnan(herbivore_data[i]):
-            # if herbivore_data[i] is NaN:
-                if added_herbivores == 0:
-                    herbivore_step = added_herbivores / self.frequency
-                    carnivore_step = added_carnivores / self.frequency
-                if i != 0:
-                    herbivore_data[i] = herbivore_data[i-1] + herbivore_step
-                    carnivore_data[i] = carnivore_data[i - 1] + carnivore_step
-                    total_data[i] = herbivore_data[i] + carnivore_data[i]
-
-
-
-        herbivore_data[current_year] = herbivore
-        carnivore_data[current_year] = carnivore
-        total_data[current_year] = herbivore + carnivore
-
-        #self.herbi[current_year] = herbivore
-
-        # print('herbivore_data', herbivore_data)
-
-
-        self._herbivore_line.set_ydata(herbivore_data)
-        self._carnivore_line.set_ydata(carnivore_data)
-        self._total_line.set_ydata(total_data)
-        plt.draw()
-        #self.i += 1
+        self._history.append(current_year,
+                             (herbivore, carnivore, herbivore + carnivore))
+        self._set_history_lines(self._history.years, self._history.values)
 
 
     def _update_herbivore_spread(self, map_herbivores):
@@ -202,43 +431,59 @@ class Visualize(object):
         #sb.heatmap(carnivore_spread, ax=self._carnivore_ax, cbar=False)
 
     def save_graphics(self):
-        """Saves graphics to file if file name given."""
+        """
+        Saves graphics to file if file name given, as an image and as a
+        frame of the streamed movie.
+        """
 
         if self._img_base is None:
             return
 
-        plt.savefig('{base}_{num:05d}.{type}'.format(base=self._img_base,
-                                                     num=self._img_ctr,
-                                                     type=self._img_fmt))
+        frame = self.frame()
+        if self._img_fmt is not None:
+            filename = '{base}_{num:05d}.{type}'.format(base=self._img_base,
+                                                        num=self._img_ctr,
+                                                        type=self._img_fmt)
+            plt.imsave(filename, frame)
+        if self._movie_fmt is not None:
+            if self._movie_writer is None:
+                height, width = frame.shape[:2]
+                self._movie_writer = MovieWriter(
+                    '{}.{}'.format(self._img_base, self._movie_fmt),
+                    width, height, self._fps, self._ffmpeg_binary)
+            self._movie_writer.write_frame(frame)
         self._img_ctr += 1
 
     def make_movie(self, movie_fmt=_DEFAULT_MOVIE_FORMAT):
         """
-        Creates MPEG4 movie from visualization images saved.
+        Creates MPEG4 movie from visualization images saved. If the frames
+        were streamed to ffmpeg, the stream is closed and the movie is
+        finished instead.
         .. :note:
             Requires ffmpeg
         The movie is stored as img_base + movie_fmt
         """
-        _FFMPEG_BINARY = 'C:\\Users\\Hans Kristian\\Downloads\\ffmpeg-20200115-0dc0837-win64-static\\ffmpeg-20200115-0dc0837-win64-static.ffmpeg.exe'
+        if self._movie_writer is not None:
+            self._movie_writer.close()
+            self._movie_writer = None
+            return
 
         if self._img_base is None:
             raise RuntimeError("No filename defined.")
+        if self._img_fmt is None:
+            raise RuntimeError("No images saved.")
 
-        if movie_fmt == 'mp4':
-            try:
-                # Parameters chosen according to http://trac.ffmpeg.org/wiki/Encode/H.264,
-                # section "Compatibility"
-                subprocess.check_call([_FFMPEG_BINARY,
-                                       '-i',
-                                       '{}_%05d.png'.format(self._img_base),
-                                       '-y',
-                                       '-profile:v', 'baseline',
-                                       '-level', '3.0',
-                                       '-pix_fmt', 'yuv420p',
-                                       '{}.{}'.format(self._img_base,
-                                                      movie_fmt)])
-            except subprocess.CalledProcessError as err:
-                raise RuntimeError('ERROR: ffmpeg failed with: {}'.format(err))
+        encode_images(self._img_base, self._img_fmt, movie_fmt,
+                      self._ffmpeg_binary)
+
+    def close(self):
+        """
+        Stops the ffmpeg process of a streamed movie that make_movie has not
+        finished, so it does not outlive the simulation.
+        """
+        if self._movie_writer is not None:
+            self._movie_writer.terminate()
+            self._movie_writer = None
 
 class PlotMap:
     map_colors = {
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Hans Kristian Lunda, Mikko Rekstad'
+__email__ = 'hans.kristian.lunda@nmbu.no, mikkreks@nmbu.no'
+
+"""
+Runs a BioSim simulation on a background thread, so a user interface can
+start, pause, resume and step it without waiting for the simulation. The
+worker thread is the only thread that touches the simulation. The
+interface reads snapshots from a mailbox and sends changes to the
+simulation as commands, which are run between two years.
+"""
+
+from biosim.history import History
+from concurrent.futures import Future
+import collections
+import queue
+import threading
+import time
+
+Snapshot = collections.namedtuple(
+    'Snapshot', ['year', 'years', 'history', 'herbivores', 'carnivores'])
+Snapshot.__doc__ = """
+State of the simulation after one year, as posted by a SimulationWorker.
+years and history are the totals of every simulated year, history has the
+columns herbivores, carnivores and total, and herbivores and carnivores are
+copies of the count grids.
+"""
+
+
+class SimulationWorker:
+    """
+    Simulates one year at a time on a daemon thread. Snapshots are posted
+    to snapshots, a queue holding only the newest one: if the interface has
+    not taken the last snapshot when a new one is posted, the old one is
+    dropped and counted in skipped. While running, a snapshot is posted at
+    most every min_interval seconds, so copying the grids never costs more
+    than the interface can show. The year before a pause, and every stepped
+    year, is always posted.
+    """
+    def __init__(self, sim, min_interval=0.04):
+        """
+        :param sim: BioSim object, preferably headless
+        :param min_interval: Float, seconds between snapshots while running
+        """
+        self.sim = sim
+        self.min_interval = min_interval
+        self.snapshots = queue.Queue(maxsize=1)
+        self.skipped = 0
+        self.error = None
+        self.history = History(3)
+        self._commands = queue.Queue()
+        self._condition = threading.Condition()
+        self._running = False
+        self._steps = 0
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def running(self):
+        """ True while years are simulated continuously. """
+        return self._running
+
+    def start(self):
+        """ Starts simulating continuously, same as resume. """
+        self.resume()
+
+    def pause(self):
+        """ Stops after the year being simulated. """
+        with self._condition:
+            self._running = False
+
+    def resume(self):
+        """ Simulates continuously until paused. """
+        with self._condition:
+            self._running = True
+            self._condition.notify()
+
+    def step(self, years=1):
+        """
+        Simulates the given number of years while paused.
+        :param years: int
+        :return:
+        """
+        with self._condition:
+            self._steps += years
+            self._condition.notify()
+
+    def call(self, function, *args):
+        """
+        Runs function(*args) on the worker thread between two years, for
+        changes to the simulation such as new parameters or animals.
+        :param function: callable
+        :return: concurrent.futures.Future with the result
+        """
+        future = Future()
+        with self._condition:
+            self._commands.put((future, function, args))
+            self._condition.notify()
+        return future
+
+    def stop(self, timeout=None):
+        """
+        Ends the worker thread after the year being simulated.
+        :param timeout: Float, seconds to wait for the thread
+        :return:
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._thread.join(timeout)
+
+    def _run(self):
+        """ Main loop of the worker thread. """
+        last_post = 0.0
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._stopped or self._running or self._steps > 0
+                    or not self._commands.empty())
+                if self._stopped:
+                    return
+                stepping = not self._running and self._steps > 0
+                if stepping:
+                    self._steps -= 1
+                simulate = self._running or stepping
+            if self._run_commands() and not simulate:
+                self._post()
+            if not simulate:
+                continue
+            try:
+                self.sim.simulate(1, flush=False)
+            except Exception as err:
+                self.error = err
+                with self._condition:
+                    self._running = False
+                    self._steps = 0
+                continue
+            herbivores, carnivores, total = self.sim.map.get_populations()
+            self.history.append(self.sim.year,
+                                (herbivores, carnivores, total))
+            now = time.monotonic()
+            if now - last_post >= self.min_interval or not self._running:
+                self._post()
+                last_post = now
+
+    def _run_commands(self):
+        """
+        Runs the queued commands.
+        :return: True if any command was run
+        """
+        ran = False
+        while not self._commands.empty():
+            future, function, args = self._commands.get()
+            ran = True
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(function(*args))
+            except Exception as err:
+                future.set_exception(err)
+        return ran
+
+    def _post(self):
+        """
+        Puts a snapshot of the simulation in the mailbox, replacing the one
+        there if the interface has not taken it. The rows of the history do
+        not change once added, so views of it are posted.
+        """
+        herbivores, carnivores = self.sim.map.get_population_maps()
+        snapshot = Snapshot(self.sim.year, self.history.years,
+                            self.history.values, herbivores.copy(),
+                            carnivores.copy())
+        try:
+            self.snapshots.put_nowait(snapshot)
+        except queue.Full:
+            try:
+                self.snapshots.get_nowait()
+                self.skipped += 1
+            except queue.Empty:
+                pass
+            self.snapshots.put_nowait(snapshot)
@@ -1,5 +1,6 @@
-from biosim.fauna import Fauna, Herbivore, Carnivore
+from biosim.fauna import Fauna, Herbivore, Carnivore, fallback_rng
 from biosim.cell import Cell, Jungle, Ocean, Mountain, Savannah, Desert
+from biosim.map import Map
 import numpy as np
 
 __author__ = 'Hans Kristian Lunda, Mikko Rekstad'
@@ -116,6 +117,17 @@ class TestCell:
         test_savannah.add_fodder()
         assert test_savannah.fodder == 153.0
 
+    def test_fallback_rng(self):
+        """
+        Test that cells outside a map share the one fallback generator, and
+        that a map gives its cells its own generator.
+        """
+        rng = np.random.default_rng(3)
+        island = Map("OOO\nOJO\nOOO", rng=rng)
+        assert Jungle().rng is fallback_rng()
+        assert Jungle().rng is Fauna.rng
+        assert all(cell.rng is rng for cell in island.cell_map.ravel())
+
     def test_get_fodder(self):
         """ Test that get_fodder returns the correct amount of fodder. """
         assert self.test_cell.get_fodder() == 800
@@ -200,6 +212,32 @@ class TestCell:
         for i in range(1, len(weight)):
             assert test_cell.population_herbivores[i].weight == weight2[i]
 
+    def test_feed_all_herbivores(self, test=test2):
+        """
+        Will test that the fittest herbivores eat first when there is not
+        enough fodder for everyone, and that the fodder is used up.
+        :param test: dict
+        :return:
+        """
+        test_cell = Jungle()
+        for item in test:
+            test_cell.add_pop(item['pop'])
+        test_cell.fodder = 25
+        weight = {id(creature): creature.weight
+                  for creature in test_cell.population_herbivores}
+        fitness = {id(creature): creature.fitness
+                   for creature in test_cell.population_herbivores}
+        test_cell.feed_all_herbivores()
+        assert test_cell.fodder == 0
+        gained = [test_cell.population_herbivores[i].weight
+                  - weight[id(test_cell.population_herbivores[i])]
+                  for i in range(test_cell.number_herbivores())]
+        assert gained[:3] == [9, 9, 0.9 * 5]
+        assert gained[3:] == [0, 0, 0]
+        ranked = sorted(fitness, key=fitness.get, reverse=True)
+        assert [id(creature) for creature
+                in test_cell.population_herbivores] == ranked
+
     def test_feed_carnivore(self, test=test2):
         """
         This function will test that the carnivore will not eat if there is no
@@ -231,6 +269,7 @@ class TestCell:
                                     'weight': 6}]
 
         test_cell.add_pop(test_carnivore)
+        test_cell.rng = np.random.default_rng(5)
         test_cell.feed_carnivores()
         assert len(test_cell.population_herbivores) == 4
 
@@ -280,6 +319,7 @@ class TestCell:
         for item in test:
             cell_pop = item['pop']
         test_cell = Jungle()
+        test_cell.rng = np.random.default_rng(1)
         test_cell.add_pop(cell_pop)
         test_cell.mating_season()
         assert test_cell.number_herbivores() != 6
@@ -0,0 +1,119 @@
+__author__ = 'Hans Kristian Lunda, Mikko Rekstad'
+__email__ = 'hans.kristian.lunda@nmbu.no, mikkreks@nmbu.no'
+
+"""
+This file is used for testing the compiled kernels, they are skipped when
+numba is not installed.
+"""
+
+import pytest
+
+pytest.importorskip('numba')
+
+from biosim import compiled
+from biosim.map import Map
+from biosim.population import Population
+import numpy as np
+
+
+class TestCompiled:
+
+    def test_feed_herbivores(self):
+        """
+        Will test that herbivores eat in the given order until the fodder of
+        their cell is gone.
+        :return:
+        """
+        fodder = np.array([25.0, 5.0])
+        weight = np.zeros(4)
+        compiled.feed_herbivores(np.array([1, 0, 2, 3]),
+                                 np.array([0, 0, 0, 1]), fodder, weight,
+                                 10.0, 0.5)
+        assert list(weight) == [5.0, 5.0, 2.5, 2.5]
+        assert list(fodder) == [0.0, 0.0]
+
+    def test_hunt_cells(self):
+        """
+        Will test that a very fit carnivore kills weak herbivores until it
+        has eaten its appetite, and never kills fitter herbivores.
+        :return:
+        """
+        fitness = np.array([0.0, 0.0, 0.0, 1.0, 1.0])
+        weight = np.array([30.0, 30.0, 30.0, 20.0, 20.0])
+        alive = compiled.hunt_cells(
+            np.array([4]), np.array([0, 1, 2, 3]), np.array([[0, 1]]),
+            np.array([[0, 4]]), fitness, weight, 50.0, 1e-9, 1.0,
+            np.random.default_rng(1))
+        assert list(alive) == [False, False, True, True, True]
+        assert weight[4] == 70
+
+    def test_births(self):
+        """
+        Will test that only eligible creatures give birth, and that they
+        always do when the probability is 1.
+        :return:
+        """
+        mothers, birth_weight = compiled.births(
+            np.ones(3), np.array([50.0, 1.0, 50.0]), np.array([1, 1, 0]),
+            np.zeros(3, dtype=bool), np.array([10, 10, 10]), 1.0, 1.0, 8.0,
+            1.0, np.random.default_rng(1))
+        assert list(mothers) == [0]
+        assert (birth_weight > 0).all()
+
+    def test_migrate(self):
+        """
+        Will test that creatures that are sure to migrate move to the only
+        open neighbour, and that the others stay.
+        :return:
+        """
+        neighbours = np.array([[1, -1, -1, -1], [-1, -1, 0, -1]])
+        probabilities = np.zeros((2, 2, 4))
+        probabilities[:, 0, 0] = 1
+        probabilities[:, 1, 2] = 1
+        new_cell = compiled.migrate(
+            np.array([0, 1, 0]), np.array([0, 0, 1], dtype=np.int8),
+            np.ones(3), np.array([2.0, 0.0]), probabilities, neighbours,
+            np.random.default_rng(1))
+        assert list(new_cell) == [1, 0, 0]
+
+    def test_dies(self):
+        """
+        Will test that creatures with zero fitness always die and that
+        creatures with omega 0 and positive fitness never do.
+        :return:
+        """
+        dead = compiled.dies(np.array([0.0, 0.5, 0.5]),
+                             np.array([0.0, 0.0, 1e9]),
+                             np.random.default_rng(1))
+        assert list(dead) == [True, False, True]
+
+    def test_engines_agree(self):
+        """
+        Will test that the compiled and the NumPy engine give populations of
+        the same size on average, after a few years on a small island.
+        :return:
+        """
+        sizes = {}
+        for use_numba in (True, False):
+            totals = []
+            for seed in range(5):
+                island = Map("OOOOO\nOJJSO\nOJJJO\nOOOOO", columnar=True,
+                             rng=np.random.default_rng(seed),
+                             use_numba=use_numba)
+                island.add_population((1, 1), [
+                    {'species': 'herbivore', 'age': 5, 'weight': 20}] * 50
+                    + [{'species': 'carnivore', 'age': 5, 'weight': 20}] * 5)
+                for _ in range(10):
+                    island.yearly_cycle()
+                totals.append(len(island.population))
+            sizes[use_numba] = np.mean(totals)
+        assert sizes[True] == pytest.approx(sizes[False], rel=0.3)
+
+    def test_use_numba(self):
+        """
+        Will test that the compiled kernels are chosen by default when numba
+        is installed.
+        :return:
+        """
+        assert Population(2, 2).use_numba
+        assert not Population(2, 2, use_numba=False).use_numba
@@ -0,0 +1,39 @@
+__author__ = 'Hans Kristian Lunda, Mikko Rekstad'
+__email__ = 'hans.kristian.lunda@nmbu.no, mikkreks@nmbu.no'
+
+"""
+This file is used for testing of the ensemble runner.
+"""
+
+from biosim.ensemble import Ensemble, simulate_replicate
+import numpy as np
+
+
+class TestEnsemble:
+    island_map = "OOOOO\nOJJSO\nOJJJO\nOOOOO"
+    ini_pop = [{'loc': (1, 1),
+                'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}]
+                * 20}]
+
+    def test_simulate_replicate(self):
+        """
+        Will test that a replicate returns the counts after every year.
+        :return:
+        """
+        counts = simulate_replicate(self.island_map, self.ini_pop, 1, 4)
+        assert counts.shape == (4, 2)
+        assert (counts[:, 0] > 0).all()
+        assert (counts[:, 1] == 0).all()
+
+    def test_run(self):
+        """
+        Will test that the ensemble gathers replicate x year x species
+        counts, that the replicates differ, and that the same seed gives
+        the same ensemble.
+        :return:
+        """
+        results = [Ensemble(self.island_map, self.ini_pop, 7, 3).run(
+            5, max_workers=2) for _ in range(2)]
+        assert results[0].shape == (3, 5, 2)
+        assert np.array_equal(results[0], results[1])
+        assert not np.array_equal(results[0][0], results[0][1])
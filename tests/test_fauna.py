@@ -7,6 +7,7 @@ import mock
 import unittest
 from biosim.fauna import Fauna, Herbivore, Carnivore
 import pytest
+from math import exp
 
 class TestFauna:
     """
@@ -102,7 +103,7 @@ class TestFauna:
         assert test_creature1.death()
         # Will now test some statistics.
         test_creature2 = Herbivore(age=10, weight=100)
-        assert not test_creature2.death()
+        assert not test_creature2.death(0.5)
         test_creature3 = Herbivore(age=10, weight=15)
         # assert test_creature3.fitness == 0
         # assert test_creature3.death()
@@ -113,7 +114,8 @@ class TestFauna:
         # We know that the death number is ≈ 0.45, and survival chance is 0.85
         # And therefore want to test that the creature survives.
         test_creature4 = Herbivore(age=10, weight=15)
-        assert not test_creature4.death()
+        assert not test_creature4.death(0.45)
+        assert test_creature4.death(0.9)
 
     @mock.patch("fauna.random", return_value=0.5, autospec=True)
     def test_wants_to_migrate(self, mock_randint):
@@ -129,7 +131,7 @@ class TestFauna:
         :return:
         """
         test_creature1 = Herbivore(age, weight)
-        assert test_creature1.wants_to_migrate() is False
+        assert test_creature1.wants_to_migrate(0.5) is False
 
 
 class TestHerbivores:
@@ -147,6 +149,35 @@ class TestHerbivores:
         test_herbivore = Herbivore(weight=10, age=40)
         assert test_herbivore.fitness == 0.25
 
+    def test_fitness_cache(self):
+        """
+        Will test that the cached fitness is recomputed when the age or the
+        weight of the creature changes.
+        :return:
+        """
+        test_herbivore = Herbivore(weight=10, age=40)
+        assert test_herbivore.fitness == 0.25
+        test_herbivore.weight += 10
+        assert test_herbivore.fitness > 0.25
+        fitness = test_herbivore.fitness
+        test_herbivore.age += 10
+        assert test_herbivore.fitness < fitness
+
+    def test_batch_fitness(self):
+        """
+        Will test that the vectorized fitness gives the same result as the
+        fitness property, also for creatures with zero weight.
+        :return:
+        """
+        creatures = [Herbivore(weight=10, age=40), Herbivore(weight=0, age=2),
+                     Carnivore(weight=25, age=5), Herbivore(weight=35, age=3)]
+        expected = [creature.fitness for creature in creatures]
+        for creature in creatures:
+            creature.weight = creature.weight
+        Fauna.batch_fitness(creatures)
+        for creature, fitness in zip(creatures, expected):
+            assert creature._fitness == pytest.approx(fitness)
+
 class TestCarnivores:
     """
     Will test properties special for carnivores.
@@ -185,6 +216,16 @@ class TestCarnivores:
         test_carnivore = Carnivore(weight=25, age=5)
         assert test_carnivore.fitness >= 0.999
 
+    def test_carnivore_phi_age(self):
+        """
+        Will test that the fitness of an old carnivore falls off with
+        phi_age 0.8, as for the carnivores of the original model.
+        :return:
+        """
+        test_carnivore = Carnivore(weight=1000, age=65)
+        assert Carnivore.phi_age == 0.8
+        assert test_carnivore.fitness == pytest.approx(1 / (1 + exp(4.0)))
+
     def test_eat(self):
         """
         This test will check that the eat function increases if the creature
@@ -0,0 +1,52 @@
+__author__ = 'Hans Kristian Lunda, Mikko Rekstad'
+__email__ = 'hans.kristian.lunda@nmbu.no, mikkreks@nmbu.no'
+
+"""
+This file is used for testing of the History of the stats graph.
+"""
+
+from biosim.history import History
+import numpy as np
+
+
+class TestHistory:
+
+    def test_append_past_capacity(self):
+        """
+        Will test that the history grows past its first capacity and keeps
+        every year.
+        :return:
+        """
+        history = History(3, capacity=4)
+        for year in range(10):
+            history.append(year, (year, 2 * year, 3 * year))
+        assert len(history) == 10
+        assert list(history.years) == list(range(10))
+        assert list(history.values[:, 1]) == [2 * year for year in range(10)]
+
+    def test_decimated_keeps_extremes(self):
+        """
+        Will test that a long history is reduced to two points per bin,
+        and that the highest and lowest values are kept.
+        :return:
+        """
+        history = History(1)
+        values = np.sin(np.arange(10000) / 50)
+        values[1234] = 5
+        for year, value in enumerate(values):
+            history.append(year, (value,))
+        years, decimated = history.decimated(100)
+        assert len(years) == len(decimated) == 200
+        assert decimated.max() == 5
+        assert decimated.min() == values.min()
+        assert np.all(np.diff(years) >= 0)
+
+    def test_short_history_is_not_decimated(self):
+        """
+        Will test that a history shorter than the axis is drawn as it is.
+        :return:
+        """
+        history = History(1)
+        history.append(1, (4,))
+        years, values = history.decimated(100)
+        assert list(years) == [1] and list(values[:, 0]) == [4]
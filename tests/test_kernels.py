@@ -0,0 +1,102 @@
+__author__ = 'Hans Kristian Lunda, Mikko Rekstad'
+__email__ = 'hans.kristian.lunda@nmbu.no, mikkreks@nmbu.no'
+
+"""
+This file is used for testing of the vectorized kernels.
+"""
+
+from biosim.kernels import share_fodder, hunt, dies, births
+import numpy as np
+
+
+class TestShareFodder:
+
+    def test_single_cell(self):
+        """
+        Will test that creatures eat in order until the fodder runs out,
+        and that the last one gets what is left.
+        :return:
+        """
+        eaten = share_fodder(25.0, np.full(4, 10.0))
+        assert list(eaten) == [10, 10, 5, 0]
+
+    def test_grouped_cells(self):
+        """
+        Will test that the fodder of each cell is only shared among the
+        creatures in that cell.
+        :return:
+        """
+        fodder = np.array([15.0, 0.0, 100.0])
+        cells = np.array([0, 0, 2, 2, 2])
+        eaten = share_fodder(fodder, np.full(5, 10.0), cells)
+        assert list(eaten) == [10, 5, 10, 10, 10]
+
+
+class TestHunt:
+
+    def test_stops_when_full(self):
+        """
+        Will test that a carnivore that always succeeds stops killing once
+        it has eaten its appetite, and that the next carnivore gets the
+        rest.
+        :return:
+        """
+        eaten, killed = hunt(np.array([1.0, 0.9]), np.zeros(4),
+                             np.full(4, 20.0), 50.0, 1e-9,
+                             np.random.default_rng(1))
+        assert list(eaten) == [50, 20]
+        assert killed.all()
+
+    def test_fitter_herbivores_are_safe(self):
+        """
+        Will test that herbivores at least as fit as the carnivore are never
+        killed.
+        :return:
+        """
+        eaten, killed = hunt(np.array([0.5]), np.array([0.1, 0.5, 0.9]),
+                             np.full(3, 1.0), 50.0, 1e-9,
+                             np.random.default_rng(1))
+        assert list(killed) == [True, False, False]
+        assert eaten[0] == 1
+
+
+class TestDies:
+
+    def test_death_mask(self):
+        """
+        Will test that creatures with zero fitness always die, and that the
+        rest die when the death number is above the survival chance.
+        :return:
+        """
+        fitness = np.array([0.0, 0.5, 0.5, 1.0])
+        death_numbers = np.array([0.0, 0.7, 0.9, 0.99])
+        dead = dies(fitness, 0.4, death_numbers)
+        assert list(dead) == [True, False, True, False]
+
+
+class TestBirths:
+
+    def test_only_eligible_parents_give_birth(self):
+        """
+        Will test that creatures that are too light, newborn or have mated
+        never give birth, and that the rest do when the probability is 1.
+        :return:
+        """
+        weight = np.array([40.0, 20.0, 40.0, 40.0])
+        age = np.array([5, 5, 0, 5])
+        have_mated = np.array([False, False, False, True])
+        mothers, birth_weight = births(np.ones(4), weight, age, have_mated,
+                                       10, 0.2, 3.5, 8.0, 1.5,
+                                       np.random.default_rng(1))
+        assert list(mothers) == [0]
+        assert len(birth_weight) == 1 and birth_weight[0] > 0
+
+    def test_alone_in_cell(self):
+        """
+        Will test that a creature alone in its cell does not give birth.
+        :return:
+        """
+        mothers, _ = births(np.ones(2), np.full(2, 40.0), np.full(2, 5),
+                            np.zeros(2, dtype=bool), np.array([1, 1]), 0.2,
+                            3.5, 8.0, 1.5, np.random.default_rng(1))
+        assert len(mothers) == 0
@@ -5,8 +5,10 @@ __email__ = 'hans.kristian.lunda@nmbu.no, mikkreks@nmbu.no'
 from biosim.fauna import Fauna
 from biosim.cell import Cell, Jungle, Ocean, Mountain, Savannah, Desert
 from biosim.map import Map
+from biosim.population import HERBIVORE
 from biosim.simulation import BioSim
-import mock
+import numpy as np
+import pytest
 import unittest
 
 # Testing the operations within a function
@@ -42,11 +44,11 @@ class TestMap(unittest.TestCase):
                      {'species': 'herbivore', 'age': 5, 'weight': 40},
                      {'species': 'herbivore', 'age': 15, 'weight': 25}]}]
 
-    map = Map(map_string)
+    map = Map(map_string, rng=np.random.default_rng(1))
 
     def setUp(self, test=test, map_string=map_string):
         print('SetUP')
-        self.map2 = Map(map_string)
+        self.map2 = Map(map_string, rng=np.random.default_rng(2))
         for item in test:
            i, j = item['loc']
            cell_pop = item['pop']
@@ -87,17 +89,19 @@ class TestMap(unittest.TestCase):
         assert self.map2.cell_map[10][10].adjacent_cells2 == [(11,10),(10,11),
                                                        (9,10),(10,9)]
 
-    def test_preferred_list_middle_of_jungle(self, map=map):
+    def test_preferred_list_middle_of_jungle(self):
         """
         We will now test that the list of preferrence displays the correct
         probabilities for herbivores when surrounded by jungle.
+        Probabilities are only computed for cells with creatures.
         !!! Remember to enable parameter change to attractiveness func...
-        :param map: object
         :return:
         """
-        map.update_preferred_locations()
-        assert map.cell_map[8][6].probability_herbivores == [0.25, 0.25, 0.25,
-                                                            0.25]
+        island = Map(self.map_string, rng=np.random.default_rng(6))
+        island.add_population((8, 6), self.test[0]['pop'][:1])
+        island.update_preferred_locations()
+        assert island.cell_map[8][6].probability_herbivores == [0.25, 0.25,
+                                                               0.25, 0.25]
         # assert map.cell_map[8][6].herbivore_preferrence == [0.25, 0.25, 0.25, 0.25]
 
     def test_doesnt_prefere_unhabitable_cells(self, map=map):
@@ -113,97 +117,64 @@ class TestMap(unittest.TestCase):
         sim.map.migration()
         assert sim.map.cell_map[1][1].number_herbivores() == 1
 
-
-    #mock.patch("biosim.map.choice", return_value=1, autospec=True)
-    @mock.patch("biosim.map.choice", return_value=1, autospec=True)
-    def test_select_index_to_move(self, mock_choice, map=map):
-        probabilities_index_test = [0, 0.25, 0.75, 0.25]
-        index = map.select_index_to_move(probabilities_index_test)
-        assert index == 1
-        mock_choice.assert_called_once_with(1)
-
-    def test_migration(self, map=map_string, pop2=test_both):
+    def test_migration(self, pop2=test_both):
         """
-        Will test that herbivores are removed from old cell, and that there
-        are more in another cell.
+        Will test that herbivores sure to migrate all leave their cell, and
+        are split over its four neighbours without any being lost.
 
-        Also tests that carnivores does not move when there are no herbivores
-        nextdoor.
-        :param map:
-        :param pop:
+        Also tests that carnivores with no herbivores nearby have no reason
+        to prefer any neighbour, so they are equally likely to go each way.
+        :param pop2:
         :return:
         """
-        assert self.map2.cell_map[10][10].number_herbivores() == 6
+        neighbours = [(11, 10), (10, 11), (9, 10), (10, 9)]
+        for herbivore in self.map2.cell_map[10][10].population_herbivores:
+            herbivore.mu = 1e6
         self.map2.migration()
-        assert self.map2.cell_map[10][10].number_herbivores() != 6
-
-        # Now adds population with both species.
+        assert self.map2.cell_map[10][10].number_herbivores() == 0
+        assert sum(self.map2.cell_map[i][j].number_herbivores()
+                   for i, j in neighbours) == 6
+        for i, j in neighbours:
+            for herbivore in self.map2.cell_map[i][j].population_herbivores:
+                assert herbivore.have_migrated
+
+        # Now adds carnivores far away from the herbivores.
+        island = Map(self.map_string, rng=np.random.default_rng(4))
         for item in pop2:
             i, j = item['loc']
-            cell_pop2 = item['pop']
-            self.map2.cell_map[i][j].add_pop(cell_pop2)
+            island.cell_map[i][j].add_pop(item['pop'][:3])
+        island.update_preferred_locations()
+        assert island.cell_map[10][10].probability_carnivores == [0.25] * 4
 
-        # Now there are only creatures in 10, 10, so they should now move
-        assert self.map2.cell_map[10][10].number_carnivores() == 3
-        self.map2.migration()
-        assert self.map2.cell_map[10][10].number_carnivores() == 3
-
-    def test_carnivores_follow_herbivores(self, map1=map):
+    def test_carnivores_follow_herbivores(self):
         """
-        NB! This test might be redundant, carnivores can still move even though
-        there are no adjacent herbivores....
-        First we create a big population of both species. Now we test that the
-        carnivores does not move after first call of migration.
-        The next call we can expect that the population of carnivores in the
-        starting cell has changed. We will do this with a mock. OR HIGH POPS.
+        Will test that carnivores move towards herbivores. A big population
+        of herbivores next door to the east gives that cell a far larger
+        abundance of food than the other neighbours, so carnivores sure to
+        migrate all go there. Since creatures move at the same time, the
+        herbivores leaving that cell in the same year does not matter.
         :return:
         """
         n_herbs = 1000
-        n_carns = 1000
-        ini_herbs = [
-            {
-                "loc": (10, 10),
-                "pop": [
-                    {"species": "Herbivore", "age": 5, "weight": 20}
-                    for _ in range(n_herbs)
-                ],
-            },
-        ]
-
-        ini_carns = [
-            {
-                "loc": (10, 10),
-                "pop": [
-                    {"species": "Carnivore", "age": 5, "weight": 20}
-                    for _ in range(n_carns)
-                ],
-            }
-        ]
-
-        for item in ini_herbs:
-            i, j = item['loc']
-            cell_herbivores = item['pop']
-            map1.cell_map[i][j].add_pop(cell_herbivores)
-
-        for item in ini_carns:
-            i, j = item['loc']
-            cell_carnivores = item['pop']
-            map1.cell_map[i][j].add_pop(cell_carnivores)
+        n_carns = 100
+        island = Map(self.map_string, rng=np.random.default_rng(5))
+        island.add_population(
+            (10, 11), [{"species": "Herbivore", "age": 5, "weight": 20}
+                       for _ in range(n_herbs)])
+        island.add_population(
+            (10, 10), [{"species": "Carnivore", "age": 5, "weight": 20}
+                       for _ in range(n_carns)])
+        for carnivore in island.cell_map[10][10].population_carnivores:
+            carnivore.mu = 1e6
 
         # Make sure that the correct amount is at first.
-        assert map1.get_populations() == (n_herbs, n_carns, n_herbs + n_carns)
-        assert map1.cell_map[10][10].number_carnivores() == n_carns
-        assert map1.cell_map[10][10].number_herbivores() == n_herbs
-        # Make sure that only herbivores move first round.
-        map1.migration()
-        assert map1.cell_map[10][10].number_carnivores() == n_carns
-        assert map1.cell_map[10][10].number_herbivores() != n_herbs
-        # Looks like carnivores follow herbivores straight away, easy fix if we
-        # want to, just switch order, think we will keep it.
-        # Make sure that both populations are different that initially
-        map1.migration()
-        assert map1.cell_map[10][10].number_carnivores() != n_carns
-        assert map1.cell_map[10][10].number_herbivores() != n_herbs
+        assert island.get_populations() == (n_herbs, n_carns,
+                                            n_herbs + n_carns)
+        island.migration()
+        assert island.cell_map[10][10].number_carnivores() == 0
+        assert island.cell_map[10][11].number_carnivores() == n_carns
+        assert island.get_populations() == (n_herbs, n_carns,
+                                            n_herbs + n_carns)
 
     def test_reset_migration_mated(self):
         """
@@ -239,3 +210,150 @@ class TestMap(unittest.TestCase):
         self.map2.yearly_cycle()
         # Tests that there are a different number of creatures.
         assert pop_before != self.map2.get_populations()
+
+    def test_fodder_grid(self):
+        """
+        Will test that the cells read their fodder from the fodder grid,
+        and that the grid regrows jungle and savannah in one operation.
+        :return:
+        """
+        assert self.map2.fodder.shape == self.map2.map_matrix.shape
+        assert self.map2.cell_map[10][10].fodder == 800
+        assert self.map2.cell_map[2][1].fodder == 300
+        assert self.map2.cell_map[0][0].fodder == 0
+        self.map2.cell_map[10][10].fodder = 5
+        self.map2.cell_map[2][1].fodder = 0
+        assert self.map2.fodder[10, 10] == 5
+        self.map2.grow_fodder()
+        assert self.map2.cell_map[10][10].fodder == 800
+        assert self.map2.cell_map[2][1].fodder == 90
+        assert self.map2.fodder[5, 9] == 0
+
+    def test_set_landscape_parameters(self):
+        """
+        Will test that new landscape parameters are used by the grid.
+        :return:
+        """
+        self.map2.set_landscape_parameters('J', {'f_max': 700})
+        self.map2.set_landscape_parameters('S', {'alpha': 0.5})
+        self.map2.cell_map[2][1].fodder = 0
+        self.map2.grow_fodder()
+        assert self.map2.cell_map[10][10].fodder == 700
+        assert self.map2.cell_map[2][1].fodder == 150
+
+    def test_unused_landscape_parameters(self):
+        """
+        Will test that parameters a landscape does not use are refused.
+        :return:
+        """
+        with pytest.raises(ValueError):
+            self.map2.set_landscape_parameters('J', {'alpha': 0.5})
+        with pytest.raises(ValueError):
+            self.map2.set_landscape_parameters('S', {'gamma': 0.5})
+
+    def test_neighbour_table(self):
+        """
+        Will test that the neighbour table holds the flat index of the
+        adjacent cells in the order of adjacent_cells2, and -1 for
+        uninhabitable neighbours. Cell (1, 8) is savannah with jungle to the
+        south, mountain to the east and ocean elsewhere.
+        :return:
+        """
+        n_cols = self.map2.n_cols
+        expected = [11 * n_cols + 10, 10 * n_cols + 11, 9 * n_cols + 10,
+                    10 * n_cols + 9]
+        assert list(self.map2.neighbours[10 * n_cols + 10]) == expected
+        assert list(self.map2.neighbours[1 * n_cols + 8]) == [2 * n_cols + 8,
+                                                              -1, -1, -1]
+
+    def test_probabilities_avoid_unhabitable_cells(self):
+        """
+        Will test that creatures on the coast only get probabilities for
+        moving to habitable cells.
+        :return:
+        """
+        self.map2.add_population((1, 8), self.test_both[0]['pop'][2:4])
+        self.map2.update_preferred_locations()
+        assert self.map2.cell_map[1][8].probability_herbivores == [1, 0, 0, 0]
+        assert self.map2.cell_map[1][8].probability_carnivores == [1, 0, 0, 0]
+
+    def test_migration_moves_simultaneously(self):
+        """
+        Will test that every creature moves at most once a year. On two
+        jungle cells next to each other, creatures that are sure to migrate
+        swap cells instead of moving on.
+        :return:
+        """
+        island = Map("OOOO\nOJJO\nOOOO", rng=np.random.default_rng(3))
+        island.add_population((1, 1), self.test[0]['pop'])
+        island.add_population((1, 2), self.test[0]['pop'][:2])
+        for cell in island.cell_map[1][1:3]:
+            for herbivore in cell.population_herbivores:
+                herbivore.mu = 1e6
+        island.migration()
+        assert island.cell_map[1][1].number_herbivores() == 2
+        assert island.cell_map[1][2].number_herbivores() == 6
+        for herbivore in island.cell_map[1][2].population_herbivores:
+            assert herbivore.have_migrated
+
+    def test_active_cells(self):
+        """
+        Will test that only cells with creatures are active, that migration
+        marks the destination cells, and that a cell is no longer active
+        when all its creatures have died.
+        :return:
+        """
+        n_cols = self.map2.n_cols
+        assert list(np.flatnonzero(self.map2.active)) == [10 * n_cols + 10]
+        for herbivore in self.map2.cell_map[10][10].population_herbivores:
+            herbivore.mu = 1e6
+        self.map2.migration()
+        assert not self.map2.active[10 * n_cols + 10]
+        assert self.map2.active.sum() > 0
+        for cell in self.map2.active_cells():
+            for herbivore in cell.population_herbivores:
+                herbivore.weight = 0
+            cell.alter_population()
+        assert not self.map2.active.any()
+        assert self.map2.get_populations() == (0, 0, 0)
+
+    def test_active_cells_columnar(self):
+        """
+        Will test that the columnar store marks the cells creatures migrate
+        into as active, and the cells they leave as no longer active.
+        :return:
+        """
+        island = Map(self.map_string, columnar=True,
+                     rng=np.random.default_rng(6))
+        island.add_population((10, 10), self.test[0]['pop'])
+        island.set_animal_parameters(HERBIVORE, {'mu': 1e6})
+        n_cols = island.n_cols
+        assert list(np.flatnonzero(island.active)) == [10 * n_cols + 10]
+        island.migration()
+        occupied = np.flatnonzero(island.population.counts.sum(axis=0))
+        assert not island.active[10 * n_cols + 10]
+        assert list(np.flatnonzero(island.active)) == list(occupied)
+
+    def test_population_counters(self):
+        """
+        Will test that the running totals and the count grid match a full
+        count of the creatures after births, deaths, predation and
+        migration.
+        :return:
+        """
+        for item in self.test_both:
+            i, j = item['loc']
+            self.map2.cell_map[i][j].add_pop(item['pop'])
+        for _ in range(5):
+            self.map2.yearly_cycle()
+        herbivores = np.array([[len(cell.population_herbivores)
+                                for cell in row]
+                               for row in self.map2.cell_map])
+        carnivores = np.array([[len(cell.population_carnivores)
+                                for cell in row]
+                               for row in self.map2.cell_map])
+        assert np.array_equal(self.map2.map_herbivores, herbivores)
+        assert np.array_equal(self.map2.map_carnivores, carnivores)
+        assert self.map2.get_populations() == (
+            herbivores.sum(), carnivores.sum(),
+            herbivores.sum() + carnivores.sum())
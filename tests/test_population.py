@@ -0,0 +1,163 @@
+__author__ = 'Hans Kristian Lunda, Mikko Rekstad'
+__email__ = 'hans.kristian.lunda@nmbu.no, mikkreks@nmbu.no'
+
+"""
+This file is used for testing of the columnar Population store.
+"""
+
+from biosim.fauna import Herbivore
+from biosim.map import Map
+from biosim.population import Population, HERBIVORE, CARNIVORE
+from biosim.simulation import BioSim
+import numpy as np
+import pytest
+
+
+class TestPopulation:
+    cell_pop = [{'species': 'herbivore', 'age': 10, 'weight': 15},
+                {'species': 'Herbivore', 'age': 5, 'weight': 40},
+                {'species': 'carnivore', 'age': 3, 'weight': 35}]
+
+    @pytest.fixture(autouse=True)
+    def test_population(self):
+        self.population = Population(3, 3)
+        self.population.add_pop(4, self.cell_pop)
+
+    def test_add_pop(self):
+        """
+        Will test that creatures are added as rows with correct columns.
+        :return:
+        """
+        assert len(self.population) == 3
+        assert list(self.population.species) == [HERBIVORE, HERBIVORE,
+                                                 CARNIVORE]
+        assert list(self.population.age) == [10, 5, 3]
+        assert list(self.population.cell) == [4, 4, 4]
+        assert not self.population.have_mated.any()
+
+    def test_counts(self):
+        """
+        Will test that creatures are counted per species on the island, in
+        a single cell and as a grid.
+        :return:
+        """
+        self.population.add(HERBIVORE, 1, 10.0, 0)
+        assert self.population.number_herbivores() == 3
+        assert self.population.number_herbivores(4) == 2
+        assert self.population.number_carnivores(0) == 0
+        grid = self.population.count_grid(HERBIVORE)
+        assert grid.shape == (3, 3)
+        assert grid[1, 1] == 2 and grid[0, 0] == 1
+
+    def test_counts_follow_changes(self):
+        """
+        Will test that the count grid and totals are updated when creatures
+        are removed and when they move.
+        :return:
+        """
+        self.population.keep(np.array([True, False, True]))
+        assert self.population.number_herbivores() == 1
+        self.population.move(np.array([0, 4]))
+        assert self.population.number_herbivores(0) == 1
+        assert self.population.number_herbivores(4) == 0
+        assert self.population.number_carnivores(4) == 1
+        assert self.population.counts.sum() == len(self.population)
+
+    def test_active_follows_changes(self):
+        """
+        Will test that active marks the cells holding creatures after
+        creatures are added, removed and move.
+        :return:
+        """
+        assert list(np.flatnonzero(self.population.active)) == [4]
+        self.population.add(HERBIVORE, 1, 10.0, 0)
+        assert list(np.flatnonzero(self.population.active)) == [0, 4]
+        self.population.keep(np.array([True, False, True, True]))
+        assert list(np.flatnonzero(self.population.active)) == [0, 4]
+        self.population.move(np.array([8, 8, 8]))
+        assert list(np.flatnonzero(self.population.active)) == [8]
+        self.population.keep(np.zeros(3, dtype=bool))
+        assert not self.population.active.any()
+
+    def test_fitness_matches_fauna(self):
+        """
+        Will test that the vectorized fitness equals the fitness of a
+        Herbivore object with the same age and weight.
+        :return:
+        """
+        fitness = self.population.fitness()
+        assert fitness[0] == pytest.approx(Herbivore(weight=15,
+                                                     age=10).fitness)
+        self.population.weight[1] = 0
+        self.population.mark_dirty(1)
+        assert self.population.fitness()[1] == 0
+
+    def test_feed_herbivores(self):
+        """
+        Will test that the fittest herbivore eats first and that the fodder
+        is reduced.
+        :return:
+        """
+        fodder = np.zeros(9)
+        fodder[4] = 15
+        self.population.feed_herbivores(fodder)
+        assert self.population.weight[1] == 40 + 0.9 * 10
+        assert self.population.weight[0] == 15 + 0.9 * 5
+        assert fodder[4] == 0
+
+    def test_ageing_weight_loss_and_death(self):
+        """
+        Will test that creatures get older, lose weight, and that creatures
+        with zero weight die.
+        :return:
+        """
+        self.population.add_age()
+        assert list(self.population.age) == [11, 6, 4]
+        self.population.lose_weight()
+        assert self.population.weight[0] == 15 - 15 * 0.05
+        self.population.weight[:] = 0
+        self.population.mark_dirty()
+        self.population.alter_population()
+        assert len(self.population) == 0
+
+    def test_migration_stays_on_land(self):
+        """
+        Will test that a creature on a single jungle cell never moves.
+        :return:
+        """
+        island = Map("OOO\nOJO\nOOO", columnar=True)
+        island.add_population((1, 1), [{'species': 'herbivore', 'age': 5,
+                                        'weight': 50}] * 20)
+        island.migration()
+        assert island.cell_map[1][1].number_herbivores() == 20
+
+    def test_columnar_simulation(self):
+        """
+        Will test that BioSim runs on the columnar store and reports the
+        same kind of results as the object model.
+        :return:
+        """
+        sim = BioSim(island_map="OOOO\nOJSO\nOOOO", seed=1, columnar=True,
+                     ini_pop=[{'loc': (1, 1), 'pop': self.cell_pop * 5}])
+        sim.map.yearly_cycle()
+        herbivores, carnivores, total = sim.map.get_populations()
+        assert total == herbivores + carnivores > 0
+        data = sim.animal_distribution
+        assert data.Herbivore.sum() == herbivores
+        assert data.Carnivore.sum() == carnivores
+
+    def test_same_seed_same_result(self):
+        """
+        Will test that two simulations with the same seed give the same
+        result, since all randomness comes from the simulation's generator.
+        :return:
+        """
+        results = []
+        for _ in range(2):
+            sim = BioSim(island_map="OOOO\nOJSO\nOOOO", seed=12, columnar=True,
+                         ini_pop=[{'loc': (1, 1), 'pop': self.cell_pop * 5}])
+            for _ in range(5):
+                sim.map.yearly_cycle()
+            results.append(sim.map.population.weight.copy())
+        assert len(results[0]) > 0
+        assert np.array_equal(results[0], results[1])
@@ -0,0 +1,79 @@
+__author__ = 'Hans Kristian Lunda, Mikko Rekstad'
+__email__ = 'hans.kristian.lunda@nmbu.no, mikkreks@nmbu.no'
+
+"""
+This file is used for testing of the FrameRenderer.
+"""
+
+from biosim.map import Map
+from biosim.rendering import FrameRenderer
+from biosim.simulation import BioSim
+from concurrent.futures import Future
+import matplotlib.pyplot as plt
+import numpy as np
+
+
+class TestFrameRenderer:
+
+    def test_frames_are_saved_in_order(self, tmp_path):
+        """
+        Will test that every snapshot becomes a numbered image of the same
+        size, and that no more than max_pending frames are in progress.
+        :return:
+        """
+        island = Map("OOOO\nOJSO\nOOOO")
+        base = str(tmp_path / 'frame')
+        with FrameRenderer(island, base, max_workers=2,
+                           max_pending=2) as renderer:
+            for year in range(1, 5):
+                grid = np.full((3, 4), year)
+                renderer.submit(year, 10 * year, year, grid, grid)
+                assert len(renderer._pending) < 2
+        images = [plt.imread('{}_{:05d}.png'.format(base, number))
+                  for number in range(4)]
+        assert all(image.shape == images[0].shape for image in images)
+        assert not np.array_equal(images[0], images[3])
+
+    def test_history_sent_is_bounded(self):
+        """
+        Will test that the history sent with a frame is decimated, so it
+        does not grow with the number of years.
+        :return:
+        """
+        sent = []
+
+        def submit(function, *args):
+            sent.append(args)
+            future = Future()
+            future.set_result(None)
+            return future
+
+        renderer = FrameRenderer(Map("OOOO\nOJSO\nOOOO"), 'frame',
+                                 img_fmt=None, max_workers=1,
+                                 history_bins=16)
+        renderer._executor.submit = submit
+        grid = np.zeros((3, 4))
+        for year in range(1, 101):
+            renderer.submit(year, year, 2 * year, grid, grid)
+        renderer.close()
+        years, history = sent[-1][2:4]
+        assert len(years) == len(history) <= 32
+        assert history[:, 1].max() == 200
+
+    def test_simulation_with_render_workers(self, tmp_path):
+        """
+        Will test that BioSim hands its frames to the renderer instead of
+        drawing them itself.
+        :return:
+        """
+        base = str(tmp_path / 'sim')
+        with BioSim(island_map="OOOO\nOJSO\nOOOO", seed=1,
+                    ini_pop=[{'loc': (1, 1),
+                              'pop': [{'species': 'Herbivore', 'age': 5,
+                                       'weight': 20}] * 10}],
+                    img_base=base, render_workers=1) as sim:
+            sim.simulate(4, vis_years=2)
+            assert sim.visualize is None
+        assert sim.renderer is None
+        assert sorted(path.name for path in tmp_path.iterdir()) == [
+            'sim_00000.png', 'sim_00001.png']
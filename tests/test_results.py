@@ -0,0 +1,149 @@
+__author__ = 'Hans Kristian Lunda, Mikko Rekstad'
+__email__ = 'hans.kristian.lunda@nmbu.no, mikkreks@nmbu.no'
+
+"""
+This file is used for testing of the result writers.
+"""
+
+from biosim.results import (ResultWriter, CSVWriter, NpzWriter, make_writer,
+                            load_grids)
+from biosim.simulation import BioSim
+import glob
+import numpy as np
+import pandas as pd
+import pytest
+
+
+class TestResults:
+    ini_pop = [{'loc': (1, 1),
+                'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}]
+                * 10}]
+
+    def test_csv_writer_buffers(self, tmp_path):
+        """
+        Will test that the CSV file is only written every flush_years
+        years, and holds one row per year.
+        :return:
+        """
+        path = tmp_path / 'results.csv'
+        writer = CSVWriter(path, flush_years=3)
+        for year in range(1, 6):
+            writer.record(year, 10 * year, year)
+        assert len(pd.read_csv(path)) == 3
+        writer.flush()
+        data = pd.read_csv(path)
+        assert list(data.columns) == ['Year', 'Herbivore', 'Carnivore',
+                                      'Total']
+        assert list(data.Year) == [1, 2, 3, 4, 5]
+        assert list(data.Total) == [11 * year for year in range(1, 6)]
+
+    def test_npz_writer_chunks(self, tmp_path):
+        """
+        Will test that the npz writer writes one file per chunk of years.
+        :return:
+        """
+        writer = NpzWriter(tmp_path / 'results.npz', flush_years=2)
+        for year in range(1, 6):
+            writer.record(year, year, 0)
+        writer.flush()
+        chunks = sorted(glob.glob(str(tmp_path / 'results_*.npz')))
+        assert len(chunks) == 3
+        with np.load(chunks[-1]) as data:
+            assert list(data['years']) == [5]
+
+    def test_simulation_flushes_on_close(self, tmp_path):
+        """
+        Will test that simulating one year at a time without flushing does
+        not write every year, and that closing the simulation writes the
+        rest.
+        :return:
+        """
+        path = tmp_path / 'results.csv'
+        with BioSim(island_map="OOOO\nOJSO\nOOOO", ini_pop=self.ini_pop,
+                    seed=1, headless=True,
+                    result_writer=CSVWriter(path, flush_years=3)) as sim:
+            for _ in range(4):
+                sim.simulate(1, flush=False)
+            assert list(pd.read_csv(path).Year) == [1, 2, 3]
+        assert list(pd.read_csv(path).Year) == [1, 2, 3, 4]
+
+    def test_simulate_flushes(self, tmp_path, monkeypatch):
+        """
+        Will test that the CSV file of save_csv is on disk after simulate,
+        without closing the simulation.
+        :return:
+        """
+        monkeypatch.chdir(tmp_path)
+        sim = BioSim(island_map="OOOO\nOJSO\nOOOO", ini_pop=self.ini_pop,
+                     seed=1, headless=True, save_csv=True)
+        sim.simulate(5)
+        assert list(pd.read_csv('biosim_results.csv').Year) == [
+            1, 2, 3, 4, 5]
+
+    def test_resumed_writer_adds_chunks(self, tmp_path):
+        """
+        Will test that a new writer on the same path numbers its chunks
+        after those already written, instead of overwriting them.
+        :return:
+        """
+        path = tmp_path / 'results.npz'
+        grid = np.zeros((2, 2))
+        for first, last in [(1, 4), (4, 6)]:
+            with NpzWriter(path, flush_years=2, grids=True) as writer:
+                for year in range(first, last):
+                    writer.record(year, year, 0, grid, grid)
+        chunks = sorted(glob.glob(str(tmp_path / 'results_0*.npz')))
+        assert len(chunks) == 3
+        years, herbivores, carnivores = load_grids(path)
+        assert list(years) == [1, 2, 3, 4, 5]
+
+    def test_make_writer(self, tmp_path):
+        """
+        Will test that the format is chosen from the suffix.
+        :return:
+        """
+        assert isinstance(make_writer(tmp_path / 'a.csv'), CSVWriter)
+        assert isinstance(make_writer(tmp_path / 'a.npz'), NpzWriter)
+        with pytest.raises(ValueError):
+            make_writer(tmp_path / 'a.txt')
+
+    def test_result_writer_is_abstract(self, tmp_path):
+        """
+        Will test that the base class can not be used without a format.
+        :return:
+        """
+        with pytest.raises(TypeError):
+            ResultWriter(tmp_path / 'results.csv')
+
+    def test_simulation_grids(self, tmp_path):
+        """
+        Will test that a simulation writes its totals and count grids, and
+        that the grids add up to the totals.
+        :return:
+        """
+        path = tmp_path / 'results.csv'
+        sim = BioSim(island_map="OOOO\nOJSO\nOOOO", ini_pop=self.ini_pop,
+                     seed=1, headless=True,
+                     result_writer=CSVWriter(path, flush_years=2,
+                                             grids=True))
+        sim.simulate(5)
+        sim.close()
+        totals = pd.read_csv(path)
+        years, herbivores, carnivores = load_grids(path)
+        assert list(years) == list(totals.Year) == [1, 2, 3, 4, 5]
+        assert herbivores.shape == (5, 3, 4)
+        assert list(herbivores.sum(axis=(1, 2))) == list(totals.Herbivore)
+        assert carnivores.sum() == 0
+
+    def test_parquet_writer(self, tmp_path):
+        """
+        Will test that totals can be written as Parquet, if pyarrow is
+        installed.
+        :return:
+        """
+        pytest.importorskip('pyarrow')
+        writer = make_writer(tmp_path / 'results.parquet')
+        writer.record(1, 5, 2)
+        writer.flush()
+        data = pd.read_parquet(tmp_path / 'results_00000.parquet')
+        assert list(data.Herbivore) == [5]
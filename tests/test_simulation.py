@@ -0,0 +1,188 @@
+__author__ = 'Hans Kristian Lunda, Mikko Rekstad'
+__email__ = 'hans.kristian.lunda@nmbu.no, mikkreks@nmbu.no'
+
+"""
+This file is used for testing of the BioSim class, beyond the interface
+tests in test_biosim_interface.py.
+"""
+
+from biosim.fauna import Herbivore
+from biosim.simulation import BioSim
+import numpy as np
+import pickle
+import subprocess
+import sys
+import pytest
+
+
+class TestBioSim:
+    ini_pop = [{'loc': (1, 2),
+                'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}]
+                * 10}]
+
+    @pytest.fixture(autouse=True)
+    def sim(self):
+        self.sim = BioSim(island_map="OOOO\nOJSO\nOOOO", ini_pop=[], seed=1,
+                          headless=True)
+
+    def test_animal_distribution_arrays(self):
+        """
+        Will test that the distribution is available as arrays, and is built
+        on access so it follows the population.
+        :return:
+        """
+        data = self.sim.animal_distribution_arrays()
+        assert set(data) == {'Row', 'Col', 'Herbivore', 'Carnivore'}
+        assert list(data['Row']) == [0] * 4 + [1] * 4 + [2] * 4
+        assert list(data['Col']) == [0, 1, 2, 3] * 3
+        assert data['Herbivore'].sum() == 0
+        self.sim.add_population(self.ini_pop)
+        assert self.sim.animal_distribution_arrays()['Herbivore'][6] == 10
+        assert self.sim.animal_distribution.Herbivore.sum() == 10
+
+    def test_headless_progress(self):
+        """
+        Will test that a headless simulation makes no figure and reports
+        its progress to the progress function at the given interval.
+        :return:
+        """
+        reports = []
+        sim = BioSim(island_map="OOOO\nOJSO\nOOOO", ini_pop=self.ini_pop,
+                     seed=1, headless=True,
+                     progress=lambda *report: reports.append(report),
+                     progress_years=2)
+        sim.simulate(5)
+        assert sim.visualize is None
+        assert [year for year, _, _ in reports] == [2, 4]
+        with pytest.raises(RuntimeError):
+            sim.make_movie()
+
+    def test_headless_does_not_import_matplotlib(self):
+        """
+        Will test, in a fresh interpreter, that a headless simulation never
+        imports matplotlib.
+        :return:
+        """
+        code = ("import sys\n"
+                "from biosim.simulation import BioSim\n"
+                "sim = BioSim(island_map='OOO\\nOJO\\nOOO', ini_pop=[], "
+                "seed=1, headless=True)\n"
+                "sim.simulate(2)\n"
+                "assert 'matplotlib' not in sys.modules\n")
+        subprocess.run([sys.executable, '-c', code], check=True)
+
+    def test_parameters_belong_to_the_simulation(self):
+        """
+        Will test that animal parameters set in one simulation do not
+        change another simulation, or the species classes themselves.
+        :return:
+        """
+        other = BioSim(island_map="OOOO\nOJSO\nOOOO", ini_pop=[], seed=1,
+                       headless=True)
+        self.sim.set_animal_parameters('Herbivore', {'F': 20.0})
+        assert self.sim.map.animal_classes[0].F == 20.0
+        assert other.map.animal_classes[0].F == 10.0
+        assert Herbivore.F == 10.0
+        self.sim.add_population(self.ini_pop)
+        creature = self.sim.map.cell_map[1][2].population_herbivores[0]
+        assert isinstance(creature, Herbivore) and creature.F == 20.0
+
+    @pytest.mark.parametrize('columnar', [False, True])
+    def test_pickle_own_parameters(self, columnar):
+        """
+        Will test that a simulation with its own animal parameters can be
+        pickled, as when it is sent to a worker process, and that the
+        copy keeps the parameters and continues as the original.
+        :return:
+        """
+        sim = BioSim(island_map="OOOO\nOJSO\nOOOO", ini_pop=self.ini_pop,
+                     seed=2, headless=True, columnar=columnar)
+        sim.set_animal_parameters('Herbivore', {'F': 20.0})
+        copy = pickle.loads(pickle.dumps(sim))
+        herbivore = copy.map.animal_classes[0]
+        assert herbivore.F == 20.0 and issubclass(herbivore, Herbivore)
+        assert Herbivore.F == 10.0
+        if not columnar:
+            for creature in copy.map.cell_map[1][2].population_herbivores:
+                assert type(creature) is herbivore
+        sim.simulate(3)
+        copy.simulate(3)
+        assert copy.num_animals_per_species == sim.num_animals_per_species
+
+    @pytest.mark.parametrize('columnar', [False, True])
+    def test_checkpoint(self, tmp_path, columnar):
+        """
+        Will test that a simulation restored from a checkpoint continues
+        exactly as the saved simulation.
+        :return:
+        """
+        ini_pop = self.ini_pop + [{'loc': (1, 1), 'pop': [
+            {'species': 'Carnivore', 'age': 5, 'weight': 20}] * 3}]
+        sim = BioSim(island_map="OOOO\nOJSO\nOOOO", ini_pop=ini_pop, seed=3,
+                     headless=True, columnar=columnar)
+        sim.set_animal_parameters('Carnivore', {'F': 30.0})
+        sim.simulate(3)
+        path = tmp_path / 'checkpoint.npz'
+        sim.save_checkpoint(path)
+        sim.simulate(3)
+
+        restored = BioSim.load_checkpoint(path, headless=True)
+        assert restored.year == 3
+        assert restored.map.animal_classes[1].F == 30.0
+        restored.simulate(3)
+        assert restored.year == sim.year
+        original = sim.map.get_animal_arrays()
+        for name, values in restored.map.get_animal_arrays().items():
+            assert np.array_equal(values, original[name])
+        assert np.array_equal(restored.map.fodder, sim.map.fodder)
+
+    def test_checkpoint_other_store(self, tmp_path):
+        """
+        Will test that a checkpoint can be restored into the other kind of
+        store, when columnar is passed to load_checkpoint.
+        :return:
+        """
+        sim = BioSim(island_map="OOOO\nOJSO\nOOOO", ini_pop=self.ini_pop,
+                     seed=3, headless=True)
+        sim.simulate(2)
+        path = tmp_path / 'checkpoint.npz'
+        sim.save_checkpoint(path)
+
+        restored = BioSim.load_checkpoint(path, headless=True, columnar=True)
+        assert restored.map.population is not None
+        assert restored.num_animals_per_species == sim.num_animals_per_species
+
+    def test_checkpoint_landscape_parameters(self, tmp_path):
+        """
+        Will test that changed landscape parameters are restored in the
+        grids and in the cells.
+        :return:
+        """
+        sim = BioSim(island_map="OOOO\nOJSO\nOOOO", ini_pop=[], seed=3,
+                     headless=True)
+        sim.set_landscape_parameters('J', {'f_max': 500.0})
+        sim.set_landscape_parameters('S', {'f_max': 200.0, 'alpha': 0.5})
+        path = tmp_path / 'checkpoint.npz'
+        sim.save_checkpoint(path)
+
+        restored = BioSim.load_checkpoint(path, headless=True)
+        assert np.array_equal(restored.map.f_max, sim.map.f_max)
+        assert np.array_equal(restored.map.alpha, sim.map.alpha)
+        assert restored.map.cell_map[1][1].f_max == 500.0
+        assert restored.map.cell_map[1][2].f_max == 200.0
+        original = sim.map.get_animal_arrays()
+        for name, values in restored.map.get_animal_arrays().items():
+            assert np.array_equal(values, original[name])
+
+    def test_use_numba_option(self):
+        """
+        Will test that the compiled kernels can be turned off, and that
+        asking for them without the columnar store is refused.
+        :return:
+        """
+        sim = BioSim(island_map="OOOO\nOJSO\nOOOO", ini_pop=self.ini_pop,
+                     seed=1, headless=True, columnar=True, use_numba=False)
+        assert not sim.map.population.use_numba
+        with pytest.raises(ValueError):
+            BioSim(island_map="OOOO\nOJSO\nOOOO", ini_pop=[], seed=1,
+                   headless=True, use_numba=True)
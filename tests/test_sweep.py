@@ -0,0 +1,90 @@
+__author__ = 'Hans Kristian Lunda, Mikko Rekstad'
+__email__ = 'hans.kristian.lunda@nmbu.no, mikkreks@nmbu.no'
+
+"""
+This file is used for testing of the parameter sweeps.
+"""
+
+from biosim.sweep import (Sweep, grid_samples, latin_hypercube_samples,
+                          split_sample)
+import numpy as np
+import pandas as pd
+
+
+class TestSweep:
+    island_map = "OOOOO\nOJJSO\nOJJJO\nOOOOO"
+    ini_pop = [{'loc': (1, 1),
+                'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}]
+                * 20}]
+
+    def test_grid_samples(self):
+        """
+        Will test that the grid holds every combination of values.
+        :return:
+        """
+        samples = grid_samples({'Herbivore.F': [5, 10],
+                                'J.f_max': [400, 800, 1200]})
+        assert len(samples) == 6
+        assert {'Herbivore.F': 10, 'J.f_max': 400} in samples
+
+    def test_latin_hypercube_samples(self):
+        """
+        Will test that every stratum of every parameter is used once.
+        :return:
+        """
+        samples = latin_hypercube_samples({'Herbivore.F': (0, 10),
+                                           'Carnivore.F': (20, 60)}, 5,
+                                          seed=1)
+        herbivore_strata = sorted(int(sample['Herbivore.F'] // 2)
+                                  for sample in samples)
+        carnivore_strata = sorted(int((sample['Carnivore.F'] - 20) // 8)
+                                  for sample in samples)
+        assert herbivore_strata == carnivore_strata == [0, 1, 2, 3, 4]
+
+    def test_split_sample(self):
+        """
+        Will test that a sample is split into animal and landscape
+        parameters.
+        :return:
+        """
+        animals, landscapes = split_sample({'Herbivore.F': 5, 'S.alpha': 0.1,
+                                            'Herbivore.mu': 0.5})
+        assert animals == {'Herbivore': {'F': 5, 'mu': 0.5}}
+        assert landscapes == {'S': {'alpha': 0.1}}
+
+    def test_run(self, tmp_path):
+        """
+        Will test that the sweep gathers a tidy table, that the parameters
+        make a difference, and that the streamed CSV file holds the same
+        rows.
+        :return:
+        """
+        path = tmp_path / 'sweep.csv'
+        sweep = Sweep(self.island_map, self.ini_pop,
+                      grid_samples({'J.f_max': [0, 800]}), seed=1,
+                      n_replicates=2)
+        table = sweep.run(5, max_workers=2, path=path)
+        assert list(table.columns) == ['sample', 'replicate', 'J.f_max',
+                                       'year', 'Herbivore', 'Carnivore']
+        assert len(table) == 2 * 2 * 5
+        final = table[table.year == 5].groupby('J.f_max').Herbivore.mean()
+        assert final[0] < final[800]
+        streamed = pd.read_csv(path).sort_values(
+            ['sample', 'replicate', 'year']).reset_index(drop=True)
+        assert np.array_equal(streamed.values, table.values)
+
+    def test_run_appends_to_file(self, tmp_path):
+        """
+        Will test that a sweep appended to an existing CSV file does not
+        write its header again.
+        :return:
+        """
+        path = tmp_path / 'sweep.csv'
+        sweep = Sweep(self.island_map, self.ini_pop,
+                      grid_samples({'J.f_max': [800]}), seed=1)
+        first = sweep.run(3, max_workers=1, path=path)
+        second = sweep.run(3, max_workers=1, path=path)
+        streamed = pd.read_csv(path)
+        assert list(streamed.columns) == list(first.columns)
+        assert len(streamed) == len(first) + len(second)
+        assert (streamed.year != 'year').all()
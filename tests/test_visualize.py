@@ -0,0 +1,140 @@
+__author__ = 'Hans Kristian Lunda, Mikko Rekstad'
+__email__ = 'hans.kristian.lunda@nmbu.no, mikkreks@nmbu.no'
+
+"""
+This file is used for testing of the Visualize class.
+"""
+
+import matplotlib
+matplotlib.use('Agg')
+
+from biosim.map import Map
+from biosim.simulation import BioSim
+from biosim.visualize import Visualize, find_ffmpeg
+import matplotlib.pyplot as plt
+import numpy as np
+import pytest
+import sys
+
+
+class TestVisualize:
+
+    @pytest.fixture(autouse=True)
+    def visualize(self):
+        self.map = Map("OOOO\nOJSO\nOOOO")
+        self.map.add_population((1, 1), [{'species': 'Herbivore', 'age': 5,
+                                          'weight': 20}] * 4)
+        self.visualize = Visualize(self.map, years=10)
+        yield
+        plt.close(self.visualize._fig)
+
+    def test_history(self):
+        """
+        Will test that every update adds one point to the lines of the
+        stats graph.
+        :return:
+        """
+        self.visualize.update_graphics(self.map, 1)
+        self.visualize.update_graphics(self.map, 3)
+        years, herbivores = self.visualize._herbivore_line.get_data()
+        assert list(years) == [1, 3]
+        assert list(herbivores) == [4, 4]
+        assert list(self.visualize._total_line.get_ydata()) == [4, 4]
+
+    def test_history_past_years(self):
+        """
+        Will test that updates past the given number of years make the
+        x-axis longer instead of failing.
+        :return:
+        """
+        for year in range(1, 26):
+            self.visualize.update_graphics(self.map, year)
+        assert len(self.visualize._herbivore_line.get_xdata()) == 25
+        assert self.visualize._stats_ax.get_xlim()[1] > 25
+
+    def test_blitted_update(self):
+        """
+        Will test that an update is blitted onto the kept background, and
+        that the heatmap shows the new counts.
+        :return:
+        """
+        assert self.visualize._blit
+        assert self.visualize._background is not None
+        self.visualize.update_graphics(self.map, 1)
+        assert np.array_equal(self.visualize.im_herbivore.get_array(),
+                              self.map.map_herbivores)
+
+    def test_find_ffmpeg_missing(self, monkeypatch):
+        """
+        Will test that a missing ffmpeg gives a RuntimeError instead of a
+        hard-coded path.
+        :return:
+        """
+        monkeypatch.delenv('BIOSIM_FFMPEG', raising=False)
+        monkeypatch.setenv('PATH', '')
+        with pytest.raises(RuntimeError):
+            find_ffmpeg()
+
+    def test_streamed_movie(self, tmp_path):
+        """
+        Will test that saved frames are piped as raw RGBA to one ffmpeg
+        process, and that no images are written when img_fmt is None. A
+        script that copies its input to the output file stands in for
+        ffmpeg.
+        :return:
+        """
+        binary = tmp_path / 'ffmpeg'
+        binary.write_text('#!{}\nimport shutil, sys\n'
+                          'with open(sys.argv[-1], "wb") as movie:\n'
+                          '    shutil.copyfileobj(sys.stdin.buffer, movie)\n'
+                          .format(sys.executable))
+        binary.chmod(0o755)
+        base = str(tmp_path / 'sim')
+        visualize = Visualize(self.map, years=10, img_dir=base,
+                              img_fmt=None, movie_fmt='mp4',
+                              ffmpeg_binary=str(binary))
+        for year in range(3):
+            visualize.update_graphics(self.map, year)
+            visualize.save_graphics()
+        visualize.make_movie()
+        plt.close(visualize._fig)
+        width, height = visualize._fig.canvas.get_width_height()
+        assert (tmp_path / 'sim.mp4').stat().st_size == 3 * width * height * 4
+        assert not list(tmp_path.glob('*.png'))
+
+    def test_unfinished_movie_is_stopped(self, tmp_path):
+        """
+        Will test that closing a simulation whose streamed movie was never
+        finished stops the ffmpeg process. A script that reads its input
+        until it is stopped stands in for ffmpeg.
+        :return:
+        """
+        binary = tmp_path / 'ffmpeg'
+        binary.write_text('#!/bin/sh\ncat > /dev/null\n')
+        binary.chmod(0o755)
+        with BioSim(island_map="OOOO\nOJSO\nOOOO", ini_pop=[], seed=1,
+                    img_base=str(tmp_path / 'sim'), img_fmt=None,
+                    movie_fmt='mp4', ffmpeg_binary=str(binary)) as sim:
+            sim.simulate(2, vis_years=1)
+            process = sim.visualize._movie_writer._process
+            assert process.poll() is None
+        plt.close(sim.visualize._fig)
+        assert process.poll() is not None
+        assert sim.visualize._movie_writer is None
+
+    def test_embedded_figure(self):
+        """
+        Will test that Visualize can draw in a figure that is not managed
+        by pyplot, as done when it is embedded in the GUI.
+        :return:
+        """
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+        figure = Figure()
+        FigureCanvasAgg(figure)
+        visualize = Visualize(self.map, years=10, fig=figure)
+        visualize.draw_snapshot(np.array([1]), np.array([[4, 0, 4]]),
+                                self.map.map_herbivores,
+                                self.map.map_carnivores)
+        assert visualize._fig is figure
+        assert list(visualize._total_line.get_ydata()) == [4]
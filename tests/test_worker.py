@@ -0,0 +1,72 @@
+__author__ = 'Hans Kristian Lunda, Mikko Rekstad'
+__email__ = 'hans.kristian.lunda@nmbu.no, mikkreks@nmbu.no'
+
+"""
+This file is used for testing of the SimulationWorker.
+"""
+
+from biosim.simulation import BioSim
+from biosim.worker import SimulationWorker
+import pytest
+import time
+
+
+class TestSimulationWorker:
+    ini_pop = [{'loc': (1, 1),
+                'pop': [{'species': 'Herbivore', 'age': 5,
+                         'weight': 20}] * 10}]
+
+    @pytest.fixture(autouse=True)
+    def worker(self):
+        self.sim = BioSim(island_map="OOOO\nOJSO\nOOOO", ini_pop=self.ini_pop,
+                          seed=1, headless=True)
+        self.worker = SimulationWorker(self.sim, min_interval=0)
+        yield
+        self.worker.stop(timeout=5)
+
+    def test_step(self):
+        """
+        Will test that a paused worker simulates exactly the stepped years
+        and posts the last of them.
+        :return:
+        """
+        self.worker.step(3)
+        snapshot = self.worker.snapshots.get(timeout=5)
+        while snapshot.year < 3:
+            snapshot = self.worker.snapshots.get(timeout=5)
+        time.sleep(0.1)
+        assert self.sim.year == 3
+        assert list(snapshot.years) == [1, 2, 3]
+        assert snapshot.herbivores.sum() == snapshot.history[-1, 0]
+
+    def test_pause_and_resume(self):
+        """
+        Will test that the worker simulates on its own thread until paused,
+        and that old snapshots are dropped when they are not taken.
+        :return:
+        """
+        self.worker.start()
+        time.sleep(0.3)
+        self.worker.pause()
+        time.sleep(0.1)
+        year = self.sim.year
+        assert year > 2
+        assert self.worker.skipped > 0
+        time.sleep(0.1)
+        assert self.sim.year == year
+        assert self.worker.snapshots.get(timeout=5).year == year
+
+    def test_call_runs_between_years(self):
+        """
+        Will test that a command is run on the worker thread and that its
+        errors come back in the future.
+        :return:
+        """
+        future = self.worker.call(self.sim.set_animal_parameters,
+                                  'Herbivore', {'F': 20})
+        assert future.result(timeout=5) is None
+        assert self.sim.map.animal_classes[0].F == 20
+        bad = self.worker.call(self.sim.set_animal_parameters, 'Herbivore',
+                               {'no_such_parameter': 1})
+        with pytest.raises(ValueError):
+            bad.result(timeout=5)